@@ -1,3 +1,5 @@
+from importlib import import_module
+
 from flask import Flask, render_template
 from flask_bootstrap import Bootstrap
 from flask_mail import Mail
@@ -7,12 +9,41 @@ from flask_login import LoginManager
 from flask_pagedown import PageDown
 
 from config import config
+from .follow_index import FollowIndex
+from .compress import Compress
+from .assets import Assets
+from .templating import init_bytecode_cache
+from .cache import LRUCache
+from .local_store import LocalStore
+from .counters import ViewCounter
+from .trending import TrendingTracker
+from .jobs import JobQueue
+from .invalidation import InvalidationBus
 
 bootstrap = Bootstrap()
 mail = Mail()
 moment = Moment()
 db = SQLAlchemy()
 pagedown = PageDown()
+follow_index = FollowIndex()
+compress = Compress()
+assets = Assets()
+# 资料页统计数字的缓存 键为用户id
+profile_cache = LRUCache('FLASKY_PROFILE_CACHE', maxsize=10000, ttl=60)
+# 订阅的缓存 键见feeds.feed_key
+feed_cache = LRUCache('FLASKY_FEED_CACHE', maxsize=1000, ttl=300)
+# markdown渲染结果的缓存 键为内容散列(见rendering.content_key) 不会过期
+render_cache = LRUCache('FLASKY_RENDER_CACHE', maxsize=10000)
+local_store = LocalStore()
+view_counter = ViewCounter(local_store)
+trending = TrendingTracker(local_store)
+# 后台任务队列 任务定义在tasks模块中
+jobs = JobQueue(local_store)
+# 进程内缓存的跨进程失效通知 各缓存在这里登记 名字用于模型事件中调用invalidation.invalidate()
+invalidation = InvalidationBus(local_store)
+invalidation.register('profile', profile_cache.delete, profile_cache.clear)
+invalidation.register('feed', feed_cache.delete, feed_cache.clear)
+invalidation.register('follow', follow_index.refresh, follow_index.clear)
 
 
 login_manager = LoginManager()
@@ -22,7 +53,19 @@ login_manager.session_protection = 'strong'
 # 设置登录页面的端点 要加上蓝本的名字
 login_manager.login_view = 'auth.login'
 
-def create_app(config_name):
+# 可注册的蓝本 (模块, 蓝本名, url前缀) 模块在注册时才导入
+BLUEPRINTS = [
+    ('main', 'main', None),
+    # 认证蓝本 url_prefix是可选参数 加上之后 所有路由都会加上这个指定前缀
+    # 比如 /login路由会被注册成 /auth/login
+    ('auth', 'auth', '/auth'),
+    ('api_1_0', 'api', '/api/v1.0'),
+]
+
+
+# blueprints为要注册的蓝本名(main auth api) 默认使用配置FLASKY_BLUEPRINTS 为None时注册全部蓝本
+# 命令行工具(例如数据库迁移)不处理请求 可以传入空列表 省去导入视图和表单的时间
+def create_app(config_name, blueprints=None):
     app = Flask(__name__)
     app.config.from_object(config[config_name])
     config[config_name].init_app(app)
@@ -33,22 +76,29 @@ def create_app(config_name):
     db.init_app(app)
     login_manager.init_app(app)
     pagedown.init_app(app)
+    follow_index.init_app(app)
+    compress.init_app(app)
+    assets.init_app(app)
+    profile_cache.init_app(app)
+    feed_cache.init_app(app)
+    render_cache.init_app(app)
+    local_store.init_app(app)
+    view_counter.init_app(app)
+    trending.init_app(app)
+    jobs.init_app(app)
+    invalidation.init_app(app)
+    init_bytecode_cache(app)
 
     # 这里一创建数据库就会报错
     #db.create_all()
 
     # 附加路由和自定义的错误页面
-    from .main import main as main_blueprint
-    app.register_blueprint(main_blueprint)
-
-    # 认证蓝本 url_prefix是可选参数 加上之后 所有路由都会加上这个指定前缀
-    # 比如 /login路由会被注册成 /auth/login
-    from .auth import auth as auth_blueprint
-    app.register_blueprint(auth_blueprint, url_prefix='/auth')
-
-    from .api_1_0 import api as api_1_0_blueprint
-    app.register_blueprint(api_1_0_blueprint, url_prefix='/api/v1.0')
+    if blueprints is None:
+        blueprints = app.config['FLASKY_BLUEPRINTS']
+    for module, name, url_prefix in BLUEPRINTS:
+        if blueprints is not None and name not in blueprints:
+            continue
+        blueprint = getattr(import_module('.' + module, __name__), name)
+        app.register_blueprint(blueprint, url_prefix=url_prefix)
 
     return app
-
-
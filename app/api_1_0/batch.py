@@ -0,0 +1,105 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, request, jsonify, g
+from werkzeug.test import EnvironBuilder
+
+from ..exceptions import ValidationError
+from ..models import User, AnonymousUser
+from . import api
+
+
+# 批量请求 一次HTTP请求中执行多个API调用 认证只在批量请求本身进行一次
+# 请求体示例:
+# {"requests": [{"method": "GET", "path": "/api/v1.0/posts/1"},
+#               {"method": "GET", "path": "/api/v1.0/posts/1/comments"}],
+#  "parallel": true}
+# 子请求在当前程序上下文中直接分派给视图函数 不再经过before_request
+# parallel为true时 相邻的GET子请求在线程池中并发执行 其它方法的子请求按顺序单独执行
+@api.route('/batch', methods=['POST'])
+def batch():
+    json_batch = request.json or {}
+    subrequests = json_batch.get('requests')
+    if not isinstance(subrequests, list) or not subrequests:
+        raise ValidationError('batch does not have any requests')
+    if len(subrequests) > current_app.config['FLASKY_BATCH_MAX_REQUESTS']:
+        raise ValidationError('too many requests in batch')
+    environs = [_build_environ(sub) for sub in subrequests]
+
+    app = current_app._get_current_object()
+    responses = []
+    if json_batch.get('parallel'):
+        with ThreadPoolExecutor(max_workers=current_app.config['FLASKY_BATCH_WORKERS']) as executor:
+            group = []
+            for environ in environs:
+                if environ['REQUEST_METHOD'] == 'GET':
+                    group.append(environ)
+                    continue
+                responses.extend(_dispatch_group(executor, app, group))
+                group = []
+                responses.append(_dispatch(app, environ))
+            responses.extend(_dispatch_group(executor, app, group))
+    else:
+        responses = [_dispatch(app, environ) for environ in environs]
+    return jsonify({'responses': responses})
+
+
+def _build_environ(sub):
+    if not isinstance(sub, dict):
+        raise ValidationError('request must be a json object')
+    path = sub.get('path')
+    if not isinstance(path, str) or not path.startswith('/'):
+        raise ValidationError('request does not have a valid path')
+    method = str(sub.get('method') or 'GET').upper()
+    body = sub.get('body')
+    builder = EnvironBuilder(path=path, method=method, base_url=request.host_url,
+            headers={'Accept': 'application/json'},
+            data=json.dumps(body) if body is not None else None,
+            content_type='application/json' if body is not None else None)
+    try:
+        return builder.get_environ()
+    finally:
+        builder.close()
+
+
+# 在新的请求上下文中执行一个子请求
+# 请求上下文会复用当前的程序上下文 所以g.current_user等认证结果仍然有效
+def _dispatch(app, environ):
+    with app.request_context(environ):
+        if request.url_rule is not None and \
+                (request.blueprint != 'api' or request.endpoint == 'api.batch'):
+            return {'status': 400, 'body': {'error': 'bad request',
+                    'message': 'only api requests can be batched'}}
+        try:
+            rv = app.dispatch_request()
+        except Exception as e:
+            rv = app.handle_user_exception(e)
+        response = app.make_response(rv)
+        result = {'status': response.status_code}
+        if 'Location' in response.headers:
+            result['headers'] = {'Location': response.headers['Location']}
+        data = response.get_data(as_text=True)
+        if response.mimetype == 'application/json':
+            result['body'] = json.loads(data) if data else None
+        else:
+            result['body'] = data
+        return result
+
+
+# 新线程没有程序上下文 也就没有g 要把认证结果带过去
+# 每个线程使用自己的数据库会话 不能共用主线程中的用户对象(延迟加载角色等会使用主线程的会话)
+# 所以只传用户id 在本线程的会话中重新加载 程序上下文结束时会话随之关闭
+def _dispatch_in_thread(app, environ, user_id, token_used):
+    with app.app_context():
+        g.current_user = User.query.get(user_id) if user_id is not None else AnonymousUser()
+        g.token_used = token_used
+        return _dispatch(app, environ)
+
+
+def _dispatch_group(executor, app, environs):
+    if len(environs) <= 1:
+        return [_dispatch(app, environ) for environ in environs]
+    user_id = None if g.current_user.is_anonymous else g.current_user.id
+    token_used = getattr(g, 'token_used', False)
+    return list(executor.map(
+        lambda environ: _dispatch_in_thread(app, environ, user_id, token_used), environs))
@@ -1,50 +1,79 @@
 from flask import request, current_app, url_for, jsonify, g
 
 from . import api
-from ..models import Comment, Post, Permission
+from ..models import Comment, ArchivedComment, Post, Permission
 from .. import db
+from ..archive import get_comment_or_404, get_post_or_404
+from ..exceptions import ValidationError
 from .decorators import permission_required
+from .fields import comments_to_json
 
 
 @api.route('/comments/')
 def get_comments():
-    page = request.args_get('page', 1, type=int)
-    pagination = Comment.query.order_by(Comments.timestamp.desc()).paginate(
+    page = request.args.get('page', 1, type=int)
+    pagination = Comment.query.order_by(Comment.timestamp.desc()).paginate(
             page, per_page=current_app.config['FLASKY_COMMENTS_PER_PAGE'], error_out=False)
     comments = pagination.items
     prevPage = None
     if pagination.has_prev:
-        pervPage = url_for('api.get_comments', page=page-1, _external=True)
+        prevPage = url_for('api.get_comments', page=page-1, _external=True)
     nextPage = None
     if pagination.has_next:
         nextPage = url_for('api.get_comments', page=page+1, _external=False)
-    return jsonify({'comments': [comment.to_json() for comment in comments],
+    return jsonify({'comments': comments_to_json(comments),
                     'prev': prevPage,
                     'next': nextPage,
                     'count': pagination.total})
  
+# 批量审核评论 请求体示例:
+# {"disabled": true, "ids": [1, 2, 3]}  或  {"disabled": true, "author": 5, "body_contains": "spam"}
+# 所有匹配的评论用一条UPDATE语句修改 返回实际改变的评论数
+@api.route('/comments/', methods=['PATCH'])
+@permission_required(Permission.MODERATE_COMMENTS)
+def moderate_comments():
+    json_moderate = request.json or {}
+    disabled = json_moderate.get('disabled')
+    if not isinstance(disabled, bool):
+        raise ValidationError('disabled must be true or false')
+    ids = json_moderate.get('ids')
+    # bool是int的子类 true不能当作id 1
+    if ids is not None and not (isinstance(ids, list) and all(
+            isinstance(i, int) and not isinstance(i, bool) for i in ids)):
+        raise ValidationError('ids must be a list of comment ids')
+    author = json_moderate.get('author')
+    if author is not None and not (isinstance(author, int) and not isinstance(author, bool)):
+        raise ValidationError('author must be a user id')
+    body_contains = json_moderate.get('body_contains')
+    if body_contains is not None and not (isinstance(body_contains, str) and body_contains):
+        raise ValidationError('body_contains must be a non-empty string')
+    count = Comment.moderate(disabled, ids=ids, author_id=author, body_contains=body_contains)
+    db.session.commit()
+    return jsonify({'count': count, 'disabled': disabled})
+
 @api.route('/comments/<int:id>')
 def get_comment(id):
-    comment = Comment.query.get_or_404(id)
-    return jsonify(comment.to_json())
+    comment = get_comment_or_404(id)
+    return jsonify(comments_to_json([comment])[0])
 
 @api.route('/posts/<int:id>/comments')
 def get_post_comments(id):
-    post = Post.query.get_or_404(id)
+    post = get_post_or_404(id)
     page = request.args.get('page', 1, type=int)
-    pagination = post.comments.order_by(Comment.timestamp.asc()).paginate(
+    comment_model = ArchivedComment if post.archived else Comment
+    pagination = post.comments.order_by(comment_model.timestamp.asc()).paginate(
             page, per_page=current_app.config['FLASKY_COMMENTS_PER_PAGE'], error_out=False)
-    comments = paginate.items
+    comments = pagination.items
     prevPage = None
-    if paginate.has_prev:
+    if pagination.has_prev:
         prevPage = url_for('api.get_post_comments', id=id, page=page-1, _external=True)
     nextPage = None
-    if paginate.has_next:
+    if pagination.has_next:
         nextPage = url_for('api.get_post_comments', id=id, page=page+1, _external=True)
-    return jsonify({'comments': [comment.to_json() for comment in comments],
+    return jsonify({'comments': comments_to_json(comments),
                     'prev': prevPage,
                     'next': nextPage,
-                    'count': paginate.total})
+                    'count': pagination.total})
 
 @api.route('/posts/<int:id>/comments/', methods=['POST'])
 @permission_required(Permission.COMMENT)
@@ -19,5 +19,5 @@ def forbidden(message):
     
 @api.errorhandler(ValidationError)
 def validation_error(e):
-    return bad_request(e.arg[0])
+    return bad_request(e.args[0])
 
@@ -0,0 +1,22 @@
+from flask import request, Response, stream_with_context
+
+from ..models import Permission
+from ..export import export_ndjson, parse_time
+from .decorators import permission_required
+from . import api
+
+
+# 流式导出 /export/posts /export/comments /export/users
+# 查询参数: since=2018-03-01T00:00:00 只导出该时间之后的记录(增量导出)
+#           gzip=1 在服务端边生成边压缩
+# 导出内容包含所有用户的邮箱 只允许管理员访问
+@api.route('/export/<resource>')
+@permission_required(Permission.ADMINISTER)
+def export(resource):
+    since = parse_time(request.args.get('since'))
+    gzip = request.args.get('gzip', 0, type=int) == 1
+    chunks = export_ndjson(resource, since=since, gzip=gzip)
+    response = Response(stream_with_context(chunks), mimetype='application/x-ndjson')
+    if gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
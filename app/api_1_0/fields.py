@@ -0,0 +1,96 @@
+from flask import request
+
+from .. import db
+from ..exceptions import ValidationError
+from ..models import User, Post, Comment
+
+
+# 资源序列化的公共部分 支持两个查询参数:
+#   ?fields=body,timestamp  只返回列出的字段 没有请求计数字段时不执行COUNT查询
+#   ?embed=author           把关联的作者资源直接嵌入 代替原来的url
+# 计数和嵌入的关联资源都对整页一次批量查询 不会对每一项分别查询
+
+
+def requested_fields():
+    fields = request.args.get('fields')
+    if not fields:
+        return None
+    return set(field.strip() for field in fields.split(',') if field.strip())
+
+
+def requested_embeds(allowed):
+    embed = request.args.get('embed')
+    if not embed:
+        return set()
+    embeds = set(name.strip() for name in embed.split(',') if name.strip())
+    unknown = embeds - set(allowed)
+    if unknown:
+        raise ValidationError('cannot embed %s' % ', '.join(sorted(unknown)))
+    return embeds
+
+
+def _wants(fields, name):
+    return fields is None or name in fields
+
+
+# 按外键分组计数 返回{id: 数量}
+def _count_by(column, ids):
+    if not ids:
+        return {}
+    return dict(db.session.query(column, db.func.count()).filter(column.in_(ids))
+                .group_by(column).all())
+
+
+def _authors_json(author_ids):
+    authors = User.query.filter(User.id.in_(author_ids)).all() if author_ids else []
+    return dict(zip([author.id for author in authors], users_to_json(authors, fields=None)))
+
+
+def users_to_json(users, fields=None):
+    post_counts = {}
+    if _wants(fields, 'post_count'):
+        post_counts = _count_by(Post.author_id, [user.id for user in users])
+    result = []
+    for user in users:
+        json_user = user.to_json(fields, exclude=('post_count',))
+        if _wants(fields, 'post_count'):
+            json_user['post_count'] = post_counts.get(user.id, 0)
+        result.append(json_user)
+    return result
+
+
+def posts_to_json(posts):
+    fields = requested_fields()
+    embeds = requested_embeds(['author'])
+    comment_counts = {}
+    if _wants(fields, 'comment_count'):
+        comment_counts = _count_by(Comment.post_id, [post.id for post in posts])
+    authors = {}
+    if 'author' in embeds:
+        authors = _authors_json(set(post.author_id for post in posts))
+    result = []
+    for post in posts:
+        json_post = post.to_json(fields, exclude=('comment_count',))
+        if _wants(fields, 'comment_count'):
+            # 归档文章的评论在归档数据库中
+            json_post['comment_count'] = post.comments.count() if post.archived \
+                    else comment_counts.get(post.id, 0)
+        if 'author' in embeds:
+            json_post['author'] = authors.get(post.author_id)
+        result.append(json_post)
+    return result
+
+
+def comments_to_json(comments):
+    fields = requested_fields()
+    embeds = requested_embeds(['author'])
+    authors = {}
+    if 'author' in embeds:
+        authors = _authors_json(set(comment.author_id for comment in comments))
+    result = []
+    for comment in comments:
+        json_comment = comment.to_json(fields)
+        if 'author' in embeds:
+            json_comment['author'] = authors.get(comment.author_id)
+        result.append(json_comment)
+    return result
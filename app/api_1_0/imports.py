@@ -0,0 +1,24 @@
+from flask import jsonify, request, g
+
+from ..models import Permission
+from ..importer import import_ndjson, summarize
+from .decorators import permission_required
+from . import api
+
+
+# 批量导入 请求体为NDJSON 每行一个对象 格式与单条POST相同
+# 文章: {"body": "...", "timestamp": "2018-03-01T12:00:00"}
+# 评论: {"body": "...", "post_id": 1}
+# 所有记录的作者都是当前用户 返回每一行的导入结果
+@api.route('/import/posts', methods=['POST'])
+@permission_required(Permission.WRITE_ARTICLES)
+def import_posts():
+    results = import_ndjson('posts', request.stream, author_id=g.current_user.id)
+    return jsonify(dict(summarize(results), results=results))
+
+
+@api.route('/import/comments', methods=['POST'])
+@permission_required(Permission.COMMENT)
+def import_comments():
+    results = import_ndjson('comments', request.stream, author_id=g.current_user.id)
+    return jsonify(dict(summarize(results), results=results))
@@ -1,9 +1,11 @@
 from flask import jsonify, g, request, url_for, current_app
 
 from ..models import Post, Permission
-from ..import db
+from ..import db, view_counter, trending
+from ..archive import get_post_or_404
 from .decorators import permission_required
 from .errors import forbidden
+from .fields import posts_to_json
 from . import api
 
 # 获取文章集合
@@ -18,16 +20,26 @@ def get_posts():
     nextPage = None
     if pagination.has_next:
         nextPage = url_for('api.get_posts', page=page+1, _external=False)
-    return jsonify({'posts': [post.to_json() for post in posts],
+    return jsonify({'posts': posts_to_json(posts),
                     'prev': prevPage,
                     'next': nextPage,
                     'count': pagination.total})
 
+# 热门文章 直接取内存中的排行 limit最多为FLASKY_TRENDING_SIZE
+@api.route('/posts/trending')
+def get_trending_posts():
+    limit = min(request.args.get('limit', current_app.config['FLASKY_POSTS_PER_PAGE'], type=int),
+                current_app.config['FLASKY_TRENDING_SIZE'])
+    return jsonify({'posts': posts_to_json(trending.top_posts(max(limit, 0)))})
+
 # 返回单篇博客文章
 @api.route('/posts/<int:id>')
 def get_post(id):
-    post = Post.query.get_or_404(id)
-    return jsonify(post.to_json())
+    post = get_post_or_404(id)
+    if not post.archived:
+        view_counter.incr(post.id)
+        trending.record(post.id, 'view')
+    return jsonify(posts_to_json([post])[0])
 
 # 文章资源post请求 把一篇新文章插入数据库
 @api.route('/posts/', methods=['POST'])
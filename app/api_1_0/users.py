@@ -1,10 +1,13 @@
+from flask import jsonify, request, url_for, current_app
 
+from ..models import User, Post
+from .fields import users_to_json, posts_to_json, requested_fields
 from . import api
 
 @api.route('/users/<int:id>')
 def get_user(id):
     user = User.query.get_or_404(id)
-    return jsonify(user.to_json())
+    return jsonify(users_to_json([user], requested_fields())[0])
 
 @api.route('/users/<int:id>/posts/')
 def get_user_posts(id):
@@ -19,7 +22,7 @@ def get_user_posts(id):
     nextPage = None
     if pagination.has_next:
         nextPage = url_for('api.get_user_posts', id=id, page=page+1, _external=True)
-    return jsonify({'posts': [post.to_json for post in posts],
+    return jsonify({'posts': posts_to_json(posts),
                     'prev': prevPage,
                     'next': nextPage,
                     'count': pagination.total})
@@ -37,7 +40,16 @@ def get_user_followed_posts(id):
     nextPage = None
     if pagination.has_next:
         nextPage = url_for('api.get_user_followed_posts', id=id, page=page+1, _external=True)
-    return jsonify({'posts': [post.to_json for post in posts],
+    return jsonify({'posts': posts_to_json(posts),
                     'prev': prevPage,
                     'next': nextPage,
                     'count': pagination.total})
+
+# 推荐关注的用户 直接读取批处理任务预先计算好的结果
+@api.route('/users/<int:id>/suggestions')
+def get_user_suggestions(id):
+    user = User.query.get_or_404(id)
+    limit = min(request.args.get('limit', 5, type=int), 50)
+    suggestions = user.suggested_users(limit)
+    return jsonify({'users': users_to_json(suggestions, requested_fields()),
+                    'count': len(suggestions)})
@@ -0,0 +1,153 @@
+# 归档旧数据
+# 禁用超过FLASKY_ARCHIVE_COMMENT_DAYS天的评论 以及(可选)超过FLASKY_ARCHIVE_POST_DAYS天的文章和它们的评论
+# 移到归档数据库(SQLALCHEMY_BINDS中的archive 默认是单独的SQLite文件) 主数据库的表和索引保持较小
+# 审核页和文章页分页查询的都是主数据库中的评论 归档的禁用评论不再出现在这些页面中
+#
+# 按id分批移动 每批先在归档数据库中写入(同id的旧记录先删除) 提交后再从主数据库删除
+# 两步之间中断时 下次执行会重新写入这一批 不会丢失也不会重复
+# 删除时只删除已经写入归档的记录 并重新检查条件: 期间被重新启用的评论 有了新评论的文章留在主数据库
+# 它们在归档数据库中的副本随后删除
+# 文章链接(/post/<id> 和 API的 /posts/<id> /comments/<id>)在主数据库中找不到时从归档数据库读取
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from . import db, invalidation
+from .models import Post, Comment, ArchivedPost, ArchivedComment
+
+COMMENT_COLUMNS = ['id', 'body', 'body_html', 'timestamp', 'disabled', 'author_id', 'post_id']
+POST_COLUMNS = ['id', 'body', 'body_html', 'timestamp', 'author_id', 'views']
+
+
+def _rows(objects, columns):
+    now = datetime.utcnow()
+    rows = []
+    for obj in objects:
+        row = dict((column, getattr(obj, column)) for column in columns)
+        row['archived_at'] = now
+        rows.append(row)
+    return rows
+
+
+# 在一个归档数据库事务中写入 同id的记录先删除 重复执行结果相同
+def _copy(conn, model, rows):
+    if not rows:
+        return
+    table = model.__table__
+    ids = [row['id'] for row in rows]
+    # SQLite限制单条语句的参数个数 分段删除
+    for i in range(0, len(ids), 500):
+        conn.execute(table.delete().where(table.c.id.in_(ids[i:i+500])))
+    conn.execute(table.insert(), rows)
+
+
+# 批量删除绕过了ORM事件 在这里让作者的统计数字和订阅失效
+def _invalidate(author_ids, feeds=False):
+    invalidation.publish('profile', *author_ids)
+    if feeds:
+        from .feeds import invalidate_feeds
+        for author_id in author_ids:
+            invalidate_feeds(author_id)
+
+
+# 删除归档数据库中仍留在主数据库的记录的副本
+def _discard(engine, model, ids):
+    if not ids:
+        return
+    table = model.__table__
+    with engine.begin() as conn:
+        for i in range(0, len(ids), 500):
+            conn.execute(table.delete().where(table.c.id.in_(ids[i:i+500])))
+
+
+# 每次取出最前面的一批 处理完的记录已从主数据库删除 下一次查询自然得到下一批
+def _batches(query, batch_size, pause):
+    while True:
+        batch = query.limit(batch_size).all()
+        if not batch:
+            return
+        yield batch
+        if pause:
+            time.sleep(pause)
+
+
+# 归档禁用超过days天的评论 返回归档的评论数
+def archive_comments(days=None, batch_size=None, pause=0.05):
+    days = days if days is not None else current_app.config['FLASKY_ARCHIVE_COMMENT_DAYS']
+    batch_size = batch_size or current_app.config['FLASKY_ARCHIVE_BATCH_SIZE']
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    engine = db.get_engine(bind='archive')
+    db.create_all(bind='archive')
+    query = Comment.query.filter(Comment.disabled == True, Comment.timestamp < cutoff) \
+            .order_by(Comment.id)
+    count = 0
+    for comments in _batches(query, batch_size, pause):
+        with engine.begin() as conn:
+            _copy(conn, ArchivedComment, _rows(comments, COMMENT_COLUMNS))
+        ids = [comment.id for comment in comments]
+        authors = set(comment.author_id for comment in comments)
+        count += Comment.query.filter(Comment.id.in_(ids), Comment.disabled == True) \
+                .delete(synchronize_session=False)
+        # 在同一个事务中查询 删除之后其它写操作要等本事务提交
+        kept = [id for id, in db.session.query(Comment.id).filter(Comment.id.in_(ids))]
+        db.session.commit()
+        _discard(engine, ArchivedComment, kept)
+        _invalidate(authors)
+    return count
+
+
+# 归档超过days天的文章 连同它们的所有评论 返回(文章数, 评论数)
+def archive_posts(days=None, batch_size=None, pause=0.05):
+    days = days if days is not None else current_app.config['FLASKY_ARCHIVE_POST_DAYS']
+    if days is None:
+        return 0, 0
+    batch_size = batch_size or current_app.config['FLASKY_ARCHIVE_BATCH_SIZE']
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    engine = db.get_engine(bind='archive')
+    db.create_all(bind='archive')
+    posts_count, comments_count = 0, 0
+    query = Post.query.filter(Post.timestamp < cutoff).order_by(Post.id)
+    for posts in _batches(query, batch_size, pause):
+        ids = [post.id for post in posts]
+        comments = Comment.query.filter(Comment.post_id.in_(ids)).all()
+        with engine.begin() as conn:
+            _copy(conn, ArchivedPost, _rows(posts, POST_COLUMNS))
+            _copy(conn, ArchivedComment, _rows(comments, COMMENT_COLUMNS))
+        authors = set(post.author_id for post in posts) | \
+                set(comment.author_id for comment in comments)
+        # 读取之后又有了新评论(id比读到的都大)的文章这次不删除
+        # 它们仍在查询结果的最前面 下一批连同新评论一起归档
+        last_comment = max(comment.id for comment in comments) if comments else 0
+        new_comments = db.session.query(Comment.id).filter(Comment.post_id == Post.id,
+                                                           Comment.id > last_comment)
+        Post.query.filter(Post.id.in_(ids), ~new_comments.exists()) \
+                .delete(synchronize_session=False)
+        kept = set(id for id, in db.session.query(Post.id).filter(Post.id.in_(ids)))
+        archived = [comment.id for comment in comments if comment.post_id not in kept]
+        discarded = [comment.id for comment in comments if comment.post_id in kept]
+        for i in range(0, len(archived), 500):
+            Comment.query.filter(Comment.id.in_(archived[i:i+500])) \
+                    .delete(synchronize_session=False)
+        db.session.commit()
+        _discard(engine, ArchivedComment, discarded)
+        _discard(engine, ArchivedPost, list(kept))
+        _invalidate(authors, feeds=True)
+        posts_count += len(ids) - len(kept)
+        comments_count += len(archived)
+    return posts_count, comments_count
+
+
+# 读取文章 主数据库中没有时从归档数据库读取 都没有时返回404
+def get_post_or_404(id):
+    post = Post.query.get(id)
+    if post is None:
+        post = ArchivedPost.query.get_or_404(id)
+    return post
+
+
+def get_comment_or_404(id):
+    comment = Comment.query.get(id)
+    if comment is None:
+        comment = ArchivedComment.query.get_or_404(id)
+    return comment
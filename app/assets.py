@@ -0,0 +1,166 @@
+# 带内容指纹的静态文件
+# 每个静态文件按内容计算散列 url中使用带散列的文件名 例如 style.css -> style.1a2b3c4d5e.css
+# 文件内容一变url就变 所以可以让浏览器缓存一年且不再验证(immutable)
+# 文件名到指纹文件名的映射保存在清单文件中 部署时用manage.py build_assets生成
+# 所有工作进程读取同一个清单 不需要各自重新计算散列 没有清单时才在进程内计算
+# 样式表中url()引用的静态文件改为带指纹的文件名后再计算散列 引用的图片变了样式表的url也会变
+import hashlib
+import json
+import os
+import posixpath
+import re
+
+from flask import current_app, abort, url_for, request, make_response
+
+from .compress import ENCODINGS, send_precompressed
+
+ONE_YEAR = 365 * 24 * 60 * 60
+
+
+def fingerprint(filename, digest):
+    root, ext = os.path.splitext(filename)
+    return '%s.%s%s' % (root, digest, ext)
+
+
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")\s]+)\1\s*\)''')
+
+
+def is_css(filename):
+    return filename.endswith('.css')
+
+
+# 把样式表中url()引用的静态文件改为带指纹的文件名(相对于样式表所在目录)
+# 绝对路径 外部地址 data:以及清单中没有的文件保持不变
+def rewrite_css(filename, data, manifest):
+    base = posixpath.dirname(filename)
+
+    def replace(match):
+        quote, url = match.groups()
+        if url.startswith(('/', '#', 'data:')) or '://' in url:
+            return match.group(0)
+        path, suffix = re.match(r'([^?#]*)(.*)', url).groups()
+        hashed = manifest.get(posixpath.normpath(posixpath.join(base, path)))
+        if hashed is None:
+            return match.group(0)
+        return 'url(%s%s%s%s)' % (quote, posixpath.relpath(hashed, base or '.'), suffix, quote)
+    return CSS_URL.sub(replace, data.decode('utf-8')).encode('utf-8')
+
+
+# 计算目录中所有静态文件的指纹 返回{原文件名: 指纹文件名}
+# 样式表最后处理 先改写其中的url()再计算散列(样式表之间的引用不改写)
+def build_manifest(directory, skip=()):
+    manifest = {}
+    stylesheets = []
+    for root, dirs, files in os.walk(directory):
+        for name in files:
+            if name.endswith(tuple(suffix for _, suffix in ENCODINGS)):
+                continue
+            path = os.path.join(root, name)
+            filename = os.path.relpath(path, directory).replace(os.sep, '/')
+            if filename in skip:
+                continue
+            if is_css(filename):
+                stylesheets.append(filename)
+                continue
+            with open(path, 'rb') as f:
+                digest = hashlib.md5(f.read()).hexdigest()[:10]
+            manifest[filename] = fingerprint(filename, digest)
+    hashed = {}
+    for filename in stylesheets:
+        with open(os.path.join(directory, filename), 'rb') as f:
+            data = rewrite_css(filename, f.read(), manifest)
+        hashed[filename] = fingerprint(filename, hashlib.md5(data).hexdigest()[:10])
+    manifest.update(hashed)
+    return manifest
+
+
+class Assets(object):
+    def __init__(self, app=None):
+        self.manifest = None
+        self.reverse = None
+        self.stylesheets = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FLASKY_ASSETS_MANIFEST',
+                os.path.join(app.static_folder, 'manifest.json'))
+        self.manifest = None
+        self.reverse = None
+        self.stylesheets = {}
+        app.add_url_rule('/assets/<path:filename>', 'assets', self.send_asset)
+        # 在模板中使用 {{ asset_url('style.css') }} 代替 url_for('static', filename='style.css')
+        app.add_template_global(self.url, 'asset_url')
+
+    def _manifest_skip(self):
+        path = current_app.config['FLASKY_ASSETS_MANIFEST']
+        return (os.path.relpath(path, current_app.static_folder).replace(os.sep, '/'),)
+
+    def load(self):
+        path = current_app.config['FLASKY_ASSETS_MANIFEST']
+        if os.path.exists(path):
+            with open(path) as f:
+                manifest = json.load(f)
+        else:
+            manifest = build_manifest(current_app.static_folder, self._manifest_skip())
+        self.reverse = dict((hashed, filename) for filename, hashed in manifest.items())
+        self.stylesheets = {}
+        self.manifest = manifest
+
+    # 部署时调用 计算指纹并写入清单文件
+    def write_manifest(self):
+        manifest = build_manifest(current_app.static_folder, self._manifest_skip())
+        path = current_app.config['FLASKY_ASSETS_MANIFEST']
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        # 先写临时文件再改名 其它进程不会读到写了一半的清单
+        os.rename(tmp, path)
+        self.manifest = None
+        return manifest
+
+    # 带指纹的文件的内容 样式表中的url()已改为带指纹的文件名(改写结果缓存在进程内)
+    def read(self, filename):
+        if self.manifest is None:
+            self.load()
+        data = self.stylesheets.get(filename)
+        if data is None:
+            with open(os.path.join(current_app.static_folder, filename), 'rb') as f:
+                data = f.read()
+            if not is_css(filename):
+                return data
+            data = rewrite_css(filename, data, self.manifest)
+            self.stylesheets[filename] = data
+        return data
+
+    def url(self, filename):
+        if self.manifest is None:
+            self.load()
+        hashed = self.manifest.get(filename)
+        if hashed is None:
+            return url_for('static', filename=filename)
+        return url_for('assets', filename=hashed)
+
+    def send_asset(self, filename):
+        if self.manifest is None:
+            self.load()
+        original = self.reverse.get(filename)
+        if original is None:
+            # 样式表中的相对路径(例如背景图片)引用的是原文件名 按普通静态文件发送
+            if filename not in self.manifest:
+                abort(404)
+            return current_app.send_static_file(filename)
+        if is_css(original):
+            # 内容改写过 不能发送预压缩的文件 由Compress压缩
+            data = self.read(original)
+            response = make_response(data)
+            response.mimetype = 'text/css'
+            response.set_etag(hashlib.md5(data).hexdigest())
+            response = response.make_conditional(request)
+        else:
+            directory = current_app.static_folder
+            response = send_precompressed(directory, original, cache_timeout=ONE_YEAR)
+            if response is None:
+                response = current_app.send_static_file(original)
+        response.headers['Cache-Control'] = 'public, max-age=%d, immutable' % ONE_YEAR
+        return response
@@ -0,0 +1,108 @@
+# 分批在线数据迁移
+# 在迁移脚本中给已有的行回填数据(例如新增列的值) 不在一个大事务里改写整张表:
+#   按主键顺序分批读取(WHERE key > 上一批的最后一个键 ORDER BY key LIMIT n) 不用OFFSET 每批的代价相同
+#   每批一个短事务 写入本批的更新和进度检查点 事务之间暂停一会儿 让网站的写操作有机会获得数据库锁
+#   进度保存在data_migrations表中 中断后再次执行迁移会从检查点继续 已完成的回填直接跳过
+#
+# 在迁移脚本中的用法:
+#   from app.backfill import backfill_in_migration
+#   users = sa.table('users', sa.column('id'), sa.column('email'), sa.column('avatar_hash'))
+#   backfill_in_migration(op, 'users.avatar_hash', users, ['email'],
+#           lambda row: {'avatar_hash': md5(row.email)}, where=users.c.avatar_hash == None)
+# 回填需要连接数据库 --sql离线模式下跳过
+# 回填应放在只改数据的单独迁移中: 同一迁移中的表结构修改在回填中断时已经生效 再次执行会失败
+import logging
+import time
+from datetime import datetime
+
+import sqlalchemy as sa
+
+# 迁移环境为alembic开头的日志记录器配置了输出 回填的进度随迁移日志一起输出
+logger = logging.getLogger('alembic.backfill')
+
+metadata = sa.MetaData()
+
+# 回填的检查点 name为回填的名字 last_key为已处理的最后一个键
+data_migrations = sa.Table('data_migrations', metadata,
+    sa.Column('name', sa.String(128), primary_key=True),
+    sa.Column('last_key', sa.Integer),
+    sa.Column('rows', sa.Integer, nullable=False, default=0),
+    sa.Column('done', sa.Boolean, nullable=False, default=False),
+    sa.Column('updated_at', sa.DateTime, nullable=False))
+
+
+def load_checkpoint(engine, name):
+    data_migrations.create(engine, checkfirst=True)
+    with engine.connect() as conn:
+        return conn.execute(sa.select([data_migrations])
+                            .where(data_migrations.c.name == name)).first()
+
+
+# 回填table中的行 返回本次更新的行数
+# columns: 计算需要读取的列名 compute(row)返回要写入的{列名: 值} 返回None时不更新这一行
+# where: 只处理满足条件的行(例如回填的列为NULL) key: 分批排序用的唯一整数列
+# pause: 每批之间暂停的秒数
+def backfill(engine, name, table, columns, compute, where=None, key='id',
+             batch_size=1000, pause=0.05):
+    checkpoint = load_checkpoint(engine, name)
+    if checkpoint is not None and checkpoint.done:
+        logger.info('%s: already done', name)
+        return 0
+    key_column = table.c[key]
+    last_key = checkpoint.last_key if checkpoint is not None else None
+    total = checkpoint.rows if checkpoint is not None else 0
+    updated = 0
+    query = sa.select([key_column] + [table.c[column] for column in columns]) \
+            .order_by(key_column).limit(batch_size)
+    if where is not None:
+        query = query.where(where)
+    update = table.update().where(key_column == sa.bindparam('_key'))
+
+    while True:
+        with engine.begin() as conn:
+            batch_query = query if last_key is None else query.where(key_column > last_key)
+            rows = conn.execute(batch_query).fetchall()
+            changes = []
+            for row in rows:
+                values = compute(row)
+                if values:
+                    values = dict(values)
+                    values['_key'] = row[key]
+                    changes.append(values)
+            # executemany要求每组参数的列相同 按列分组执行
+            groups = {}
+            for values in changes:
+                groups.setdefault(tuple(sorted(values)), []).append(values)
+            for group in groups.values():
+                conn.execute(update.values(**dict((column, sa.bindparam(column))
+                        for column in group[0] if column != '_key')), group)
+            if rows:
+                last_key = rows[-1][key]
+            done = len(rows) < batch_size
+            updated += len(changes)
+            record = {'last_key': last_key, 'rows': total + updated, 'done': done,
+                      'updated_at': datetime.utcnow()}
+            result = conn.execute(data_migrations.update()
+                                  .where(data_migrations.c.name == name), record)
+            if result.rowcount == 0:
+                conn.execute(data_migrations.insert(), dict(record, name=name))
+        logger.info('%s: %d rows updated, last key %s', name, total + updated, last_key)
+        if done:
+            return updated
+        if pause:
+            time.sleep(pause)
+
+
+# 在迁移脚本的upgrade()中调用 参数同backfill
+# 迁移运行在一个事务中时(新版alembic) 先提交它 回填使用单独的连接 每批一个事务
+def backfill_in_migration(op, name, table, columns, compute, **kwargs):
+    context = op.get_context()
+    if context.as_sql:
+        logger.warning('%s: skipped in offline mode', name)
+        return 0
+    engine = op.get_bind().engine
+    autocommit_block = getattr(context, 'autocommit_block', None)
+    if autocommit_block is None:
+        return backfill(engine, name, table, columns, compute, **kwargs)
+    with autocommit_block():
+        return backfill(engine, name, table, columns, compute, **kwargs)
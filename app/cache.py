@@ -0,0 +1,68 @@
+# 进程内的LRU缓存
+# 保存最近使用的maxsize项 超出时淘汰最久未使用的一项
+# ttl为每项的最长保存时间(秒) 写操作在本进程内会主动删除对应的项
+# 同一台机器上的其它工作进程通过失效通知(见invalidation.py)删除对应的项
+# ttl限制的是收不到通知的情况(其它机器上的写操作 直接修改数据库)下读到旧数据的时间
+# 配置项为 <前缀>_SIZE 和 <前缀>_TTL 例如 FLASKY_PROFILE_CACHE_SIZE
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+class LRUCache(object):
+    def __init__(self, config_prefix=None, maxsize=1024, ttl=None, app=None):
+        self.config_prefix = config_prefix
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if self.config_prefix is not None:
+            self.maxsize = app.config.setdefault(self.config_prefix + '_SIZE', self.maxsize)
+            self.ttl = app.config.setdefault(self.config_prefix + '_TTL', self.ttl)
+        # 每次创建程序实例都清空缓存 避免沿用其它数据库的数据(例如单元测试)
+        self.clear()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and (item[0] is None or item[0] > time.time()):
+                self._items.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            if item is not None:
+                del self._items[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        expires = time.time() + self.ttl if self.ttl else None
+        with self._lock:
+            self._items[key] = (expires, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'size': len(self._items), 'maxsize': self.maxsize, 'hits': self.hits,
+                'misses': self.misses, 'hit_rate': float(self.hits) / total if total else 0.0}
@@ -0,0 +1,148 @@
+# 响应压缩
+# 动态生成的页面和json在after_request中按客户端的Accept-Encoding压缩(有brotli时优先使用br)
+# 只压缩白名单中的内容类型 且响应体超过最小长度 流式响应和文件响应不在这里压缩
+# 静态文件在部署时预先压缩(manage.py compress_static) 生成同名的.gz/.br文件
+# 请求静态文件时如果存在预压缩文件就直接发送 不会每次请求都重新压缩
+import mimetypes
+import os
+import zlib
+
+from flask import current_app, request, send_file, safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+COMPRESS_MIMETYPES = ['text/html', 'text/css', 'text/plain', 'text/xml', 'text/javascript',
+                      'application/json', 'application/javascript', 'application/xml',
+                      'application/atom+xml', 'application/rss+xml', 'image/svg+xml',
+                      'image/x-icon', 'image/vnd.microsoft.icon']
+
+# 压缩格式和对应的预压缩文件后缀 按优先级排列
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+
+def gzip_compress(data, level=6):
+    # 不写入时间戳 同样的内容每次压缩结果相同
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress(data, encoding, level=6):
+    if encoding == 'br':
+        return brotli.compress(data, quality=min(level, 11))
+    return gzip_compress(data, level)
+
+
+def available_encodings():
+    return [(encoding, suffix) for encoding, suffix in ENCODINGS
+            if encoding != 'br' or brotli is not None]
+
+
+# 客户端接受的压缩格式 按服务端优先级排列
+def accepted_encodings():
+    return [(encoding, suffix) for encoding, suffix in available_encodings()
+            if request.accept_encodings[encoding]]
+
+
+# 压缩后的内容和原内容不再逐字节相同 强ETag改为弱ETag(W/) 不同编码的响应不会共用一个强校验值
+# 条件请求(If-None-Match)使用弱比较 304仍然有效
+# 预压缩的文件不需要: 它的ETag由压缩文件本身计算 与原文件不同
+def weaken_etag(response):
+    etag, weak = response.get_etag()
+    if etag is not None and not weak:
+        response.set_etag(etag, weak=True)
+
+
+# 预压缩目录中所有可压缩的文件 源文件比压缩文件新时重新生成
+def precompress_directory(directory, mimetypes_allowed=None, level=9):
+    mimetypes_allowed = mimetypes_allowed or COMPRESS_MIMETYPES
+    count = 0
+    for root, dirs, files in os.walk(directory):
+        for name in files:
+            if name.endswith(tuple(suffix for _, suffix in ENCODINGS)):
+                continue
+            if mimetypes.guess_type(name)[0] not in mimetypes_allowed:
+                continue
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                data = None
+                for encoding, suffix in available_encodings():
+                    target = path + suffix
+                    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+                        continue
+                    if data is None:
+                        data = f.read()
+                    with open(target, 'wb') as out:
+                        out.write(compress(data, encoding, level))
+                    count += 1
+    return count
+
+
+# 发送预压缩的静态文件 没有可用的预压缩文件时返回None
+def send_precompressed(directory, filename, cache_timeout=None):
+    for encoding, suffix in accepted_encodings():
+        path = safe_join(directory, filename + suffix)
+        if path is None or not os.path.isfile(path):
+            continue
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = send_file(path, mimetype=mimetype, conditional=True,
+                cache_timeout=cache_timeout)
+        response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        return response
+    return None
+
+
+class Compress(object):
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FLASKY_COMPRESS', True)
+        app.config.setdefault('FLASKY_COMPRESS_MIN_SIZE', 500)
+        app.config.setdefault('FLASKY_COMPRESS_LEVEL', 6)
+        app.config.setdefault('FLASKY_COMPRESS_MIMETYPES', COMPRESS_MIMETYPES)
+        if app.config['FLASKY_COMPRESS']:
+            app.before_request(self.serve_precompressed)
+            app.after_request(self.after_request)
+
+    # 静态文件(包括各蓝本的静态文件 例如Flask-Bootstrap)优先发送预压缩版本
+    def serve_precompressed(self):
+        endpoint = request.endpoint or ''
+        if endpoint == 'static':
+            directory = current_app.static_folder
+        elif endpoint.endswith('.static') and request.blueprint in current_app.blueprints:
+            directory = current_app.blueprints[request.blueprint].static_folder
+        else:
+            return None
+        return send_precompressed(directory, request.view_args['filename'],
+                current_app.get_send_file_max_age(request.view_args['filename']))
+
+    def after_request(self, response):
+        config = current_app.config
+        if response.mimetype not in config['FLASKY_COMPRESS_MIMETYPES']:
+            return response
+        response.vary.add('Accept-Encoding')
+        if response.status_code == 304 and accepted_encodings():
+            # 与同一请求得到200时(压缩后)的ETag一致
+            weaken_etag(response)
+            return response
+        if response.status_code < 200 or response.status_code >= 300 or \
+                response.status_code == 204 or response.direct_passthrough or \
+                response.is_streamed or 'Content-Encoding' in response.headers:
+            return response
+        encodings = accepted_encodings()
+        if not encodings:
+            return response
+        data = response.get_data()
+        if len(data) < config['FLASKY_COMPRESS_MIN_SIZE']:
+            return response
+        encoding = encodings[0][0]
+        response.set_data(compress(data, encoding, config['FLASKY_COMPRESS_LEVEL']))
+        response.headers['Content-Encoding'] = encoding
+        weaken_etag(response)
+        return response
@@ -0,0 +1,173 @@
+# 文章浏览计数 写缓冲
+# 每次浏览只在进程内的字典中加一 不访问数据库
+# 1. 每隔FLASKY_VIEW_FLUSH_INTERVAL秒 进程把累计的计数合并到本机共享存储(local_store)中
+# 2. 每隔FLASKY_VIEW_DRAIN_INTERVAL秒 由其中一个进程把共享存储中所有进程的计数
+#    用一条批量UPDATE语句写入数据库 然后清空共享存储
+# 写入时机由请求触发(见after_request) 另有一个后台线程定时合并 没有请求的空闲进程也不会一直积压计数
+# 进程正常退出时也会把计数合并到共享存储
+#
+# 丢失上限:
+#   工作进程崩溃(被kill -9等)时 丢失该进程最近FLASKY_VIEW_FLUSH_INTERVAL秒(加上最多1秒的定时误差)内的浏览计数
+#   共享存储设置为:memory:(单元测试)时没有定时线程 只由请求触发合并
+#   共享存储是本机磁盘上的文件 进程崩溃不会丢失 只有整台机器的磁盘损坏时
+#   才会丢失最近FLASKY_VIEW_DRAIN_INTERVAL秒内尚未写入数据库的计数
+#   数据库提交成功后 共享存储提交之前崩溃 这一批计数会在下次写入时重复计入一次
+# 页面上显示的浏览数 = 数据库中的值 + 本进程尚未合并的计数
+# 其它进程的计数最多延迟 FLUSH + DRAIN 两个间隔后出现
+import atexit
+import os
+import sqlite3
+import time
+from threading import Lock, Thread
+
+from flask import current_app
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS view_counts (
+    post_id INTEGER PRIMARY KEY,
+    count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS view_drains (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    drained_at REAL NOT NULL
+);
+'''
+
+
+class ViewCounter(object):
+    def __init__(self, store, app=None):
+        self.store = store
+        store.register_schema(SCHEMA)
+        self.pending = {}
+        self.last_flush = time.time()
+        self._lock = Lock()
+        self._registered = False
+        self._timer_pid = None
+        self._timer_app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FLASKY_COUNT_VIEWS', True)
+        app.config.setdefault('FLASKY_VIEW_FLUSH_INTERVAL', 10)
+        app.config.setdefault('FLASKY_VIEW_DRAIN_INTERVAL', 60)
+        with self._lock:
+            self.pending = {}
+            self.last_flush = time.time()
+        app.after_request(self.after_request)
+        if not self._registered:
+            atexit.register(self.flush, drain=False)
+            self._registered = True
+
+    def incr(self, post_id, count=1):
+        if not current_app.config['FLASKY_COUNT_VIEWS']:
+            return
+        with self._lock:
+            self.pending[post_id] = self.pending.get(post_id, 0) + count
+        self._ensure_timer()
+
+    # 在本进程第一次计数时启动定时合并的线程 fork出的工作进程各自启动自己的线程
+    def _ensure_timer(self):
+        if self.store.path == ':memory:':
+            # 内存数据库只在创建它的线程内有效
+            return
+        self._timer_app = current_app._get_current_object()
+        with self._lock:
+            if self._timer_pid == os.getpid():
+                return
+            self._timer_pid = os.getpid()
+        thread = Thread(target=self._run_timer, name='view-counter-flush')
+        thread.daemon = True
+        thread.start()
+
+    def _run_timer(self):
+        while True:
+            app = self._timer_app
+            interval = app.config['FLASKY_VIEW_FLUSH_INTERVAL']
+            time.sleep(min(interval, 1))
+            with self._lock:
+                due = self.pending and time.time() - self.last_flush >= interval
+            if due:
+                try:
+                    with app.app_context():
+                        self.flush(drain=False)
+                except Exception:
+                    app.logger.exception('cannot flush view counts')
+
+    # 到了合并时间的请求在响应发送完毕后执行合并
+    # 这时请求的数据库会话已经提交 写数据库不会与请求中未提交的事务互相等待(例如SQLite)
+    def after_request(self, response):
+        interval = current_app.config['FLASKY_VIEW_FLUSH_INTERVAL']
+        with self._lock:
+            due = self.pending and time.time() - self.last_flush >= interval
+            if due:
+                # 避免同时结束的其它请求重复安排合并
+                self.last_flush = time.time()
+        if due:
+            app = current_app._get_current_object()
+            response.call_on_close(lambda: self._flush_in_context(app))
+        return response
+
+    def _flush_in_context(self, app):
+        with app.app_context():
+            self.flush()
+
+    # 本进程中尚未合并到共享存储的计数
+    def pending_count(self, post_id):
+        return self.pending.get(post_id, 0)
+
+    # 把本进程的计数合并到共享存储 drain为True时再检查是否需要写入数据库
+    def flush(self, drain=True):
+        with self._lock:
+            counts, self.pending = self.pending, {}
+            self.last_flush = time.time()
+        if counts:
+            try:
+                with self.store.transaction() as conn:
+                    conn.executemany('INSERT OR IGNORE INTO view_counts (post_id, count) '
+                                     'VALUES (?, 0)', [(id,) for id in counts])
+                    conn.executemany('UPDATE view_counts SET count = count + ? WHERE post_id = ?',
+                                     [(count, id) for id, count in counts.items()])
+            except sqlite3.Error:
+                # 共享存储暂时不可用 计数放回进程内 下次再合并
+                with self._lock:
+                    for id, count in counts.items():
+                        self.pending[id] = self.pending.get(id, 0) + count
+                if drain:
+                    current_app.logger.exception('cannot flush view counts')
+                return 0
+        if drain:
+            try:
+                return self.drain()
+            except Exception:
+                current_app.logger.exception('cannot write view counts')
+        return 0
+
+    # 把共享存储中的计数写入数据库 返回写入的浏览数
+    # 整个过程在共享存储的写事务中进行 同一时刻只有一个进程在写
+    # 距上次写入不到FLASKY_VIEW_DRAIN_INTERVAL秒时直接返回 force为True时立即写入
+    def drain(self, force=False):
+        now = time.time()
+        with self.store.transaction() as conn:
+            row = conn.execute('SELECT drained_at FROM view_drains WHERE id = 1').fetchone()
+            if not force and row is not None and \
+                    now - row[0] < current_app.config['FLASKY_VIEW_DRAIN_INTERVAL']:
+                return 0
+            rows = conn.execute('SELECT post_id, count FROM view_counts').fetchall()
+            if rows:
+                # 写数据库失败时抛出异常 共享存储的事务回滚 计数保留到下次
+                self._apply(rows)
+                conn.execute('DELETE FROM view_counts')
+            conn.execute('INSERT OR REPLACE INTO view_drains (id, drained_at) VALUES (1, ?)',
+                         (now,))
+        return sum(count for _, count in rows)
+
+    # 一条批量UPDATE语句(executemany) 使用独立的连接和事务 不影响当前请求的会话
+    def _apply(self, rows):
+        from . import db
+        from .models import Post
+        posts = Post.__table__
+        stmt = posts.update().where(posts.c.id == db.bindparam('post_id')).values(
+                views=db.func.coalesce(posts.c.views, 0) + db.bindparam('count'))
+        with db.engine.begin() as connection:
+            connection.execute(stmt, [{'post_id': id, 'count': count} for id, count in rows])
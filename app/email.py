@@ -15,12 +15,18 @@ def send_async_email(app, msg):
 # 发送邮件 参数: [收件人地址], '主题', 渲染正文模板, {关键字参数列表}
 # 指定模板时不佳扩展名 这样才能使用两个模板分别渲染纯文本正文和富文本正文
 # 调用者将关键字参数传给render_template()函数 以便在模板中使用 进而生成电子邮件正文
+# 配置了FLASKY_USE_JOBS时 正文在请求中渲染好后交给后台任务发送 返回任务id
 def send_email(to, subject, template, **kwargs):
     app = current_app._get_current_object()
-    msg = Message(app.config['FLASKY_MAIL_SUBJECT_PREFIX']+subject, 
-                sender=app.config['FLASKY_MAIL_SENDER'], recipients=[to])
-    msg.body = render_template(template + '.txt', **kwargs)
-    msg.html = render_template(template + '.html', **kwargs)
+    subject = app.config['FLASKY_MAIL_SUBJECT_PREFIX'] + subject
+    body = render_template(template + '.txt', **kwargs)
+    html = render_template(template + '.html', **kwargs)
+    if app.config['FLASKY_USE_JOBS']:
+        from .tasks import send_mail
+        return send_mail.delay(to, subject, body, html)
+    msg = Message(subject, sender=app.config['FLASKY_MAIL_SENDER'], recipients=[to])
+    msg.body = body
+    msg.html = html
     # 原:同步发送 在发送邮件时会停滞几秒钟 为避免处理请求过程中不必要的延迟 采用异步发送
     # 将发送电子邮件的函数移到后台线程中
     #mail.send(msg)
@@ -0,0 +1,89 @@
+# 流式导出数据 输出格式为NDJSON(每行一个JSON对象)
+# 查询只选取需要的列 并使用yield_per分批从数据库游标读取
+# 结果逐行序列化后交给生成器 不会把整张表加载到内存 内存占用与表大小无关
+import json
+import zlib
+from datetime import datetime
+
+from . import db
+from .exceptions import ValidationError
+from .models import User, Post, Comment
+
+
+# 可导出的资源: (模型, 用于增量导出的时间列, 导出的列)
+# 用户的密码散列不导出
+EXPORTS = {
+    'posts': (Post, 'timestamp', ['id', 'body', 'body_html', 'timestamp', 'author_id']),
+    'comments': (Comment, 'timestamp', ['id', 'body', 'body_html', 'timestamp', 'disabled',
+                                        'author_id', 'post_id']),
+    'users': (User, 'member_since', ['id', 'email', 'username', 'role_id', 'confirmed', 'name',
+                                     'location', 'about_me', 'member_since', 'last_seen',
+                                     'avatar_hash']),
+}
+
+TIME_FORMATS = ['%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d']
+
+
+# 解析since参数 支持ISO格式的日期或日期时间
+def parse_time(value):
+    if not value:
+        return None
+    for fmt in TIME_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    raise ValidationError('invalid timestamp: %s' % value)
+
+
+def _serialize(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+# 按id顺序逐行产生字典 since不为空时只导出该时间之后(含)的记录
+def export_rows(resource, since=None, batch_size=1000):
+    if resource not in EXPORTS:
+        raise ValidationError('unknown resource: %s' % resource)
+    model, time_column, names = EXPORTS[resource]
+    query = db.session.query(*[getattr(model, name) for name in names])
+    if since is not None:
+        query = query.filter(getattr(model, time_column) >= since)
+    query = query.order_by(model.id).execution_options(stream_results=True).yield_per(batch_size)
+    for row in query:
+        yield dict((name, _serialize(value)) for name, value in zip(names, row))
+
+
+# 把记录序列化成NDJSON 每攒够chunk_size字节输出一次 减少响应分块的数量
+def ndjson_chunks(rows, chunk_size=64 * 1024):
+    buffer, size = [], 0
+    for row in rows:
+        line = (json.dumps(row, ensure_ascii=False) + '\n').encode('utf-8')
+        buffer.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield b''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+# 边生成边压缩成gzip格式
+def gzip_chunks(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_ndjson(resource, since=None, gzip=False):
+    # export_rows是生成器 要在开始输出之前检查资源名
+    if resource not in EXPORTS:
+        raise ValidationError('unknown resource: %s' % resource)
+    chunks = ndjson_chunks(export_rows(resource, since))
+    if gzip:
+        chunks = gzip_chunks(chunks)
+    return chunks
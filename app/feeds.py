@@ -0,0 +1,70 @@
+# Atom/RSS订阅
+# 全站和每个作者各一个订阅 内容为最新的FLASKY_FEED_SIZE篇文章的body_html
+# 生成的XML缓存在feed_cache中 发表 修改或删除文章时对应的订阅失效(见models中的事件监听) 其它进程随后收到失效通知
+# 每个订阅带ETag(内容散列)和Last-Modified(生成订阅的时间) 客户端条件请求时只返回304
+#   Last-Modified不用最新文章的时间: 修改或删除较早的文章不会改变它 只带If-Modified-Since的客户端会一直得到304
+#   订阅在任何文章变化后都会失效重新生成 生成时间不早于最后一次变化 其它进程重新生成时时间会变 只是多返回一次完整内容
+import hashlib
+from email.utils import format_datetime
+from datetime import datetime, timezone
+
+from flask import current_app, render_template, request, make_response
+
+from . import db, feed_cache, invalidation
+
+# 格式: (模板, 内容类型)
+FORMATS = {
+    'atom': ('atom.xml', 'application/atom+xml'),
+    'rss': ('rss.xml', 'application/rss+xml'),
+}
+
+
+def feed_key(format, author_id=None):
+    return ('feed', author_id, format)
+
+
+# 全站订阅和该作者的订阅失效
+# 在模型事件中传入数据库会话 提交后通知其它进程 不传时(已经提交)立即通知
+def invalidate_feeds(author_id, session=None):
+    keys = [feed_key(format, id) for format in FORMATS for id in (None, author_id)]
+    if session is not None:
+        invalidation.invalidate(session, 'feed', *keys)
+    else:
+        invalidation.publish('feed', *keys)
+
+
+def atom_date(value):
+    return value.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def rss_date(value):
+    return format_datetime(value.replace(tzinfo=timezone.utc), usegmt=True)
+
+
+def build_feed(format, author=None):
+    from .models import Post
+    query = author.posts if author is not None else Post.query
+    posts = query.options(db.joinedload(Post.author)).order_by(Post.timestamp.desc()) \
+            .limit(current_app.config['FLASKY_FEED_SIZE']).all()
+    template, mimetype = FORMATS[format]
+    updated = posts[0].timestamp if posts else None
+    data = render_template(template, posts=posts, author=author, updated=updated,
+            atom_date=atom_date, rss_date=rss_date).encode('utf-8')
+    # HTTP日期只精确到秒
+    return {'data': data, 'mimetype': mimetype, 'etag': hashlib.md5(data).hexdigest(),
+            'last_modified': datetime.utcnow().replace(microsecond=0)}
+
+
+# 返回订阅的响应 缓存中没有时生成并缓存
+def feed_response(format, author=None):
+    key = feed_key(format, author.id if author is not None else None)
+    feed = feed_cache.get(key)
+    if feed is None:
+        feed = build_feed(format, author)
+        feed_cache.set(key, feed)
+    response = make_response(feed['data'])
+    response.mimetype = feed['mimetype']
+    response.set_etag(feed['etag'])
+    response.last_modified = feed['last_modified']
+    # 订阅没有变化时 改为不带正文的304响应
+    return response.make_conditional(request)
@@ -0,0 +1,137 @@
+# 进程内的关注关系索引
+# 每个用户保存两个有序整数数组: 关注者id 和 被关注者id
+# 数组使用标准库array 每个id只占8个字节 远小于set或ORM对象
+# 成员判断使用二分查找 O(log n) 计数直接取数组长度 O(1)
+# 索引是可选的 由配置FLASKY_FOLLOW_INDEX开启 首次使用时从follows表整体加载
+# 之后通过Follow模型的插入/删除事件增量更新 其它进程中的修改通过失效通知(见invalidation.py)按数据库重新读取
+from array import array
+from bisect import bisect_left, insort
+from threading import Lock
+
+from flask import current_app
+
+
+def _contains(ids, value):
+    i = bisect_left(ids, value)
+    return i < len(ids) and ids[i] == value
+
+
+def _insert(ids, value):
+    if not _contains(ids, value):
+        insort(ids, value)
+
+
+def _remove(ids, value):
+    i = bisect_left(ids, value)
+    if i < len(ids) and ids[i] == value:
+        del ids[i]
+
+
+class FollowIndex(object):
+    def __init__(self, app=None):
+        self.followers = {}  # 用户id -> 关注了他的用户id(有序)
+        self.followed = {}   # 用户id -> 他关注的用户id(有序)
+        self.loaded = False
+        self._lock = Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FLASKY_FOLLOW_INDEX', False)
+        # 每次创建程序实例都清空索引 避免沿用其它数据库的数据(例如单元测试)
+        self.clear()
+
+    @property
+    def enabled(self):
+        return current_app.config['FLASKY_FOLLOW_INDEX']
+
+    def clear(self):
+        with self._lock:
+            self.followers = {}
+            self.followed = {}
+            self.loaded = False
+
+    # 从(关注者id, 被关注者id)二元组序列构建索引
+    # 先按用户分组追加 最后统一排序 比逐条insort快得多
+    def build(self, edges):
+        followers, followed = {}, {}
+        for follower_id, followed_id in edges:
+            followed.setdefault(follower_id, array('l')).append(followed_id)
+            followers.setdefault(followed_id, array('l')).append(follower_id)
+        for table in (followers, followed):
+            for user_id, ids in table.items():
+                table[user_id] = array('l', sorted(set(ids)))
+        with self._lock:
+            self.followers = followers
+            self.followed = followed
+            self.loaded = True
+
+    # 从数据库加载 按主键顺序分批读取 内存中只保留整数
+    def load(self):
+        from . import db
+        from .models import Follow
+        query = db.session.query(Follow.follower_id, Follow.followed_id)
+        self.build(query.yield_per(10000))
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            self.load()
+
+    def add(self, follower_id, followed_id):
+        if not self.loaded:
+            return
+        with self._lock:
+            _insert(self.followed.setdefault(follower_id, array('l')), followed_id)
+            _insert(self.followers.setdefault(followed_id, array('l')), follower_id)
+
+    def remove(self, follower_id, followed_id):
+        if not self.loaded:
+            return
+        with self._lock:
+            _remove(self.followed.get(follower_id, array('l')), followed_id)
+            _remove(self.followers.get(followed_id, array('l')), follower_id)
+
+    # 其它进程修改了这些(关注者id, 被关注者id)关系(或本进程的修改被回滚) 按数据库中的当前状态更新索引
+    def refresh(self, *pairs):
+        if not self.loaded or not pairs:
+            return
+        from . import db
+        from .models import Follow
+        statement = db.select([Follow.follower_id, Follow.followed_id]).where(db.or_(
+            *[db.and_(Follow.follower_id == follower_id, Follow.followed_id == followed_id)
+              for follower_id, followed_id in pairs]))
+        # 使用单独的连接读取已提交的数据: 会话回滚的事件中也会调用 这时不能使用会话
+        with db.engine.connect() as conn:
+            existing = set(tuple(row) for row in conn.execute(statement))
+        for follower_id, followed_id in pairs:
+            if (follower_id, followed_id) in existing:
+                self.add(follower_id, followed_id)
+            else:
+                self.remove(follower_id, followed_id)
+
+    def is_following(self, follower_id, followed_id):
+        self.ensure_loaded()
+        return _contains(self.followed.get(follower_id, ()), followed_id)
+
+    def followed_ids(self, user_id):
+        self.ensure_loaded()
+        return self.followed.get(user_id, array('l'))
+
+    def follower_ids(self, user_id):
+        self.ensure_loaded()
+        return self.followers.get(user_id, array('l'))
+
+    def follower_count(self, user_id):
+        return len(self.follower_ids(user_id))
+
+    def followed_count(self, user_id):
+        return len(self.followed_ids(user_id))
+
+    # 估算索引占用的内存(字节) 用于基准测试
+    def memory_usage(self):
+        import sys
+        total = sys.getsizeof(self.followers) + sys.getsizeof(self.followed)
+        for table in (self.followers, self.followed):
+            for ids in table.values():
+                total += sys.getsizeof(ids)
+        return total
@@ -0,0 +1,155 @@
+# 批量导入文章和评论 输入格式为NDJSON(每行一个JSON对象) 与export导出的格式兼容
+# 每条记录用Post/Comment的body_from_json校验 与单条API使用同一套规则
+# markdown渲染交给进程池并行执行 渲染结果直接写入body_html
+# 渲染前先查渲染缓存并去掉重复的正文 只有未渲染过的正文才交给进程池
+# 插入时绕过ORM 每批记录用一条executemany语句插入 每批一个事务
+# 绕过ORM不会触发模型事件: 作者的统计数字和订阅在这里失效 但导入的评论不计入热门文章
+# 站点地图和静态快照的增量生成按时间查找新内容 导入带较早时间的记录后需要加--full重新生成
+import json
+from datetime import datetime
+from functools import partial
+
+from flask import current_app
+
+from . import db, invalidation
+from .exceptions import ValidationError
+from .export import parse_time
+from .feeds import invalidate_feeds
+from .models import Post, Comment, POST_ALLOWED_TAGS, COMMENT_ALLOWED_TAGS
+from .rendering import render_many
+
+
+# 可导入的资源: (模型, 允许的HTML标签)
+IMPORTS = {
+    'posts': (Post, POST_ALLOWED_TAGS),
+    'comments': (Comment, COMMENT_ALLOWED_TAGS),
+}
+
+
+# 解析NDJSON 逐行产生(行号, 对象或错误信息) 空行忽略
+def parse_ndjson(lines):
+    for index, line in enumerate(lines):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            yield index, None, 'invalid json'
+            continue
+        if not isinstance(item, dict):
+            yield index, None, 'item must be a json object'
+            continue
+        yield index, item, None
+
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# 把一条记录转换成待插入的行 校验失败抛出ValidationError
+def _make_row(resource, item, author_id):
+    model = IMPORTS[resource][0]
+    timestamp = item.get('timestamp')
+    if timestamp is not None and not isinstance(timestamp, str):
+        raise ValidationError('invalid timestamp: %r' % (timestamp,))
+    row = {
+        'body': model.body_from_json(item),
+        'timestamp': parse_time(timestamp) or datetime.utcnow(),
+        'author_id': author_id if author_id is not None else item.get('author_id'),
+    }
+    if row['author_id'] is None:
+        raise ValidationError('%s does not have an author' % resource[:-1])
+    # bool是int的子类 也不接受
+    if not isinstance(row['author_id'], int) or isinstance(row['author_id'], bool):
+        raise ValidationError('invalid author_id')
+    if resource == 'comments':
+        row['post_id'] = item.get('post_id')
+        if not isinstance(row['post_id'], int) or isinstance(row['post_id'], bool):
+            raise ValidationError('comment does not have a post_id')
+        row['disabled'] = bool(item.get('disabled', False))
+    return row
+
+
+# 导入一批记录 返回每条记录的结果
+def import_batch(resource, batch, author_id=None, pool=None):
+    model, allowed_tags = IMPORTS[resource]
+    results, rows = [], []
+    for index, item, error in batch:
+        if error is None:
+            try:
+                rows.append((index, _make_row(resource, item, author_id)))
+                continue
+            except ValidationError as e:
+                error = e.args[0]
+        results.append({'index': index, 'status': 'error', 'message': error})
+
+    # 评论引用的文章必须存在 一次查询检查整批
+    if resource == 'comments' and rows:
+        post_ids = set(row['post_id'] for _, row in rows)
+        existing = set(id for (id,) in db.session.query(Post.id).filter(Post.id.in_(post_ids)))
+        for index, row in rows:
+            if row['post_id'] not in existing:
+                results.append({'index': index, 'status': 'error', 'message': 'post not found'})
+        rows = [(index, row) for index, row in rows if row['post_id'] in existing]
+
+    if rows:
+        bodies = [row['body'] for _, row in rows]
+        rendered = render_many(bodies, allowed_tags,
+                map=partial(pool.map, chunksize=32) if pool is not None else map)
+        for (_, row), html in zip(rows, rendered):
+            row['body_html'] = html
+        try:
+            db.session.execute(model.__table__.insert(), [row for _, row in rows])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            current_app.logger.exception('import batch failed')
+            results.extend({'index': index, 'status': 'error', 'message': 'database error'}
+                           for index, _ in rows)
+        else:
+            # 绕过ORM插入不会触发模型事件 在这里让作者的统计数字和订阅失效
+            author_ids = set(row['author_id'] for _, row in rows)
+            invalidation.publish('profile', *author_ids)
+            if resource == 'posts':
+                for id in author_ids:
+                    invalidate_feeds(id)
+            results.extend({'index': index, 'status': 'ok'} for index, _ in rows)
+    return sorted(results, key=lambda result: result['index'])
+
+
+# 导入NDJSON 按batch_size分批 每批一个事务
+# author_id不为空时所有记录都属于该用户 否则使用每条记录中的author_id
+# workers大于1时使用进程池渲染markdown
+def import_ndjson(resource, lines, author_id=None, batch_size=None, workers=None):
+    if resource not in IMPORTS:
+        raise ValidationError('unknown resource: %s' % resource)
+    batch_size = batch_size or current_app.config['FLASKY_IMPORT_BATCH_SIZE']
+    if workers is None:
+        workers = current_app.config['FLASKY_IMPORT_WORKERS']
+    pool = None
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        pool = ProcessPoolExecutor(max_workers=workers)
+    results = []
+    try:
+        for batch in _batches(parse_ndjson(lines), batch_size):
+            results.extend(import_batch(resource, batch, author_id, pool))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return results
+
+
+def summarize(results):
+    imported = sum(1 for result in results if result['status'] == 'ok')
+    return {'imported': imported, 'failed': len(results) - imported}
@@ -0,0 +1,144 @@
+# 跨进程的缓存失效通知
+# 进程内的缓存(资料页统计 订阅 关注索引等)只在写操作所在的进程中立即失效 其它工作进程要等到缓存过期
+# 这里把失效的键写入本机共享存储(local_store)的invalidations表 各工作进程定期读取新增的记录 删除自己缓存中的对应项
+#   写入: 模型事件中调用invalidate()或defer() 键先记在数据库会话中 会话提交后才写入
+#         回滚时不通知其它进程 但在本进程中再失效一次(关注索引按数据库重新读取) 撤销模型事件中按未提交的数据做的修改
+#         绕过ORM的批量操作(导入 归档)提交后直接调用publish()
+#   读取: 每个请求开始时 距上次读取超过FLASKY_INVALIDATION_POLL_INTERVAL秒就读取一次 只是一条按主键范围的查询
+#         跳过本进程自己写入的记录(本进程已经失效过了)
+#   清理: 超过FLASKY_INVALIDATION_RETENTION秒的记录被删除 超过这么久没有读取的进程(例如长时间空闲)清空所有缓存
+# 缓存用register(名字, evict, clear)登记 evict(*键)删除这些键 clear()清空整个缓存 键必须能序列化成JSON(元组读出后还原为元组)
+# 共享存储只在一台机器上共享 多台机器部署时其它机器仍然依靠缓存的过期时间
+import json
+import os
+import time
+from threading import Lock
+
+from flask import current_app
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS invalidations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    cache TEXT NOT NULL,
+    key TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+'''
+
+
+# JSON没有元组 读出的列表还原为元组(缓存的键只会是元组)
+def _as_key(value):
+    if isinstance(value, list):
+        return tuple(_as_key(item) for item in value)
+    return value
+
+
+class InvalidationBus(object):
+    def __init__(self, store, app=None):
+        self.store = store
+        store.register_schema(SCHEMA)
+        self.caches = {}
+        self.last_id = None
+        self.last_poll = 0
+        self.last_prune = 0
+        self.pid = None
+        self._lock = Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FLASKY_INVALIDATION_POLL_INTERVAL', 0.5)
+        app.config.setdefault('FLASKY_INVALIDATION_RETENTION', 600)
+        # 新的程序实例的缓存是空的 下次读取时从当前位置开始
+        self.last_id = None
+        app.before_request(self.before_request)
+
+    def register(self, name, evict, clear):
+        self.caches[name] = (evict, clear)
+
+    # 立即删除本进程缓存中的这些键 会话提交后通知其它进程
+    def invalidate(self, session, name, *keys):
+        self.caches[name][0](*keys)
+        self.defer(session, name, *keys)
+
+    # 只在会话提交后通知其它进程 本进程自己更新缓存(例如关注索引在模型事件中直接修改)
+    def defer(self, session, name, *keys):
+        session.info.setdefault('invalidations', []).extend((name, key) for key in keys)
+
+    def on_commit(self, session):
+        invalidations = session.info.pop('invalidations', None)
+        if invalidations:
+            self.send(invalidations)
+
+    def on_rollback(self, session):
+        invalidations = session.info.pop('invalidations', None)
+        if invalidations:
+            self.evict(invalidations)
+
+    # 删除本进程缓存中的这些键并立即通知其它进程 在数据库提交之后调用
+    def publish(self, name, *keys):
+        if not keys:
+            return
+        self.caches[name][0](*keys)
+        self.send([(name, key) for key in keys])
+
+    # 删除本进程缓存中的(缓存名, 键)列表 同一个缓存的键一起删除
+    def evict(self, invalidations):
+        keys = {}
+        for name, key in invalidations:
+            if name in self.caches:
+                keys.setdefault(name, []).append(key)
+        for name, values in keys.items():
+            self.caches[name][0](*values)
+
+    # 写入(缓存名, 键)列表 顺便删除过期的记录
+    def send(self, invalidations):
+        now = time.time()
+        pid = os.getpid()
+        rows = set((name, json.dumps(key)) for name, key in invalidations)
+        with self.store.transaction() as conn:
+            conn.executemany('INSERT INTO invalidations (cache, key, pid, created_at) '
+                             'VALUES (?, ?, ?, ?)', [row + (pid, now) for row in sorted(rows)])
+            if now - self.last_prune >= 60:
+                self.last_prune = now
+                conn.execute('DELETE FROM invalidations WHERE created_at < ?',
+                             (now - current_app.config['FLASKY_INVALIDATION_RETENTION'],))
+
+    # 读取其它进程新写入的记录 删除本进程缓存中的对应项 返回处理的记录数
+    def poll(self):
+        if not self._lock.acquire(False):
+            # 其它线程正在读取
+            return 0
+        try:
+            return self._poll()
+        finally:
+            self._lock.release()
+
+    def _poll(self):
+        now = time.time()
+        conn = self.store.connect()
+        if self.last_id is None or self.pid != os.getpid():
+            # 刚启动(或刚fork出来)的进程 缓存还是空的
+            self.last_id = conn.execute('SELECT MAX(id) FROM invalidations').fetchone()[0] or 0
+            self.pid = os.getpid()
+            self.last_poll = now
+            return 0
+        rows = conn.execute('SELECT id, cache, key, pid FROM invalidations WHERE id > ? '
+                            'ORDER BY id', (self.last_id,)).fetchall()
+        if now - self.last_poll > current_app.config['FLASKY_INVALIDATION_RETENTION']:
+            # 期间的记录可能已经删除 不知道哪些键失效了
+            for evict, clear in self.caches.values():
+                clear()
+        else:
+            self.evict([(name, _as_key(json.loads(key))) for id, name, key, pid in rows
+                        if pid != self.pid])
+        if rows:
+            self.last_id = rows[-1][0]
+        self.last_poll = now
+        return len(rows)
+
+    def before_request(self):
+        if time.time() - self.last_poll >= \
+                current_app.config['FLASKY_INVALIDATION_POLL_INTERVAL']:
+            self.poll()
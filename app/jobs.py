@@ -0,0 +1,242 @@
+# 后台任务队列
+# 任务保存在本机共享存储(local_store)的jobs表中 请求中入队只是一条INSERT语句 不等待任务执行
+# 由manage.py worker启动的工作进程领取并执行任务:
+#   优先级: 数字大的先执行 同优先级按入队顺序
+#   并发限制: 每个队列同时执行的任务数不超过FLASKY_JOB_QUEUES中的设置
+#   可见性超时: 领取后超过timeout秒还没有完成(例如工作进程崩溃或卡住)的任务 按失败处理 和抛出异常一样重试
+#   重试: 任务失败时延迟一段时间后重试(每次加倍) 超过最大次数后标记为failed 保留在表中供排查
+# 执行成功的任务直接从表中删除
+# 任务函数用@jobs.task注册 调用 函数.delay(参数) 入队 参数必须能序列化成JSON
+import importlib
+import json
+import os
+import signal
+import socket
+import time
+import traceback
+from multiprocessing import Event, Process
+
+from flask import current_app
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    queue TEXT NOT NULL,
+    task TEXT NOT NULL,
+    args TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    timeout REAL NOT NULL,
+    run_at REAL NOT NULL,
+    locked_until REAL,
+    locked_by TEXT,
+    error TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_ready ON jobs (status, priority, id);
+'''
+
+
+class Task(object):
+    def __init__(self, queue, func, name, queue_name, priority, max_attempts, timeout):
+        self.jobs = queue
+        self.func = func
+        self.name = name
+        self.queue = queue_name
+        self.priority = priority
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.__doc__ = func.__doc__
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    # 入队 返回任务id
+    def delay(self, *args, **kwargs):
+        return self.jobs.enqueue(self, args, kwargs)
+
+    # 指定优先级或延迟执行时间(秒)
+    def apply_async(self, args=(), kwargs=None, priority=None, countdown=0):
+        return self.jobs.enqueue(self, args, kwargs or {}, priority=priority, countdown=countdown)
+
+
+class JobQueue(object):
+    def __init__(self, store, app=None):
+        self.store = store
+        store.register_schema(SCHEMA)
+        self.tasks = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # 队列名 -> 同时执行的最大任务数 没有列出的队列使用default的设置
+        app.config.setdefault('FLASKY_JOB_QUEUES', {'default': 4, 'mail': 2})
+        app.config.setdefault('FLASKY_JOB_RETRY_DELAY', 10)
+        app.config.setdefault('FLASKY_JOB_POLL_INTERVAL', 0.5)
+        app.config.setdefault('FLASKY_USE_JOBS', False)
+
+    def task(self, queue='default', priority=0, max_attempts=3, timeout=300):
+        def decorator(func):
+            name = '%s.%s' % (func.__module__, func.__name__)
+            task = Task(self, func, name, queue, priority, max_attempts, timeout)
+            self.tasks[name] = task
+            return task
+        return decorator
+
+    def get_task(self, name):
+        if name not in self.tasks:
+            # 工作进程中可能还没有导入定义任务的模块
+            importlib.import_module(name.rsplit('.', 1)[0])
+        return self.tasks[name]
+
+    def enqueue(self, task, args=(), kwargs=None, priority=None, countdown=0):
+        now = time.time()
+        with self.store.transaction() as conn:
+            cursor = conn.execute(
+                'INSERT INTO jobs (queue, task, args, priority, max_attempts, timeout, run_at, '
+                'created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (task.queue, task.name, json.dumps([list(args), kwargs or {}]),
+                 task.priority if priority is None else priority, task.max_attempts,
+                 task.timeout, now + countdown, now))
+            return cursor.lastrowid
+
+    # 领取一个可以执行的任务 返回任务信息的字典 没有时返回None
+    def claim(self, queues=None, worker=None):
+        now = time.time()
+        limits = current_app.config['FLASKY_JOB_QUEUES']
+        worker = worker or '%s:%d' % (socket.gethostname(), os.getpid())
+        delay = current_app.config['FLASKY_JOB_RETRY_DELAY']
+        with self.store.transaction() as conn:
+            # 超时的任务: 次数用完的标记为failed 否则延迟后重试(和fail()相同)
+            # 不能直接重新领取 否则使工作进程崩溃或卡住的任务会一直重复执行 并一直占用并发数
+            conn.execute("UPDATE jobs SET status = 'failed', locked_until = NULL, "
+                         "error = 'visibility timeout: ' || locked_by "
+                         "WHERE status = 'running' AND locked_until < ? AND attempts >= max_attempts",
+                         (now,))
+            conn.execute("UPDATE jobs SET status = 'queued', locked_until = NULL, "
+                         "run_at = ? + ? * (1 << (attempts - 1)), "
+                         "error = 'visibility timeout: ' || locked_by "
+                         "WHERE status = 'running' AND locked_until < ?", (now, delay, now))
+            running = dict(conn.execute(
+                "SELECT queue, COUNT(*) FROM jobs WHERE status = 'running' AND locked_until >= ? "
+                "GROUP BY queue", (now,)).fetchall())
+            # 已经达到并发上限的队列
+            full = [queue for queue, count in running.items()
+                    if count >= limits.get(queue, limits.get('default', 1))]
+            sql = "SELECT id, queue, task, args, attempts, max_attempts, timeout FROM jobs " \
+                  "WHERE status = 'queued' AND run_at <= ?"
+            params = [now]
+            if queues:
+                sql += ' AND queue IN (%s)' % ','.join('?' * len(queues))
+                params += list(queues)
+            if full:
+                sql += ' AND queue NOT IN (%s)' % ','.join('?' * len(full))
+                params += full
+            sql += ' ORDER BY priority DESC, id LIMIT 1'
+            row = conn.execute(sql, params).fetchone()
+            if row is None:
+                return None
+            id, queue, task, args, attempts, max_attempts, timeout = row
+            conn.execute("UPDATE jobs SET status = 'running', attempts = attempts + 1, "
+                         "locked_until = ?, locked_by = ? WHERE id = ?",
+                         (now + timeout, worker, id))
+        args, kwargs = json.loads(args)
+        return {'id': id, 'queue': queue, 'task': task, 'args': args, 'kwargs': kwargs,
+                'attempts': attempts + 1, 'max_attempts': max_attempts}
+
+    def complete(self, job):
+        with self.store.transaction() as conn:
+            conn.execute('DELETE FROM jobs WHERE id = ?', (job['id'],))
+
+    def fail(self, job, error):
+        if job['attempts'] >= job['max_attempts']:
+            with self.store.transaction() as conn:
+                conn.execute("UPDATE jobs SET status = 'failed', locked_until = NULL, error = ? "
+                             "WHERE id = ?", (error, job['id']))
+            return
+        delay = current_app.config['FLASKY_JOB_RETRY_DELAY'] * 2 ** (job['attempts'] - 1)
+        with self.store.transaction() as conn:
+            conn.execute("UPDATE jobs SET status = 'queued', locked_until = NULL, run_at = ?, "
+                         "error = ? WHERE id = ?", (time.time() + delay, error, job['id']))
+
+    # 领取并执行一个任务 没有可执行的任务时返回False
+    # 任务在程序上下文中执行 成功后提交数据库会话
+    def run_one(self, queues=None, worker=None):
+        from . import db
+        job = self.claim(queues, worker)
+        if job is None:
+            return False
+        try:
+            self.get_task(job['task'])(*job['args'], **job['kwargs'])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            current_app.logger.exception('job %d (%s) failed', job['id'], job['task'])
+            self.fail(job, traceback.format_exc())
+        else:
+            self.complete(job)
+        finally:
+            db.session.remove()
+        return True
+
+    # 工作进程的主循环 没有任务时等待FLASKY_JOB_POLL_INTERVAL秒
+    # max_jobs不为None时执行这么多任务后返回(测试和一次性运行使用)
+    def work(self, queues=None, max_jobs=None, stop=None):
+        done = 0
+        while max_jobs is None or done < max_jobs:
+            if stop is not None and stop():
+                break
+            if self.run_one(queues):
+                done += 1
+            elif max_jobs is not None:
+                break
+            else:
+                time.sleep(current_app.config['FLASKY_JOB_POLL_INTERVAL'])
+        return done
+
+    # 各队列各状态的任务数
+    def stats(self):
+        conn = self.store.connect()
+        return [{'queue': queue, 'status': status, 'count': count} for queue, status, count in
+                conn.execute('SELECT queue, status, COUNT(*) FROM jobs GROUP BY queue, status '
+                             'ORDER BY queue, status').fetchall()]
+
+
+# 工作进程: 创建自己的程序实例 循环执行任务直到stop被设置
+# 忽略SIGINT 由主进程统一通知停止 正在执行的任务会先完成
+def _worker_main(config_name, queues, stop):
+    from . import create_app, jobs
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    app = create_app(config_name, blueprints=[])
+    with app.app_context():
+        jobs.work(queues, stop=stop.is_set)
+
+
+# 启动processes个工作进程 意外退出的进程会被重新启动 收到SIGINT或SIGTERM时等待所有进程完成当前任务后退出
+def run_workers(config_name, processes, queues=None):
+    stop = Event()
+    # 信号处理函数中只记下收到了信号 在其中调用stop.set()可能和主循环争用同一个锁
+    stopping = []
+
+    def shutdown(signum, frame):
+        stopping.append(signum)
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    def start():
+        process = Process(target=_worker_main, args=(config_name, queues, stop))
+        process.start()
+        return process
+
+    workers = [start() for _ in range(processes)]
+    while not stopping:
+        for i, process in enumerate(workers):
+            if not process.is_alive():
+                workers[i] = start()
+        time.sleep(1)
+    stop.set()
+    for process in workers:
+        process.join()
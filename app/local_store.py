@@ -0,0 +1,55 @@
+# 本机共享存储
+# 同一台机器上的多个工作进程通过一个SQLite文件共享少量状态(例如浏览计数的写缓冲)
+# 各模块在导入时用register_schema注册自己的建表语句(CREATE TABLE IF NOT EXISTS)
+# 每个线程使用自己的连接 写操作在BEGIN IMMEDIATE事务中进行 多个进程同时写时依次等待
+# 使用WAL日志模式 读操作不会被写操作阻塞
+# 配置FLASKY_LOCAL_STORE为文件路径 设置为:memory:时只在当前线程内有效(用于单元测试)
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class LocalStore(object):
+    def __init__(self, app=None):
+        self.path = None
+        self.schemas = []
+        self._local = threading.local()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FLASKY_LOCAL_STORE',
+                os.path.join(os.path.dirname(app.root_path), 'tmp', 'local.sqlite'))
+        self.path = app.config['FLASKY_LOCAL_STORE']
+        # 丢弃已有的连接 下次使用时按新的路径重新连接
+        self._local = threading.local()
+
+    def register_schema(self, sql):
+        self.schemas.append(sql)
+
+    def connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if self.path != ':memory:':
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            # isolation_level=None: 不让sqlite3模块隐式开始事务 由transaction()显式控制
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            if self.path != ':memory:':
+                conn.execute('PRAGMA journal_mode=WAL')
+            for sql in self.schemas:
+                conn.executescript(sql)
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        conn = self.connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except:
+            conn.execute('ROLLBACK')
+            raise
+        else:
+            conn.execute('COMMIT')
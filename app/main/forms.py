@@ -58,3 +58,19 @@ class PostForm(FlaskForm):
 class CommentForm(FlaskForm):
     body = StringField('评论', validators=[Required()])
     submit = SubmitField('提交')
+
+
+# 批量审核评论表单
+# 选中的评论id由模板中的复选框提交 不在表单类中定义
+class ModerateForm(FlaskForm):
+    action = SelectField('操作', choices=[('disable', '禁用'), ('enable', '开启')])
+    scope = SelectField('范围', choices=[('selected', '选中的评论'),
+            ('author', '该用户的所有评论'), ('keyword', '内容包含关键字的评论')])
+    author = StringField('用户名', validators=[Length(0,64)])
+    keyword = StringField('关键字', validators=[Length(0,64)])
+    submit = SubmitField('执行')
+
+    # 按关键字审核时关键字不能为空 否则会改为处理选中的评论
+    def validate_keyword(self, field):
+        if self.scope.data == 'keyword' and not (field.data or '').strip():
+            raise ValidationError('请输入关键字')
@@ -4,10 +4,13 @@ from flask import session, flash, request, current_app
 from flask_login import login_required, current_user
 
 from . import main
-from .forms import EditProfileForm, EditProfileAdminForm, PostForm, CommentForm
-from .. import db
-from ..models import Permission, User, Post, Comment
+from .forms import EditProfileForm, EditProfileAdminForm, PostForm, CommentForm, ModerateForm
+from .. import db, view_counter, trending
+from ..models import Permission, User, Post, Comment, ArchivedComment
+from ..archive import get_post_or_404
 from ..email import send_email
+from ..feeds import FORMATS, feed_response
+from ..sitemap import INDEX, chunk_filename, send_sitemap
 from ..decorators import admin_required, permission_required
 
 @main.route('/', methods=['GET', 'POST'])
@@ -34,6 +37,12 @@ def index():
         query = Post.query
     elif show_pages == 2:
         query = current_user.posts
+    elif show_pages == 3:
+        # 热门文章直接取内存中的排行 不查询和排序全部文章
+        return render_template('index.html', form=form,
+                posts=trending.top_posts(current_app.config['FLASKY_POSTS_PER_PAGE']),
+                show_pages=show_pages, pagination=None,
+                suggestions=current_user.suggested_users())
     
 
     # 要显示某页中的记录 要把all换成()换成Flask-SQLAlchemy提供的paginate()方法
@@ -46,7 +55,8 @@ def index():
     # posts = Post.query.order_by(Post.timestamp.desc()).all()
     posts = pagination.items
     return render_template('index.html', form=form, posts=posts, 
-            show_pages=show_pages, pagination=pagination)
+            show_pages=show_pages, pagination=pagination,
+            suggestions=current_user.suggested_users())
     
 
 # 资料页面
@@ -54,11 +64,42 @@ def index():
 def user(username):
     user = User.query.filter_by(username=username).first()
     if user is None:
-        about(404)
+        abort(404)
     # 可以简写为
     # user = User.query.filter_by(username=username).first_or_404()
-    posts = user.posts.order_by(Post.timestamp.desc()).all()
-    return render_template('user.html', user=user, posts=posts)
+    page = request.args.get('page', 1, type=int)
+    pagination = user.posts.order_by(Post.timestamp.desc()).paginate(
+            page, per_page=current_app.config['FLASKY_POSTS_PER_PAGE'], error_out=False)
+    posts = pagination.items
+    # 一次查询得到当前用户与该用户的双向关注状态
+    following, followed_by = current_user.follow_states([user])
+    return render_template('user.html', user=user, posts=posts, pagination=pagination,
+            stats=user.profile_stats(),
+            is_following=user.id in following, is_followed_by=user.id in followed_by,
+            suggestions=current_user.suggested_users() if user == current_user else [])
+
+# 订阅 默认为Atom格式 ?format=rss返回RSS格式
+@main.route('/feed')
+def feed():
+    format = request.args.get('format', 'atom')
+    if format not in FORMATS:
+        abort(404)
+    return feed_response(format)
+
+
+@main.route('/user/<username>/feed')
+def user_feed(username):
+    user = User.query.filter_by(username=username).first_or_404()
+    format = request.args.get('format', 'atom')
+    if format not in FORMATS:
+        abort(404)
+    return feed_response(format, user)
+
+# 站点地图 由manage.py sitemap预先生成
+@main.route('/sitemap.xml')
+@main.route('/sitemap-<name>.xml')
+def sitemap(name=None):
+    return send_sitemap(chunk_filename(name) if name is not None else INDEX)
 
 # 修改个人信息
 @main.route('/edit-profile', methods=['GET', 'POST'])
@@ -110,17 +151,23 @@ def edit_profile_admin(id):
 # 每篇文章一个对应连接 使用文章在数据库中的id
 @main.route('/post/<int:id>', methods=['GET', 'POST'])
 def post(id):
-    post = Post.query.get_or_404(id)
-    form = CommentForm()
-    if form.validate_on_submit():
+    # 主数据库中没有时从归档数据库读取 归档的文章只读 不能评论 也不再计浏览数
+    post = get_post_or_404(id)
+    form = CommentForm() if not post.archived else None
+    if form is not None and form.validate_on_submit():
         comment = Comment(body=form.body.data, post=post, author=current_user._get_current_object())
         db.session.add(comment)
         flash('评论成功')
         return redirect(url_for('.post', id=post.id, page=-1))
+    if not post.archived:
+        # 浏览计数只在进程内加一 由view_counter定期批量写入数据库
+        view_counter.incr(post.id)
+        trending.record(post.id, 'view')
     page = request.args.get('page', 1, type=int)
     if page == -1:
         page = (post.comments.count()-1) // current_app.config['FLASKY_COMMENTS_PER_PAGE'] + 1
-    pagination = post.comments.order_by(Comment.timestamp.asc()).paginate(page, 
+    comment_model = ArchivedComment if post.archived else Comment
+    pagination = post.comments.order_by(comment_model.timestamp.asc()).paginate(page, 
             per_page=current_app.config['FLASKY_COMMENTS_PER_PAGE'], error_out=False)
     comments = pagination.items
     return render_template('post.html', posts=[post], form=form, comments=comments, pagination=pagination)
@@ -183,8 +230,10 @@ def followers(username):
     page = request.args.get('page', 1, type=int)
     pagination = user.followers.paginate(page, per_page=current_app.config['FLASKY_FOLLOWERS_PER_PAGE'], error_out=False)
     follows = [{'user':item.follower, 'timestamp':item.timestamp} for item in pagination.items]
+    # 整页用户的关注状态一次查出 避免模板中逐行查询
+    following, followed_by = current_user.follow_states([item['user'] for item in follows])
     return render_template('followers.html', user=user, title='Followers of', endpoint='.followers',
-            pagination=pagination, follows=follows)
+            pagination=pagination, follows=follows, following=following, followed_by=followed_by)
 
 @main.route('/followed-by/<username>')
 def followed_by(username):
@@ -194,9 +243,11 @@ def followed_by(username):
         return redirect(url_for('.index'))
     page = request.args.get('page', 1, type=int)
     pagination = user.followed.paginate(page, per_page=current_app.config['FLASKY_FOLLOWERS_PER_PAGE'], error_out=False)
-    follows = [{'user': item.follower, 'timestamp': item.timestamp} for item in pagination.items]
+    # user.followed中每一项的follower都是user自己 列表中要显示的是被关注的用户
+    follows = [{'user': item.followed, 'timestamp': item.timestamp} for item in pagination.items]
+    following, followed_by = current_user.follow_states([item['user'] for item in follows])
     return render_template('followers.html', user=user, title='Followed by', endpoint='.followed_by',
-            pagination=pagination, follows=follows)
+            pagination=pagination, follows=follows, following=following, followed_by=followed_by)
 
 
 # cookie只能在响应对象中设置 因此这两个路由不能依赖Flask
@@ -226,15 +277,48 @@ def show_myself():
     return resp
 
 
-@main.route('/moderate')
+@main.route('/trending')
+@login_required
+def show_trending():
+    resp = make_response(redirect(url_for('.index')))
+    resp.set_cookie('show_pages', '3', max_age=30*24*60*60)
+    return resp
+
+
+@main.route('/moderate', methods=['GET', 'POST'])
 @login_required
 @permission_required(Permission.MODERATE_COMMENTS)
 def moderate():
     page = request.args.get('page', 1, type=int)
+    form = ModerateForm()
+    if form.validate_on_submit():
+        # 批量审核 所有选中的评论用一条UPDATE语句完成
+        disabled = form.action.data == 'disable'
+        if form.scope.data == 'author':
+            author = User.query.filter_by(username=form.author.data).first()
+            if author is None:
+                flash('不存在此用户')
+                return redirect(url_for('.moderate', page=page))
+            count = Comment.moderate(disabled, author_id=author.id)
+        elif form.scope.data == 'keyword':
+            if not form.keyword.data:
+                flash('请输入关键字')
+                return redirect(url_for('.moderate', page=page))
+            count = Comment.moderate(disabled, body_contains=form.keyword.data)
+        else:
+            count = Comment.moderate(disabled, ids=request.form.getlist('ids', type=int))
+        flash('已更新 %d 条评论' % count)
+        return redirect(url_for('.moderate', page=page))
+    if form.errors:
+        # 页面上没有显示表单错误的位置 改为提示
+        for errors in form.errors.values():
+            flash(errors[0])
+        return redirect(url_for('.moderate', page=page))
     pagination = Comment.query.order_by(Comment.timestamp.desc()).paginate(page,
             per_page=current_app.config['FLASKY_COMMENTS_PER_PAGE'], error_out=False)
     comments = pagination.items
-    return render_template('moderate.html', comments=comments, pagination=pagination, page=page)
+    return render_template('moderate.html', comments=comments, pagination=pagination, page=page,
+            form=form)
 
 
 @main.route('/moderate/enable/<int:id>')
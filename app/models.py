@@ -1,4 +1,5 @@
 # 数据库对象模型
+import calendar
 import hashlib
 from datetime import datetime
 
@@ -8,11 +9,19 @@ from flask import current_app, request, jsonify, url_for
 from werkzeug.security import generate_password_hash, check_password_hash
 # 生成令牌
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
-from markdown import markdown
-import bleach
 
-from . import db, login_manager
+from . import db, login_manager, follow_index, profile_cache, view_counter, trending, \
+        invalidation
 from .exceptions import ValidationError
+from .rendering import render_cached
+
+
+# 生成令牌用的序列化对象
+# expiration为None时只用于解码令牌 过期时间记录在令牌中
+def serializer(expiration=None):
+    if expiration is None:
+        return Serializer(current_app.config['SECRET_KEY'])
+    return Serializer(current_app.config['SECRET_KEY'], expires_in=expiration)
 
 
 '''
@@ -31,6 +40,13 @@ from .exceptions import ValidationError
  协管员     0b00001111(0x0f)    增加审查不当评论的权限
  管理员     0b11111111(0xff)    具有所有权限 包括修改其他用户所属角色的权限
 '''
+# 把模型转换成json时使用 每个字段对应一个求值函数
+# 只有fields中列出且不在exclude中的字段才会被求值 不需要的计数等查询就不会执行
+def select_fields(getters, fields=None, exclude=()):
+    return dict((name, getter()) for name, getter in getters.items()
+                if (fields is None or name in fields) and name not in exclude)
+
+
 class Permission:
     FOLLOW = 0x01
     COMMENT = 0x02
@@ -82,6 +98,39 @@ class Follow(db.Model):
     followed_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # 关注关系写入或删除数据库时 双方资料页的统计数字失效
+    # 进程内的关注索引只反映已提交的关系: 变化先记在会话中 提交后再更新索引 回滚时丢弃
+    # 提交后通知其它进程(见invalidation.py)
+    @staticmethod
+    def on_inserted(mapper, connection, target):
+        Follow.on_changed(target, True)
+
+    @staticmethod
+    def on_deleted(mapper, connection, target):
+        Follow.on_changed(target, False)
+
+    @staticmethod
+    def on_changed(target, added):
+        session = db.object_session(target)
+        session.info.setdefault('follow_changes', []).append(
+                (target.follower_id, target.followed_id, added))
+        invalidation.defer(session, 'follow', (target.follower_id, target.followed_id))
+        invalidation.invalidate(session, 'profile', target.follower_id, target.followed_id)
+
+db.event.listen(Follow, 'after_insert', Follow.on_inserted)
+db.event.listen(Follow, 'after_delete', Follow.on_deleted)
+
+
+# 推荐关注模型
+# 由批处理任务(app/recommend.py)定期预先计算 每个用户保存前N个推荐
+# 主键(user_id, rank)同时就是读取时使用的索引 一次有序的范围查询即可取出
+class Suggestion(db.Model):
+    __tablename__ = 'suggestions'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    suggested_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    score = db.Column(db.Float)
+
 
 
 '''
@@ -179,13 +228,13 @@ class User(UserMixin, db.Model):
     '''
     def generate_confirmation_token(self, expiration=3600):
         # 参数: 密钥 令牌过期时间(s)
-        s = Serializer(current_app.config['SECRET_KEY'], expiration)
+        s = serializer(expiration)
         # dumps()方法为指定的数据生成一个加密前面 然后再对数据和签名进行序列化 生成令牌字符串
         return s.dumps({'confirm':self.id})
 
     # 验证令牌
     def confirm(self, token):
-        s = Serializer(current_app.config['SECRET_KEY'])
+        s = serializer()
         try:
             # 为了解码令牌 序列化对象提供了loads()方法 其唯一参数是令牌字符串
             # 这个方法会检验签名和过期时间 如果通过返回原始数据
@@ -202,12 +251,12 @@ class User(UserMixin, db.Model):
 
     # 生成重置密码的令牌    
     def generate_reset_token(self, expiration=3600):
-        s = Serializer(current_app.config['SECRET_KEY'], expiration)
+        s = serializer(expiration)
         return s.dumps({'reset':self.id})
 
     # 重置密码
     def reset_password(self, token, new_password):
-        s = Serializer(current_app.config['SECRET_KEY'])
+        s = serializer()
         try:
             data = s.loads(token)
         except:
@@ -220,12 +269,12 @@ class User(UserMixin, db.Model):
 
     # 生成更换邮箱的令牌
     def generate_email_change_token(self, new_email, expiration=3600):
-        s = Serializer(current_app.config['SECRET_KEY'], expiration)
+        s = serializer(expiration)
         return s.dumps({'change_email':self.id, 'new_email':new_email})
 
     # 更换邮箱
     def change_email(self, token):
-        s = Serializer(current_app.config['SECRET_KEY'])
+        s = serializer()
         try:
             data = s.loads(token)
         except:
@@ -244,14 +293,14 @@ class User(UserMixin, db.Model):
     
     # 生成验证令牌
     def generate_auth_token(self, expiration):
-        s = Serializer(current_app.config['SECRET_KEY'], expires_in=expiration)
+        s = serializer(expiration)
         return s.dumps({'id': self.id}).decode('ascii')
 
     # 设置为静态方法 因为在解码之前 不知道是对象是谁
     # 所以没有调用函数的对象  所以设置为静态方法
     @staticmethod
     def verify_auth_token(token):
-        s = Serializer(current_app.config['SECRET_KEY'])
+        s = serializer()
         try:
             data = s.loads(token)
         except:
@@ -331,12 +380,89 @@ class User(UserMixin, db.Model):
         if f:
             db.session.delete(f)
 
+    # 开启关注索引后 关注判断和计数直接在内存中完成
+    # 索引只包含已提交的关注关系 会话中有未提交的关注变化时查询数据库 保证结果包含这些变化
+    def _use_follow_index(self, *users):
+        if not follow_index.enabled:
+            return False
+        if any(u.id is None for u in (self,) + users):
+            return False
+        session = db.session()
+        if session.info.get('follow_changes') or any(
+                isinstance(obj, Follow) for obj in list(session.new) + list(session.deleted)):
+            return False
+        return True
+
     def is_following(self, user):
+        if self._use_follow_index(user):
+            return follow_index.is_following(self.id, user.id)
         return self.followed.filter_by(followed_id=user.id).first() is not None
 
     def is_followed_by(self, user):
+        if self._use_follow_index(user):
+            return follow_index.is_following(user.id, self.id)
         return self.followers.filter_by(follower_id=user.id).first() is not None
 
+    # 粉丝数
+    def follower_count(self):
+        if self._use_follow_index():
+            return follow_index.follower_count(self.id)
+        return self.followers.count()
+
+    # 关注数
+    def followed_count(self):
+        if self._use_follow_index():
+            return follow_index.followed_count(self.id)
+        return self.followed.count()
+
+    # 资料页头部的统计数字: 文章数 评论数 粉丝数 关注数
+    # 四个计数在一次查询中完成 结果缓存在profile_cache中
+    # 文章 评论 关注关系写入或删除时对应用户的缓存失效(见各模型的事件监听)
+    # 缓存中保存原始计数 关注自己的用户在这里减去自己
+    def profile_stats(self):
+        stats = profile_cache.get(self.id) if self.id is not None else None
+        if stats is None:
+            def count(column):
+                return db.session.query(db.func.count()).filter(column == self.id).as_scalar()
+            columns = [count(Post.author_id), count(Comment.author_id)]
+            use_index = self._use_follow_index()
+            if not use_index:
+                columns += [count(Follow.followed_id), count(Follow.follower_id)]
+            row = list(db.session.query(*columns).one())
+            if use_index:
+                row += [self.follower_count(), self.followed_count()]
+            stats = dict(zip(('post_count', 'comment_count', 'follower_count', 'followed_count'),
+                             row))
+            if self.id is not None:
+                profile_cache.set(self.id, stats)
+        stats = dict(stats)
+        if self.follow_self:
+            stats['follower_count'] -= 1
+            stats['followed_count'] -= 1
+        return stats
+
+    # 批量查询当前用户与一组用户之间的关注关系 无论列表多长都只执行一次查询
+    # 返回两个集合: (当前用户关注了的用户id, 关注了当前用户的用户id)
+    # 用于粉丝列表和资料页 避免对每一行分别调用is_following()/is_followed_by()
+    def follow_states(self, users):
+        ids = set(user.id for user in users if user is not None and user.id is not None)
+        following, followed_by = set(), set()
+        if not ids or self.id is None:
+            return following, followed_by
+        if self._use_follow_index():
+            following = set(i for i in ids if follow_index.is_following(self.id, i))
+            followed_by = set(i for i in ids if follow_index.is_following(i, self.id))
+            return following, followed_by
+        rows = db.session.query(Follow.follower_id, Follow.followed_id).filter(db.or_(
+                db.and_(Follow.follower_id == self.id, Follow.followed_id.in_(ids)),
+                db.and_(Follow.followed_id == self.id, Follow.follower_id.in_(ids)))).all()
+        for follower_id, followed_id in rows:
+            if follower_id == self.id:
+                following.add(followed_id)
+            if followed_id == self.id:
+                followed_by.add(follower_id)
+        return following, followed_by
+
     # 让所有用户都关注自己
     @staticmethod
     def all_add_self_follows():
@@ -383,18 +509,25 @@ class User(UserMixin, db.Model):
 
 
     # 把用户转换成json格式的序列化字典
-    def to_json(self):
+    # fields为None时返回所有字段 否则只计算其中列出的字段 exclude中的字段不计算
+    def to_json(self, fields=None, exclude=()):
         json_user = {
-            'url' : url_for('api.get_post', id=self.id, _externam=True),
-            'username': self.username,
-            'member_since': self.member_since,
-            'last_seen': self.last_seen,
-            'posts': url_for('api.get_user_posts', id=self.id, _external=True),
-            'followed_posts': url_for('api.get_user_followed_posts', id=self.id, _external=True),
-            'post_count': self.posts.count()
+            'url' : lambda: url_for('api.get_user', id=self.id, _external=True),
+            'username': lambda: self.username,
+            'member_since': lambda: self.member_since,
+            'last_seen': lambda: self.last_seen,
+            'posts': lambda: url_for('api.get_user_posts', id=self.id, _external=True),
+            'followed_posts': lambda: url_for('api.get_user_followed_posts', id=self.id, _external=True),
+            'post_count': lambda: self.posts.count()
         }
-        return json_user
+        return select_fields(json_user, fields, exclude)
+
 
+    # 推荐关注的用户 读取预先计算好的结果 只执行一次查询
+    def suggested_users(self, limit=5):
+        return User.query.join(Suggestion, Suggestion.suggested_id == User.id)\
+                .filter(Suggestion.user_id == self.id)\
+                .order_by(Suggestion.rank).limit(limit).all()
 
     @property
     def followed_posts(self):
@@ -411,12 +544,48 @@ class AnonymousUser(AnonymousUserMixin):
     def is_administrator(self):
         return False
 
+    # 未登录用户没有任何关注关系
+    def follow_states(self, users):
+        return set(), set()
+
+    def suggested_users(self, limit=5):
+        return []
+
 
 login_manager.anonymous_user = AnonymousUser
 
 
 
 
+# 文章和评论中允许出现的HTML标签
+POST_ALLOWED_TAGS = ['a', 'addr', 'acronym', 'b', 'blockquote', 'code', 'em',
+        'i', 'li', 'ol', 'pre', 'strong', 'ul', 'h1', 'h2', 'h3', 'p' ]
+COMMENT_ALLOWED_TAGS = ['a', 'abbr', 'acronym', 'b', 'code', 'em', 'i', 'strong']
+
+
+# 渲染过程见rendering.render_markdown 相同的正文使用缓存中的结果
+def render_html(value, allowed_tags):
+    return render_cached(value, allowed_tags)
+
+
+def render_post_html(value):
+    return render_html(value, POST_ALLOWED_TAGS)
+
+
+def render_comment_html(value):
+    return render_html(value, COMMENT_ALLOWED_TAGS)
+
+
+# 配置了FLASKY_USE_JOBS时不在请求中渲染 先清空body_html(页面暂时显示原文)
+# 提交之后再把渲染任务入队(见本模块末尾的事件监听) 保证工作进程读到的是新的正文
+def defer_render(target):
+    if not current_app or not current_app.config['FLASKY_USE_JOBS']:
+        return False
+    target.body_html = None
+    target._render_deferred = True
+    return True
+
+
 # 文章模型
 # 博客文章包含正文 时间戳 以及和User模型之间的一对多关系 
 # body字段的定义类型是db.Text 所以不限制长度
@@ -427,8 +596,16 @@ class Post(db.Model):
     body_html = db.Column(db.Text) # 缓存markdown格式的文章转换成html后的代码
     timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
     author_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    # 浏览数 由view_counter批量写入 不要在请求中直接修改
+    views = db.Column(db.Integer, default=0, server_default='0')
     comments = db.relationship('Comment', backref='post', lazy='dynamic')
 
+    archived = False
+
+    # 显示的浏览数: 数据库中的值加上本进程中尚未写入的计数
+    def view_count(self):
+        return (self.views or 0) + view_counter.pending_count(self.id)
+
     # 生成博客文章
     @staticmethod
     def generate_fake(count=100):
@@ -445,36 +622,38 @@ class Post(db.Model):
             db.session.commit()
 
     # 把文章转换成json格式的序列化字典
-    def to_json(self):
+    def to_json(self, fields=None, exclude=()):
         json_post = {
-            'url': url_for('api.get_post', id=self.id, _external=True),
-            'body': self.body,
-            'body_html': self.body_html,
-            'timestamp': self.timestamp,
-            'author': url_for('api.get_user', id=self.author_id, _external=True),
-            'comments': url_for('api.get_post_comments', id=self.id, _external=True),
-            'comment_count': self.comments.count()
+            'url': lambda: url_for('api.get_post', id=self.id, _external=True),
+            'body': lambda: self.body,
+            'body_html': lambda: self.body_html,
+            'timestamp': lambda: self.timestamp,
+            'author': lambda: url_for('api.get_user', id=self.author_id, _external=True),
+            'comments': lambda: url_for('api.get_post_comments', id=self.id, _external=True),
+            'comment_count': lambda: self.comments.count(),
+            'views': lambda: self.view_count()
         }
-        return json_post
+        return select_fields(json_post, fields, exclude)
 
+    # 检查json中的正文 from_json和批量导入共用这一校验
     @staticmethod
-    def from_json(json_post):
+    def body_from_json(json_post):
         body = json_post.get('body')
         if body is None or body == '':
             raise ValidationError('post does not have a body')
-        return Post(body=body)
+        if not isinstance(body, str):
+            raise ValidationError('post body must be a string')
+        return body
+
+    @staticmethod
+    def from_json(json_post):
+        return Post(body=Post.body_from_json(json_post))
     
     
     @staticmethod
     def on_changed_body(target, value, oldvalue, initiator):
-        allowed_tags = ['a', 'addr', 'acronym', 'b', 'blockquote', 'code', 'em', 
-                'i', 'li', 'ol', 'pre', 'strong', 'ul', 'h1', 'h2', 'h3', 'p' ]
-        # 转换过程分三步: 首先markdown()函数初步把markdown文本转换成HTML
-        # 然后把得到的结果和允许使用的HTML标签列表传给clean()函数
-        # clean()函数删去所有不在白名单上的标签
-        # 最后由linkify()函数将重文本中的URL转换成适当的<a>标签 这个函数由Bleach提供
-        target.body_html = bleach.linkify(bleach.clean(markdown(value, output_format='html'), 
-                tags=allowed_tags, strip=True))
+        if not defer_render(target):
+            target.body_html = render_post_html(value)
 
 # on_changed_body函数注册set事件监听程序在body字段上
 # 只要这个类的实例的body字段设置了新值 函数就会自动调用
@@ -493,28 +672,180 @@ class Comment(db.Model):
     author_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     post_id = db.Column(db.Integer, db.ForeignKey('posts.id'))
 
-    def to_json(self):
+    archived = False
+
+    def to_json(self, fields=None, exclude=()):
         json_comment = {
-            'url' : url_for('api.get_comment', id=self.id, _external=True),
-            'post' : url_for('api.get_post', id=self.post_id, _external=True),
-            'body' : self.body,
-            'body_html' : self.body_html,
-            'timestamp' : self.timestamp,
-            'author': url_for('api.get_user', id=self.author_id, _external=True)
+            'url' : lambda: url_for('api.get_comment', id=self.id, _external=True),
+            'post' : lambda: url_for('api.get_post', id=self.post_id, _external=True),
+            'body' : lambda: self.body,
+            'body_html' : lambda: self.body_html,
+            'timestamp' : lambda: self.timestamp,
+            'author': lambda: url_for('api.get_user', id=self.author_id, _external=True)
         }
-        return json_comment
+        return select_fields(json_comment, fields, exclude)
 
+    # 批量审核评论 用一条UPDATE语句修改所有符合条件的评论 返回实际改变的行数
+    # ids: 评论id列表  author_id: 该用户的所有评论  body_contains: 内容包含关键字的评论
+    # 多个条件同时给出时取交集 至少要给出一个条件 防止误操作整张表
     @staticmethod
-    def from_json(json_comment):
+    def moderate(disabled, ids=None, author_id=None, body_contains=None):
+        if ids is None and author_id is None and not body_contains:
+            raise ValidationError('no comments selected')
+        query = Comment.query
+        if author_id is not None:
+            query = query.filter(Comment.author_id == author_id)
+        if body_contains:
+            # 关键字中的%和_按原样匹配 不作为LIKE的通配符
+            keyword = body_contains.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            query = query.filter(Comment.body.contains(keyword, escape='\\'))
+        # 只更新状态确实需要改变的评论 这样返回的行数就是受影响的评论数
+        if disabled:
+            query = query.filter(db.or_(Comment.disabled == False, Comment.disabled == None))
+        else:
+            query = query.filter(Comment.disabled == True)
+        if ids is None:
+            return query.update({Comment.disabled: disabled}, synchronize_session=False)
+        # SQLite限制单条语句的参数个数 id列表过长时分段更新
+        count = 0
+        ids = list(ids)
+        for i in range(0, len(ids), 500):
+            count += query.filter(Comment.id.in_(ids[i:i+500])).update(
+                    {Comment.disabled: disabled}, synchronize_session=False)
+        return count
+
+    @staticmethod
+    def body_from_json(json_comment):
         body = json_comment.get('body')
         if body is None or body == '':
             raise ValidationError('comment does not have a body')
-        return Comment(body=body)
+        if not isinstance(body, str):
+            raise ValidationError('comment body must be a string')
+        return body
+
+    @staticmethod
+    def from_json(json_comment):
+        return Comment(body=Comment.body_from_json(json_comment))
 
     @staticmethod
     def on_changed_body(target, value, oldvalue, initiator):
-        allowed_tags = ['a', 'abbr', 'acronym', 'b', 'code', 'em', 'i', 'strong']
-        target.body_html = bleach.linkify(bleach.clean(markdown(value, output_format='html'),
-                tags=allowed_tags, strip=True))
+        if not defer_render(target):
+            target.body_html = render_comment_html(value)
 
 db.event.listen(Comment.body, 'set', Comment.on_changed_body)
+
+
+# 归档的文章和评论 保存在单独的数据库中(见archive模块) 只读
+# 不能和主数据库中的表建立外键和关系 作者和评论通过属性查询
+class ArchivedPost(db.Model):
+    __bind_key__ = 'archive'
+    __tablename__ = 'archived_posts'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    body = db.Column(db.Text)
+    body_html = db.Column(db.Text)
+    timestamp = db.Column(db.DateTime)
+    author_id = db.Column(db.Integer, index=True)
+    views = db.Column(db.Integer)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    archived = True
+
+    @property
+    def author(self):
+        return User.query.get(self.author_id)
+
+    @property
+    def comments(self):
+        return ArchivedComment.query.filter_by(post_id=self.id)
+
+    def view_count(self):
+        return self.views or 0
+
+    to_json = Post.to_json
+
+
+class ArchivedComment(db.Model):
+    __bind_key__ = 'archive'
+    __tablename__ = 'archived_comments'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    body = db.Column(db.Text)
+    body_html = db.Column(db.Text)
+    timestamp = db.Column(db.DateTime)
+    disabled = db.Column(db.Boolean)
+    author_id = db.Column(db.Integer, index=True)
+    post_id = db.Column(db.Integer, index=True)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    archived = True
+
+    @property
+    def author(self):
+        return User.query.get(self.author_id)
+
+    to_json = Comment.to_json
+
+
+# 文章和评论写入或删除时 作者资料页的统计数字失效
+def on_authored_changed(mapper, connection, target):
+    invalidation.invalidate(db.object_session(target), 'profile', target.author_id)
+
+for model in (Post, Comment):
+    db.event.listen(model, 'after_insert', on_authored_changed)
+    db.event.listen(model, 'after_delete', on_authored_changed)
+
+
+# 新评论增加所属文章的热度 按评论时间计算衰减
+# 先记在会话中 提交后再计入 回滚的评论不增加热度
+def on_comment_inserted(mapper, connection, target):
+    when = calendar.timegm(target.timestamp.utctimetuple()) if target.timestamp else None
+    db.object_session(target).info.setdefault('trending_comments', []).append(
+            (target.post_id, when))
+
+db.event.listen(Comment, 'after_insert', on_comment_inserted)
+
+
+# 发表 修改或删除文章时 全站和作者的订阅失效
+def on_post_changed(mapper, connection, target):
+    from .feeds import invalidate_feeds
+    invalidate_feeds(target.author_id, db.object_session(target))
+
+for event in ('after_insert', 'after_update', 'after_delete'):
+    db.event.listen(Post, event, on_post_changed)
+
+
+# 延迟渲染的文章和评论写入数据库后记在会话中 会话提交后再入队 回滚时丢弃
+def on_render_deferred(mapper, connection, target):
+    if target.__dict__.pop('_render_deferred', False):
+        session = db.object_session(target)
+        session.info.setdefault('render_jobs', []).append((type(target).__name__, target.id))
+
+for model in (Post, Comment):
+    db.event.listen(model, 'after_insert', on_render_deferred)
+    db.event.listen(model, 'after_update', on_render_deferred)
+
+
+def on_session_commit(session):
+    render_jobs = session.info.pop('render_jobs', None)
+    if render_jobs:
+        from .tasks import render_body
+        for model, id in render_jobs:
+            render_body.delay(model, id)
+    for post_id, when in session.info.pop('trending_comments', ()):
+        trending.record(post_id, 'comment', when)
+    for follower_id, followed_id, added in session.info.pop('follow_changes', ()):
+        if added:
+            follow_index.add(follower_id, followed_id)
+        else:
+            follow_index.remove(follower_id, followed_id)
+
+
+def on_session_rollback(session):
+    session.info.pop('render_jobs', None)
+    session.info.pop('trending_comments', None)
+    session.info.pop('follow_changes', None)
+
+db.event.listen(db.session, 'after_commit', on_session_commit)
+db.event.listen(db.session, 'after_rollback', on_session_rollback)
+# 会话中记下的缓存失效 提交后通知其它进程 回滚时只在本进程中再失效一次
+db.event.listen(db.session, 'after_commit', invalidation.on_commit)
+db.event.listen(db.session, 'after_rollback', invalidation.on_rollback)
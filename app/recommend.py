@@ -0,0 +1,85 @@
+# 推荐关注(who to follow)批处理任务
+# 把follows表构造成稀疏矩阵A: A[i, j] = 1 表示用户i关注了用户j
+# 两类得分都用稀疏矩阵乘法一次算出 不需要逐个用户查询数据库:
+#   朋友的朋友: A·A         i关注的人所关注的人
+#   共同关注:   (A·Aᵀ)·A    和i关注了相同用户的人 他们还关注了谁
+# 去掉自己和已经关注的用户后 每行取得分最高的前N个写入suggestions表
+# 依赖numpy和scipy 只在执行批处理时导入 网站本身读取结果时不需要
+from . import db
+from .models import Follow, Suggestion
+
+
+def build_follow_matrix():
+    import numpy as np
+    from scipy import sparse
+
+    rows = db.session.query(Follow.follower_id, Follow.followed_id).all()
+    if not rows:
+        return np.array([], dtype=np.int64), sparse.csr_matrix((0, 0))
+    edges = np.array(rows, dtype=np.int64)
+    # 自己关注自己的边不参与推荐
+    edges = edges[edges[:, 0] != edges[:, 1]]
+    # 把用户id压缩成连续的行列号
+    user_ids, inverse = np.unique(edges, return_inverse=True)
+    inverse = inverse.reshape(edges.shape)
+    n = len(user_ids)
+    data = np.ones(len(edges), dtype=np.float32)
+    matrix = sparse.csr_matrix((data, (inverse[:, 0], inverse[:, 1])), shape=(n, n))
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    return user_ids, matrix
+
+
+# 计算一批用户(矩阵中的行号rows)的推荐得分 返回稀疏矩阵
+def score_rows(matrix, rows, cofollow_weight=0.5):
+    import numpy as np
+    from scipy import sparse
+
+    block = matrix[rows]
+    scores = block.dot(matrix)
+    if cofollow_weight:
+        scores = scores + cofollow_weight * block.dot(matrix.T).dot(matrix)
+    # 去掉已经关注的用户和自己
+    myself = sparse.csr_matrix((np.ones(len(rows), dtype=np.float32),
+            (np.arange(len(rows)), rows)), shape=block.shape)
+    exclude = (block + myself) > 0
+    scores = (scores - scores.multiply(exclude)).tocsr()
+    scores.eliminate_zeros()
+    return scores
+
+
+# 取稀疏矩阵每一行得分最高的前top_n个 (列号, 得分) 按得分从高到低排列
+def top_n_per_row(scores, top_n):
+    import numpy as np
+
+    for i in range(scores.shape[0]):
+        start, end = scores.indptr[i], scores.indptr[i + 1]
+        cols = scores.indices[start:end]
+        values = scores.data[start:end]
+        if len(values) > top_n:
+            keep = np.argpartition(-values, top_n - 1)[:top_n]
+            cols, values = cols[keep], values[keep]
+        # 得分相同时按列号排序 保证结果稳定
+        order = np.lexsort((cols, -values))
+        yield i, cols[order], values[order]
+
+
+# 重新计算所有用户的推荐并整体替换suggestions表
+# 按block_size分块计算 控制中间矩阵的内存占用
+def compute_suggestions(top_n=10, cofollow_weight=0.5, block_size=1000):
+    user_ids, matrix = build_follow_matrix()
+    records = []
+    for start in range(0, len(user_ids), block_size):
+        rows = list(range(start, min(start + block_size, len(user_ids))))
+        scores = score_rows(matrix, rows, cofollow_weight)
+        for i, cols, values in top_n_per_row(scores, top_n):
+            user_id = int(user_ids[rows[i]])
+            for rank, (col, value) in enumerate(zip(cols, values)):
+                records.append({'user_id': user_id, 'rank': rank,
+                                'suggested_id': int(user_ids[col]), 'score': float(value)})
+    # 在一个事务中替换 读取方不会看到一半新一半旧的结果
+    Suggestion.query.delete()
+    if records:
+        db.session.execute(Suggestion.__table__.insert(), records)
+    db.session.commit()
+    return len(records)
@@ -0,0 +1,158 @@
+# markdown渲染和按内容寻址的渲染缓存
+# 渲染结果只由正文 允许的标签和markdown/bleach的版本决定 所以用这些内容的散列作为缓存的键
+# 相同的正文(引用 转发 垃圾评论等)只渲染一次 修改标签白名单或升级库之后键随之改变 旧结果不会被误用
+# 缓存项不会过期 只按最近使用的顺序淘汰 大小由FLASKY_RENDER_CACHE_SIZE设置
+# 命中率见render_cache.stats() 批量导入和manage.py rerender结束时会输出
+#
+# 增量渲染: 整篇正文不在缓存中时(例如修改了一段的文章) 把正文按空行分成顶层块 每块单独渲染并缓存
+# 拼接的结果与整篇渲染相同 这样修改长文章的一段时只有这一段需要重新渲染
+# 有跨块影响的结构时不分块: 列表 引用和缩进(代码块或列表项的后续段落)与前面的块合并成一块
+# 含有HTML标签(未闭合的标签会影响后面的块)或链接定义([id]: url 可以在任意块中引用)时整篇渲染
+# 对照测试见tests/test_rendering.py
+import hashlib
+import re
+from functools import partial
+
+from . import render_cache
+
+_version = None
+
+
+# 转换过程分三步: 首先markdown()函数初步把markdown文本转换成HTML
+# 然后把得到的结果和允许使用的HTML标签列表传给clean()函数
+# clean()函数删去所有不在白名单上的标签
+# 最后由linkify()函数将重文本中的URL转换成适当的<a>标签 这个函数由Bleach提供
+# 写成模块级函数 批量导入时可以交给进程池并行执行
+# markdown和bleach导入较慢 只在第一次渲染时导入 不影响进程启动和命令行工具
+def render_markdown(value, allowed_tags):
+    from markdown import markdown
+    import bleach
+    return bleach.linkify(bleach.clean(markdown(value, output_format='html'),
+            tags=allowed_tags, strip=True))
+
+
+# 渲染库的版本 作为缓存键的一部分
+def renderer_version():
+    global _version
+    if _version is None:
+        import markdown
+        import bleach
+        _version = 'markdown-%s/bleach-%s' % (
+                getattr(markdown, '__version__', None) or getattr(markdown, 'version', ''),
+                bleach.__version__)
+    return _version
+
+
+def content_key(value, allowed_tags):
+    h = hashlib.sha1()
+    h.update(renderer_version().encode('utf-8'))
+    h.update(b'\0' + ','.join(sorted(allowed_tags)).encode('utf-8') + b'\0')
+    h.update(value.encode('utf-8'))
+    return h.hexdigest()
+
+
+def render_cached(value, allowed_tags):
+    key = content_key(value, allowed_tags)
+    html = render_cache.get(key)
+    if html is None:
+        html = render_blocks(value, allowed_tags)
+        render_cache.set(key, html)
+    return html
+
+
+LIST_ITEM = re.compile(r' {0,3}([*+-]|\d+\.)[ \t]')
+QUOTE = re.compile(r' {0,3}>')
+REFERENCE = re.compile(r'^ {0,3}\[[^\]]+\]:', re.M)
+
+
+def _is_blank(line):
+    return line.strip(' \t') == ''
+
+
+# 把正文分成可以单独渲染的顶层块 不能安全分块时返回None
+# 合并只会让块变大 不影响结果 所以判断尽量保守: 前一块中出现过列表项(引用)时 后面的列表项(引用)都并入
+def split_blocks(value):
+    if '<' in value or REFERENCE.search(value):
+        return None
+    lines = value.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    if lines[0] and _is_blank(lines[0]):
+        # markdown不把第一行的空白当作空行 而是当作缩进的代码块
+        return None
+    groups = []     # (行, 是否含列表项, 是否含引用) 合并的块之间保留原来的空行(代码块中的空行会原样输出)
+    blanks = []
+    for line in lines:
+        if _is_blank(line):
+            blanks.append(line)
+            continue
+        is_list, is_quote = bool(LIST_ITEM.match(line)), bool(QUOTE.match(line))
+        if groups and (not blanks or line[0] in ' \t'
+                       or is_list and groups[-1][1] or is_quote and groups[-1][2]):
+            group_lines, has_list, has_quote = groups[-1]
+            group_lines.extend(blanks)
+            group_lines.append(line)
+            groups[-1] = (group_lines, has_list or is_list, has_quote or is_quote)
+        else:
+            groups.append(([line], is_list, is_quote))
+        blanks = []
+    return ['\n'.join(group[0]) for group in groups]
+
+
+# 逐块渲染 每块的结果按块的内容缓存 只有一块时直接整篇渲染
+def render_blocks(value, allowed_tags):
+    blocks = split_blocks(value)
+    if blocks is None or len(blocks) < 2:
+        return render_markdown(value, allowed_tags)
+    return '\n'.join(render_cached(block, allowed_tags) for block in blocks)
+
+
+# 批量渲染 返回与values顺序一致的结果
+# 先查缓存并去掉重复的正文 只把未命中的正文交给map(可以是进程池的map)渲染
+def render_many(values, allowed_tags, map=map):
+    keys = [content_key(value, allowed_tags) for value in values]
+    results = {}
+    missing = {}
+    for key, value in zip(keys, values):
+        if key in results or key in missing:
+            continue
+        html = render_cache.get(key)
+        if html is None:
+            missing[key] = value
+        else:
+            results[key] = html
+    if missing:
+        rendered = map(partial(render_markdown, allowed_tags=allowed_tags), list(missing.values()))
+        for key, html in zip(list(missing), rendered):
+            render_cache.set(key, html)
+            results[key] = html
+    return [results[key] for key in keys]
+
+
+# 重新渲染所有文章或评论的body_html 修改标签白名单或升级markdown/bleach之后使用
+# 按id分批读取 每批一个短事务 只更新渲染结果有变化的行 返回更新的行数
+# 批量更新不触发模型事件 每批提交后让有变化的文章的订阅失效
+def rerender_all(model, allowed_tags, batch_size=1000, map=map):
+    from sqlalchemy import bindparam
+    from . import db
+    from .feeds import invalidate_feeds
+    from .models import Post
+    table = model.__table__
+    update = table.update().where(table.c.id == bindparam('_id')) \
+            .values(body_html=bindparam('_html'))
+    last_id, updated = 0, 0
+    while True:
+        rows = db.session.query(model.id, model.body, model.body_html, model.author_id) \
+                .filter(model.id > last_id, model.body != None) \
+                .order_by(model.id).limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        rendered = render_many([row.body for row in rows], allowed_tags, map)
+        changed = [(row, html) for row, html in zip(rows, rendered) if html != row.body_html]
+        if changed:
+            db.session.execute(update, [{'_id': row.id, '_html': html} for row, html in changed])
+        db.session.commit()
+        if model is Post:
+            for author_id in set(row.author_id for row, _ in changed):
+                invalidate_feeds(author_id)
+        updated += len(changed)
+    return updated
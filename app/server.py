@@ -0,0 +1,175 @@
+# 生产环境的预派生(prefork)服务器 由manage.py serve启动
+# 主进程先创建程序实例 注册全部蓝本 编译所有模板 导入markdown和bleach 然后打开监听端口并fork出工作进程
+# 这些在fork之前加载好的模块和模板以写时复制的方式被所有工作进程共享 不必每个进程各自加载一份
+# 所有工作进程在同一个监听套接字上接受连接 由内核分配 每个进程一次处理一个请求 工作进程数默认为CPU数
+# 数据库连接不能在进程之间共用: 主进程在fork之前清空连接池 工作进程在fork之后再清空一次 并丢弃本机共享存储的连接
+# 信号:
+#   SIGTERM SIGINT: 停止 工作进程处理完当前请求后退出 超过graceful_timeout秒仍未退出的进程被强制结束
+#   SIGHUP: 平滑重启 重新创建程序实例(重新加载模板) 启动新的工作进程后再让旧的进程处理完当前请求退出
+#           监听端口一直打开 重启期间不会拒绝连接 修改了python代码需要完全重启
+# 意外退出的工作进程会被重新启动
+import gc
+import os
+import signal
+import socket
+import time
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+
+class PreforkServer(BaseWSGIServer):
+    # 监听套接字是非阻塞的 有的系统上accept()得到的连接会继承这个设置
+    def get_request(self):
+        conn, address = self.socket.accept()
+        conn.setblocking(True)
+        return conn, address
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    # 不输出访问日志
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+# 创建程序实例并加载处理请求需要的所有内容 返回程序实例
+def preload(config_name):
+    from . import create_app, db
+    from .rendering import renderer_version
+    from .templating import compile_templates
+    app = create_app(config_name)
+    with app.app_context():
+        # 模板编译后保存在jinja环境的缓存中
+        compile_templates()
+        # markdown和bleach在第一次渲染时才导入
+        renderer_version()
+        # 路由表在第一次匹配时才排序
+        app.url_map.update()
+        db.engine.dispose()
+    # 把已有的对象移出垃圾回收的跟踪范围(python 3.7以上)
+    # 否则工作进程中的垃圾回收会改写这些对象的引用计数信息 使共享的内存页被复制
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+    return app
+
+
+def bind(host, port, backlog=2048):
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    # 非阻塞: 多个进程同时被一个新连接唤醒时 没有抢到连接的进程不会阻塞在accept()中
+    sock.setblocking(False)
+    return sock
+
+
+# 工作进程: 处理请求直到收到SIGTERM或主进程退出 不会返回
+# 用os._exit()退出(不能回到主进程的代码中) atexit注册的函数不会执行 退出前在这里合并缓冲的浏览计数和热度
+def _worker_main(app, sock, access_log):
+    from . import db, local_store, view_counter, trending
+    stopping = []
+
+    def shutdown(signum, frame):
+        stopping.append(signum)
+    signal.signal(signal.SIGTERM, shutdown)
+    # 终端中的Ctrl-C会发给整个进程组 由主进程统一通知停止
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    status = 0
+    try:
+        with app.app_context():
+            db.engine.dispose()
+        local_store.init_app(app)
+        host, port = sock.getsockname()[:2]
+        server = PreforkServer(host, port, app, fd=sock.fileno(),
+                               handler=None if access_log else QuietRequestHandler)
+        # handle_request()最多等待这么多秒 之后检查是否需要退出
+        server.timeout = 1
+        master = os.getppid()
+        while not stopping and os.getppid() == master:
+            server.handle_request()
+        server.server_close()
+    except Exception:
+        app.logger.exception('worker %d crashed', os.getpid())
+        status = 1
+    finally:
+        try:
+            with app.app_context():
+                view_counter.flush(drain=False)
+                trending.persist(reload=False)
+        except Exception:
+            app.logger.exception('worker %d failed to flush counters', os.getpid())
+            status = 1
+        os._exit(status)
+
+
+def _spawn(app, sock, access_log):
+    pid = os.fork()
+    if pid == 0:
+        _worker_main(app, sock, access_log)
+    return pid
+
+
+# 启动服务器 直到收到SIGTERM或SIGINT才返回
+def serve(config_name, host='127.0.0.1', port=8000, workers=None, access_log=True,
+          graceful_timeout=30, sock=None):
+    workers = workers or os.cpu_count() or 1
+    if sock is None:
+        sock = bind(host, port)
+    # 信号处理函数中只记下收到的信号 在主循环中处理
+    signals = []
+
+    def notify(signum, frame):
+        signals.append(signum)
+    for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        signal.signal(signum, notify)
+
+    app = preload(config_name)
+    current, retiring = set(), set()
+    try:
+        while True:
+            _reap(current, retiring)
+            if signals:
+                signum = signals.pop(0)
+                if signum != signal.SIGHUP:
+                    break
+                app.logger.info('reloading')
+                app = preload(config_name)
+                for pid in current:
+                    _kill(pid, signal.SIGTERM)
+                retiring |= current
+                current = set()
+            while len(current) < workers:
+                current.add(_spawn(app, sock, access_log))
+            time.sleep(0.2)
+    finally:
+        pids = current | retiring
+        for pid in pids:
+            _kill(pid, signal.SIGTERM)
+        deadline = time.time() + graceful_timeout
+        while pids and time.time() < deadline:
+            _reap(pids)
+            time.sleep(0.1)
+        for pid in pids:
+            _kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        sock.close()
+
+
+# 回收已经退出的工作进程 从各集合中删除
+def _reap(*groups):
+    while True:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+        for group in groups:
+            group.discard(pid)
+
+
+def _kill(pid, signum):
+    try:
+        os.kill(pid, signum)
+    except ProcessLookupError:
+        pass
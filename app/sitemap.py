@@ -0,0 +1,157 @@
+# 站点地图
+# 一个索引文件sitemap.xml 加上按资源分块的站点地图文件 每块最多FLASKY_SITEMAP_CHUNK_SIZE(50000)个url
+# 生成时按id顺序流式查询(只选取需要的列 yield_per分批读取) 每块边读边写入文件 内存占用与记录数无关
+# 增量生成: 已写满的分块保留不动 只重写最后一个未满的分块 并为新增的记录追加分块
+# 分块的id范围等信息保存在状态文件中 删除记录或用户改名后需要完整重新生成(--full)
+# 生成的文件同时预压缩成.gz/.br 由/sitemap.xml等路由直接发送
+import json
+import os
+from itertools import islice
+from xml.sax.saxutils import escape
+
+from flask import current_app, url_for, send_from_directory, abort
+
+from . import db
+from .compress import ENCODINGS, precompress_directory, send_precompressed
+from .models import User, Post
+
+INDEX = 'sitemap.xml'
+STATE = 'sitemap-state.json'
+
+# 资源: (模型, 查询的列, url, 最后修改时间)
+SITEMAPS = {
+    'posts': (Post, ['id', 'timestamp'],
+              lambda row: url_for('main.post', id=row.id, _external=True),
+              lambda row: row.timestamp),
+    'users': (User, ['id', 'username', 'last_seen'],
+              lambda row: url_for('main.user', username=row.username, _external=True),
+              lambda row: row.last_seen),
+}
+
+HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n' \
+         '<%s xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+
+
+def w3c_date(value):
+    return value.strftime('%Y-%m-%dT%H:%M:%S+00:00') if value is not None else None
+
+
+def chunk_filename(name):
+    return 'sitemap-%s.xml' % name
+
+
+def _stream(resource, start_id=None, batch_size=1000):
+    model, columns, _, _ = SITEMAPS[resource]
+    query = db.session.query(*[getattr(model, column) for column in columns])
+    if start_id is not None:
+        query = query.filter(model.id >= start_id)
+    return query.order_by(model.id).execution_options(stream_results=True).yield_per(batch_size)
+
+
+# 先写临时文件再改名 请求不会读到写了一半的文件
+def _write(path, tag, entries):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(HEADER % tag)
+        child = 'url' if tag == 'urlset' else 'sitemap'
+        for loc, lastmod in entries:
+            f.write('<%s><loc>%s</loc>' % (child, escape(loc)))
+            if lastmod is not None:
+                f.write('<lastmod>%s</lastmod>' % lastmod)
+            f.write('</%s>\n' % child)
+        f.write('</%s>\n' % tag)
+    os.replace(tmp, path)
+
+
+# 把rows写入一个分块 返回分块信息 rows为空时不生成文件 返回None
+def _write_chunk(directory, resource, number, rows):
+    _, _, url, lastmod = SITEMAPS[resource]
+    chunk = {'name': '%s-%d' % (resource, number), 'first_id': None, 'last_id': None,
+             'count': 0, 'lastmod': None}
+
+    def entries():
+        for row in rows:
+            if chunk['first_id'] is None:
+                chunk['first_id'] = row.id
+            chunk['last_id'] = row.id
+            chunk['count'] += 1
+            modified = w3c_date(lastmod(row))
+            if modified is not None and (chunk['lastmod'] is None or modified > chunk['lastmod']):
+                chunk['lastmod'] = modified
+            yield url(row), modified
+
+    path = os.path.join(directory, chunk_filename(chunk['name']))
+    _write(path, 'urlset', entries())
+    if chunk['count'] == 0:
+        os.remove(path)
+        return None
+    return chunk
+
+
+def load_state(directory):
+    path = os.path.join(directory, STATE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+# 生成站点地图 返回本次写入的分块数 需要在请求上下文中调用(url_for生成完整的url)
+def generate_sitemap(directory=None, full=False, chunk_size=None):
+    directory = directory or current_app.config['FLASKY_SITEMAP_DIR']
+    chunk_size = chunk_size or current_app.config['FLASKY_SITEMAP_CHUNK_SIZE']
+    os.makedirs(directory, exist_ok=True)
+    state = {} if full else load_state(directory)
+    written = 0
+    for resource in sorted(SITEMAPS):
+        chunks = state.get(resource, [])
+        start_id = None
+        if chunks and chunks[-1]['count'] < chunk_size:
+            # 最后一个分块没有写满 从它的第一条记录开始重写
+            start_id = chunks.pop()['first_id']
+        elif chunks:
+            start_id = chunks[-1]['last_id'] + 1
+        rows = iter(_stream(resource, start_id))
+        while True:
+            chunk = _write_chunk(directory, resource, len(chunks) + 1, islice(rows, chunk_size))
+            if chunk is None:
+                break
+            chunks.append(chunk)
+            written += 1
+            if chunk['count'] < chunk_size:
+                break
+        state[resource] = chunks
+
+    all_chunks = [chunk for resource in sorted(state) for chunk in state[resource]]
+    _write(os.path.join(directory, INDEX), 'sitemapindex',
+           [(url_for('main.sitemap', name=chunk['name'], _external=True), chunk['lastmod'])
+            for chunk in all_chunks])
+    tmp = os.path.join(directory, STATE + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp, os.path.join(directory, STATE))
+
+    # 删除不再使用的分块文件(例如完整重新生成后分块变少了)
+    names = set(chunk_filename(chunk['name']) for chunk in all_chunks)
+    for name in os.listdir(directory):
+        base = name
+        for _, suffix in ENCODINGS:
+            if base.endswith(suffix):
+                base = base[:-len(suffix)]
+        if base.startswith('sitemap-') and base.endswith('.xml') and base not in names:
+            os.remove(os.path.join(directory, name))
+    precompress_directory(directory, ['application/xml', 'text/xml'])
+    return written
+
+
+# 发送站点地图文件 优先发送预压缩的版本
+def send_sitemap(filename):
+    directory = current_app.config['FLASKY_SITEMAP_DIR']
+    cache_timeout = current_app.config['FLASKY_SITEMAP_MAX_AGE']
+    response = send_precompressed(directory, filename, cache_timeout=cache_timeout)
+    if response is not None:
+        return response
+    if not os.path.isfile(os.path.join(directory, filename)):
+        abort(404)
+    return send_from_directory(directory, filename, mimetype='application/xml',
+                               cache_timeout=cache_timeout)
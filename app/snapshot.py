@@ -0,0 +1,142 @@
+# 静态快照
+# 以匿名用户身份渲染首页 用户资料页和文章页 保存成静态HTML文件 可以由任何静态文件服务器(或CDN)作为只读镜像提供
+# 页面 /post/1 保存为 post/1/index.html 静态服务器按 $uri/index.html 查找即可
+# 同时复制静态文件和带指纹的静态文件(/static /assets) 镜像不依赖程序本身
+# 只保存每个页面的第一页(不带查询字符串的url)
+#
+# 渲染在多个工作进程中并行执行 每个进程创建自己的程序实例 用测试客户端请求页面
+# 增量生成: 状态文件中记录上次快照的时间 之后发表的文章和评论所影响的页面才重新渲染
+#   新文章: 文章页 作者资料页 首页
+#   新评论: 所属文章页 文章作者的资料页 首页(评论数)
+#   新注册的用户: 资料页(还没有发表文章也要生成)
+# 修改或删除文章 修改用户资料等不会留下时间戳 需要完整重新生成(--full)
+import json
+import os
+import shutil
+from datetime import datetime
+from multiprocessing import Pool
+
+from flask import current_app
+
+from . import db, assets
+from .export import parse_time
+from .models import User, Post, Comment
+
+STATE = 'snapshot-state.json'
+
+_worker = {}
+
+
+def page_path(url):
+    return os.path.join(url.strip('/'), 'index.html') if url != '/' else 'index.html'
+
+
+# 快照进程中不统计浏览 也不增加热度
+def _init_worker(config_name, directory):
+    from . import create_app
+    app = create_app(config_name)
+    app.config['FLASKY_COUNT_VIEWS'] = False
+    app.config['FLASKY_TRENDING_WEIGHTS'] = {}
+    _worker['client'] = app.test_client()
+    _worker['directory'] = directory
+
+
+# 渲染一个页面并写入文件 返回(url, 状态码)
+def _render(url):
+    response = _worker['client'].get(url)
+    if response.status_code == 200:
+        path = os.path.join(_worker['directory'], page_path(url))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(response.data)
+        os.replace(tmp, path)
+    return url, response.status_code
+
+
+def render_pages(urls, directory, config_name, workers=None):
+    urls = list(urls)
+    if workers is not None and workers <= 1:
+        _init_worker(config_name, directory)
+        return [_render(url) for url in urls]
+    with Pool(processes=workers, initializer=_init_worker,
+              initargs=(config_name, directory)) as pool:
+        return pool.map(_render, urls, chunksize=16)
+
+
+def _post_url(id):
+    return '/post/%d' % id
+
+
+def _user_url(username):
+    return '/user/%s' % username
+
+
+# 上次快照之后需要重新渲染的页面 since为None时返回所有页面
+def affected_urls(since=None):
+    urls = set(['/'])
+    if since is None:
+        urls.update(_post_url(id) for (id,) in db.session.query(Post.id).yield_per(1000))
+        urls.update(_user_url(name) for (name,) in db.session.query(User.username).yield_per(1000))
+        return urls
+    new_posts = db.session.query(Post.id, User.username).join(User, Post.author_id == User.id) \
+            .filter(Post.timestamp >= since)
+    commented = db.session.query(Post.id, User.username).join(User, Post.author_id == User.id) \
+            .filter(Post.id.in_(db.session.query(Comment.post_id).filter(Comment.timestamp >= since)))
+    for post_id, username in new_posts.union(commented):
+        urls.add(_post_url(post_id))
+        urls.add(_user_url(username))
+    new_users = db.session.query(User.username).filter(User.member_since >= since,
+                                                        User.username != None)
+    urls.update(_user_url(name) for (name,) in new_users)
+    return urls
+
+
+# 复制静态文件 带指纹的静态文件按清单复制到assets目录
+# 原文件名也复制一份: 和/assets/<原文件名>一样 样式表之间等没有改写的相对路径引用的是原文件名
+def copy_static(directory):
+    static = current_app.static_folder
+    shutil.rmtree(os.path.join(directory, 'static'), ignore_errors=True)
+    shutil.copytree(static, os.path.join(directory, 'static'))
+    if assets.manifest is None:
+        assets.load()
+    for filename, hashed in assets.manifest.items():
+        target = os.path.join(directory, 'assets', hashed)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # 样式表中的url()已改为带指纹的文件名
+        with open(target, 'wb') as f:
+            f.write(assets.read(filename))
+        shutil.copy2(os.path.join(static, filename), os.path.join(directory, 'assets', filename))
+
+
+def load_state(directory):
+    path = os.path.join(directory, STATE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+# 生成快照 返回(渲染成功的页面数, 失败的(url, 状态码))
+def snapshot(directory, config_name, full=False, workers=None):
+    os.makedirs(directory, exist_ok=True)
+    state = {} if full else load_state(directory)
+    since = parse_time(state.get('last_snapshot'))
+    # 先记下开始时间 渲染期间发表的文章在下次快照时处理
+    started = datetime.utcnow()
+    urls = sorted(affected_urls(since))
+    # 子进程会打开自己的数据库连接 先释放当前会话
+    db.session.remove()
+    results = render_pages(urls, directory, config_name, workers)
+    copy_static(directory)
+    failed = [(url, status) for url, status in results if status != 200]
+    # 有页面渲染出错时不更新快照时间 下次重新渲染这些页面
+    # 404(例如已删除的文章)不算出错
+    if any(status >= 500 for _, status in failed):
+        return len(results) - len(failed), failed
+    state['last_snapshot'] = started.isoformat()
+    tmp = os.path.join(directory, STATE + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp, os.path.join(directory, STATE))
+    return len(results) - len(failed), failed
@@ -0,0 +1,50 @@
+# 后台任务 由manage.py worker启动的工作进程执行(见jobs.py)
+# 参数必须能序列化成JSON 所以传入id而不是模型对象 执行时重新查询
+# 任务在程序上下文中执行 正常返回后自动提交数据库会话
+from flask import current_app
+from flask_mail import Message
+
+from . import db, mail, jobs
+
+
+# 发送已经渲染好的邮件 SMTP服务器暂时不可用时重试
+@jobs.task(queue='mail', max_attempts=5, timeout=60)
+def send_mail(to, subject, body, html):
+    msg = Message(subject, sender=current_app.config['FLASKY_MAIL_SENDER'], recipients=[to])
+    msg.body = body
+    msg.html = html
+    mail.send(msg)
+
+
+# 把文章或评论的markdown正文渲染成HTML model为'Post'或'Comment'
+# 只在正文没有再次修改时写入 避免较早的任务覆盖较新的渲染结果
+# 批量更新不触发模型事件 文章的订阅在这里失效(提交后通知其它进程)
+@jobs.task(priority=10, timeout=60)
+def render_body(model, id):
+    from .models import Post, Comment, render_post_html, render_comment_html
+    from .feeds import invalidate_feeds
+    model, render = {'Post': (Post, render_post_html),
+                     'Comment': (Comment, render_comment_html)}[model]
+    row = db.session.query(model.body, model.author_id).filter(model.id == id).first()
+    if row is None or row.body is None:
+        # 已经删除
+        return
+    updated = db.session.query(model).filter(model.id == id, model.body == row.body) \
+            .update({'body_html': render(row.body)}, synchronize_session=False)
+    if updated and model is Post:
+        invalidate_feeds(row.author_id, db.session())
+
+
+# 生成虚拟用户和文章 用于开发和测试
+@jobs.task(priority=-10, max_attempts=1, timeout=60 * 60)
+def generate_fake(users=100, posts=100):
+    from .models import User, Post
+    User.generate_fake(users)
+    Post.generate_fake(posts)
+
+
+# 让所有用户都关注自己
+@jobs.task(priority=-10, timeout=60 * 60)
+def add_self_follows():
+    from .models import User
+    User.all_add_self_follows()
@@ -0,0 +1,48 @@
+# 模板字节码缓存
+# 每个工作进程第一次渲染模板时都要把模板源码编译成python代码 重启或部署后第一个请求会明显变慢
+# 编译结果以字节码形式保存在一个所有工作进程共享的目录中 其它进程直接加载 不再编译
+# 缓存按模板源码校验 模板改动后自动重新编译 部署时用manage.py compile_templates预先生成
+import os
+import tempfile
+
+from flask import current_app
+from jinja2 import FileSystemBytecodeCache
+
+
+class SharedBytecodeCache(FileSystemBytecodeCache):
+    # 先写临时文件再改名 多个进程同时写同一个模板时 读到的总是完整的文件
+    def dump_bytecode(self, bucket):
+        filename = self._get_cache_filename(bucket)
+        tmp = None
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                bucket.write_bytecode(f)
+            os.replace(tmp, filename)
+        except OSError:
+            if tmp is not None and os.path.exists(tmp):
+                os.remove(tmp)
+            # 缓存目录不可写时只是没有缓存 不影响渲染
+            current_app.logger.warning('cannot write template cache %s', filename)
+
+
+def init_bytecode_cache(app):
+    directory = app.config.get('FLASKY_TEMPLATE_CACHE_DIR')
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    app.jinja_env.bytecode_cache = SharedBytecodeCache(directory)
+
+
+# 编译所有模板(包括扩展和蓝本中的模板) 写入字节码缓存 返回(编译成功数, 失败的模板)
+def compile_templates(extensions=('html', 'txt', 'xml')):
+    env = current_app.jinja_env
+    compiled, failed = 0, []
+    for name in env.list_templates(extensions=extensions):
+        try:
+            env.get_template(name)
+        except Exception:
+            failed.append(name)
+        else:
+            compiled += 1
+    return compiled, failed
@@ -0,0 +1,166 @@
+# 热门文章排行
+# 每篇文章的热度是所有浏览和评论事件的加权和 每个事件的权重随时间指数衰减(半衰期FLASKY_TRENDING_HALF_LIFE)
+# 在对数空间中保存热度: score = log2(sum(weight * 2 ** ((t - EPOCH) / half_life)))
+# 这样所有文章按同一个时间点衰减 排名不随时间变化 不需要定期重新计算
+# 新事件只更新一篇文章的分数: score = log2(2 ** score + weight * 2 ** ((t - EPOCH) / half_life))
+#
+# 内存中只保留分数最高的FLASKY_TRENDING_SIZE篇文章 页面和API直接读取这个列表 与文章总数无关
+# 本进程产生的增量先记在pending中 每隔FLASKY_TRENDING_PERSIST_INTERVAL秒合并到本机共享存储
+# 然后从共享存储重新加载前K篇 这样各工作进程的排行最终一致
+import atexit
+import math
+import sqlite3
+import time
+from threading import Lock
+
+from flask import current_app
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS trending (
+    post_id INTEGER PRIMARY KEY,
+    score REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_trending_score ON trending (score);
+'''
+
+# 2018-01-01 计算分数的时间起点 让分数保持在较小的数值范围内
+EPOCH = 1514764800
+
+# 分数衰减到当前一次权重为1的事件的2**-20以下时 从共享存储中删除
+PRUNE_BELOW = 20
+
+
+def log_add(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    high, low = max(a, b), min(a, b)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+class TrendingTracker(object):
+    def __init__(self, store, app=None):
+        self.store = store
+        store.register_schema(SCHEMA)
+        self._lock = Lock()
+        self._registered = False
+        self.reset()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FLASKY_TRENDING_SIZE', 100)
+        app.config.setdefault('FLASKY_TRENDING_HALF_LIFE', 6 * 60 * 60)
+        app.config.setdefault('FLASKY_TRENDING_WEIGHTS', {'view': 1, 'comment': 5})
+        app.config.setdefault('FLASKY_TRENDING_PERSIST_INTERVAL', 30)
+        self.reset()
+        app.after_request(self.after_request)
+        if not self._registered:
+            atexit.register(self.persist, reload=False)
+            self._registered = True
+
+    def reset(self):
+        with self._lock:
+            self.scores = {}    # 内存中的前K篇文章 文章id -> 分数
+            self.pending = {}   # 尚未合并到共享存储的增量 文章id -> 分数
+            self.ranking = None # 按分数排好序的文章id 分数变化时重新排序
+            self.loaded = False
+            self.last_persist = time.time()
+
+    def _score(self, weight, when):
+        return math.log2(weight) + (when - EPOCH) / float(current_app.config['FLASKY_TRENDING_HALF_LIFE'])
+
+    # 记录一个事件 kind为FLASKY_TRENDING_WEIGHTS中的事件类型 when为事件发生的时间戳(秒)
+    def record(self, post_id, kind, when=None):
+        weight = current_app.config['FLASKY_TRENDING_WEIGHTS'].get(kind)
+        if not weight or post_id is None:
+            return
+        score = self._score(weight, when if when is not None else time.time())
+        size = current_app.config['FLASKY_TRENDING_SIZE']
+        with self._lock:
+            self.pending[post_id] = log_add(self.pending.get(post_id), score)
+            self.scores[post_id] = log_add(self.scores.get(post_id), score)
+            # 超出容量时淘汰分数最低的一篇 容量是常数 所以扫描的代价也是常数
+            if len(self.scores) > size:
+                del self.scores[min(self.scores, key=self.scores.get)]
+            self.ranking = None
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            self.persist()
+
+    # 前n篇热门文章的id
+    def top(self, n=None):
+        self.ensure_loaded()
+        with self._lock:
+            if self.ranking is None:
+                self.ranking = sorted(self.scores, key=self.scores.get, reverse=True)
+            ranking = self.ranking
+        return ranking[:n] if n is not None else list(ranking)
+
+    # 前n篇热门文章 按排名顺序 一次查询 已删除的文章跳过
+    def top_posts(self, n=None):
+        from .models import Post
+        ids = self.top(n)
+        if not ids:
+            return []
+        posts = dict((post.id, post) for post in Post.query.filter(Post.id.in_(ids)))
+        return [posts[id] for id in ids if id in posts]
+
+    def after_request(self, response):
+        interval = current_app.config['FLASKY_TRENDING_PERSIST_INTERVAL']
+        with self._lock:
+            due = self.pending and time.time() - self.last_persist >= interval
+            if due:
+                self.last_persist = time.time()
+        if due:
+            app = current_app._get_current_object()
+            response.call_on_close(lambda: self._persist_in_context(app))
+        return response
+
+    def _persist_in_context(self, app):
+        with app.app_context():
+            self.persist()
+
+    # 把本进程的增量合并到共享存储 reload为True时再从共享存储加载前K篇
+    def persist(self, reload=True):
+        with self._lock:
+            pending, self.pending = self.pending, {}
+            self.last_persist = time.time()
+        try:
+            with self.store.transaction() as conn:
+                if pending:
+                    ids = list(pending)
+                    stored = {}
+                    for i in range(0, len(ids), 500):
+                        chunk = ids[i:i+500]
+                        stored.update(conn.execute(
+                            'SELECT post_id, score FROM trending WHERE post_id IN (%s)'
+                            % ','.join('?' * len(chunk)), chunk).fetchall())
+                    conn.executemany('INSERT OR REPLACE INTO trending (post_id, score) VALUES (?, ?)',
+                            [(id, log_add(stored.get(id), score)) for id, score in pending.items()])
+                if not reload:
+                    return
+                now = self._score(1, time.time())
+                conn.execute('DELETE FROM trending WHERE score < ?', (now - PRUNE_BELOW,))
+                rows = conn.execute('SELECT post_id, score FROM trending ORDER BY score DESC LIMIT ?',
+                        (current_app.config['FLASKY_TRENDING_SIZE'],)).fetchall()
+        except sqlite3.Error:
+            with self._lock:
+                for id, score in pending.items():
+                    self.pending[id] = log_add(self.pending.get(id), score)
+            if reload:
+                current_app.logger.exception('cannot persist trending scores')
+            return
+        with self._lock:
+            scores = dict(rows)
+            # 合并期间新记录的增量也要算上
+            for id, score in self.pending.items():
+                scores[id] = log_add(scores.get(id), score)
+            size = current_app.config['FLASKY_TRENDING_SIZE']
+            if len(scores) > size:
+                scores = dict(sorted(scores.items(), key=lambda item: -item[1])[:size])
+            self.scores = scores
+            self.ranking = None
+            self.loaded = True
@@ -0,0 +1,75 @@
+# 冷启动后第一次请求的耗时 对比有无模板字节码缓存
+# 每种情况都在新的解释器中执行 依次请求首页 用户资料页和登录页 记录每个页面第一次和第二次请求的耗时
+# 运行: python3 benchmarks/first_request.py [重复次数]
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+URLS = ['/', '/user/alice', '/auth/login']
+
+CHILD = '''
+import json, sys, time
+from app import create_app, db
+from app.models import Role, User, Post
+app = create_app('development')
+with app.app_context():
+    db.create_all()
+    Role.insert_roles()
+    user = User(email='alice@example.com', username='alice', password='cat', confirmed=True)
+    db.session.add(user)
+    db.session.add(Post(body='hello *world*', author=user))
+    db.session.commit()
+client = app.test_client()
+timings = []
+for url in %r:
+    row = []
+    for _ in range(2):
+        start = time.time()
+        assert client.get(url).status_code == 200
+        row.append(time.time() - start)
+    timings.append(row)
+print(json.dumps(timings))
+''' % (URLS,)
+
+
+def run(cache_dir, compile_first=False):
+    env = dict(os.environ, DEV_DATABASE_URL='sqlite://', FLASKY_TEMPLATE_CACHE_DIR=cache_dir)
+    if compile_first:
+        subprocess.check_call([sys.executable, '-c',
+            'from app import create_app; from app.templating import compile_templates\n'
+            'app = create_app("development")\n'
+            'with app.app_context(): compile_templates()'], cwd=ROOT, env=env)
+    output = subprocess.check_output([sys.executable, '-c', CHILD], cwd=ROOT, env=env)
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def report(label, runs):
+    print(label)
+    for i, url in enumerate(URLS):
+        first = min(timings[i][0] for timings in runs) * 1000
+        second = min(timings[i][1] for timings in runs) * 1000
+        print('    %-14s first %7.1f ms  second %6.1f ms' % (url, first, second))
+    print('    %-14s first %7.1f ms' % ('total', sum(
+        min(timings[i][0] for timings in runs) for i in range(len(URLS))) * 1000))
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    report('no bytecode cache', [run('') for _ in range(repeat)])
+    runs = []
+    for _ in range(repeat):
+        cache_dir = tempfile.mkdtemp()
+        try:
+            runs.append(run(cache_dir, compile_first=True))
+        finally:
+            shutil.rmtree(cache_dir)
+    report('bytecode cache (compile_templates at deploy)', runs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+# 关注索引基准测试: 内存占用和查询耗时
+# 运行: python3 benchmarks/follow_index.py [边数] [用户数]
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.follow_index import FollowIndex
+
+
+def make_edges(edge_count, user_count):
+    random.seed(0)
+    return [(random.randint(1, user_count), random.randint(1, user_count))
+            for _ in range(edge_count)]
+
+
+def main():
+    edge_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    user_count = int(sys.argv[2]) if len(sys.argv) > 2 else 50000
+    edges = make_edges(edge_count, user_count)
+
+    index = FollowIndex()
+    start = time.time()
+    index.build(edges)
+    print('build: %d edges, %d users in %.2fs' % (edge_count, user_count, time.time() - start))
+    print('memory: %.1f MB (%.1f bytes/edge)' % (index.memory_usage() / 1024.0 / 1024.0,
+            index.memory_usage() / float(edge_count)))
+
+    # 对比: 用set保存(关注者, 被关注者)二元组
+    pairs = set(edges)
+    pairs_size = sys.getsizeof(pairs) + sum(sys.getsizeof(p) for p in pairs)
+    print('baseline set of tuples: %.1f MB' % (pairs_size / 1024.0 / 1024.0))
+
+    lookups = [(random.randint(1, user_count), random.randint(1, user_count))
+               for _ in range(200000)]
+    start = time.time()
+    for a, b in lookups:
+        index.is_following(a, b)
+    elapsed = time.time() - start
+    print('is_following: %.2f us/lookup' % (elapsed / len(lookups) * 1e6))
+
+    start = time.time()
+    for a, _ in lookups:
+        index.follower_count(a)
+    elapsed = time.time() - start
+    print('follower_count: %.2f us/lookup' % (elapsed / len(lookups) * 1e6))
+
+    start = time.time()
+    for a, b in lookups[:20000]:
+        index.add(a, b)
+    elapsed = time.time() - start
+    print('add: %.2f us/edge' % (elapsed / 20000 * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+# 吞吐量基准测试: 单进程的开发服务器(manage.py runserver) 和 预派生多进程服务器(manage.py serve)
+# 两种服务器都在新的解释器中启动 使用同一个临时数据库 由多个客户端进程在固定时间内不断请求首页 资料页和文章页
+# 运行: python3 benchmarks/serve.py [持续秒数] [客户端并发数] [工作进程数]
+import http.client
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+URLS = ['/', '/user/alice', '/post/1']
+
+SETUP = '''
+from app import create_app, db
+from app.models import Role, User, Post
+app = create_app('production')
+with app.app_context():
+    db.create_all()
+    Role.insert_roles()
+    user = User(email='alice@example.com', username='alice', password='cat', confirmed=True)
+    db.session.add(user)
+    for i in range(50):
+        db.session.add(Post(body='post %d with *markdown* and http://example.com' % i, author=user))
+    db.session.commit()
+'''
+
+# runserver最终调用的也是run_simple(单进程 单线程)
+SINGLE = '''
+from werkzeug.serving import run_simple
+from app import create_app
+run_simple('127.0.0.1', %(port)d, create_app('production'))
+'''
+
+PREFORK = '''
+from app.server import serve
+serve('production', '127.0.0.1', %(port)d, %(workers)d, access_log=False)
+'''
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def wait_ready(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', URLS[0])
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('server did not start')
+
+
+# 客户端进程: 在duration秒内依次请求URLS 返回每个请求的耗时
+def client(args):
+    port, duration = args
+    latencies = []
+    deadline = time.time() + duration
+    i = 0
+    while time.time() < deadline:
+        start = time.time()
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        conn.request('GET', URLS[i % len(URLS)])
+        response = conn.getresponse()
+        response.read()
+        conn.close()
+        if response.status != 200:
+            raise RuntimeError('%s: %d' % (URLS[i % len(URLS)], response.status))
+        latencies.append(time.time() - start)
+        i += 1
+    return latencies
+
+
+def run(label, code, env, duration, concurrency, workers):
+    port = free_port()
+    server = subprocess.Popen([sys.executable, '-c', code % {'port': port, 'workers': workers}],
+                              cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(port)
+        # 预热 每个工作进程都处理过请求
+        client((port, 1))
+        with Pool(concurrency) as pool:
+            results = pool.map(client, [(port, duration)] * concurrency)
+    finally:
+        server.terminate()
+        server.wait()
+    latencies = sorted(sum(results, []))
+    print('%-26s %8.1f req/s  mean %6.1f ms  p99 %6.1f ms' % (
+        label, len(latencies) / float(duration),
+        sum(latencies) / len(latencies) * 1000, latencies[int(len(latencies) * 0.99)] * 1000))
+
+
+def main():
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else os.cpu_count()
+    tmp = tempfile.mkdtemp()
+    try:
+        env = dict(os.environ, FLASK_CONFIG='production',
+                   DATABASE_URL='sqlite:///' + os.path.join(tmp, 'data.sqlite'),
+                   ARCHIVE_DATABASE_URL='sqlite:///' + os.path.join(tmp, 'archive.sqlite'),
+                   FLASKY_LOCAL_STORE=os.path.join(tmp, 'local.sqlite'),
+                   FLASKY_TEMPLATE_CACHE_DIR=os.path.join(tmp, 'jinja'))
+        subprocess.check_call([sys.executable, '-c', SETUP], cwd=ROOT, env=env)
+        print('%d clients, %.0fs each' % (concurrency, duration))
+        run('runserver (1 process)', SINGLE, env, duration, concurrency, 1)
+        run('serve (%d workers)' % workers, PREFORK, env, duration, concurrency, workers)
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
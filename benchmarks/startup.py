@@ -0,0 +1,70 @@
+# 启动时间基准测试: 每个场景在新的解释器中执行 测量从启动到退出的时间
+# 运行: python3 benchmarks/startup.py [重复次数] [列出的最慢模块数]
+# python 3.7以上再用python -X importtime统计各模块的导入耗时 更早的版本没有这个选项 只输出总时间
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+SCENARIOS = [
+    ('import app.models', 'import app.models'),
+    ('create_app (all blueprints)', 'from app import create_app; create_app("testing")'),
+    ('create_app (no blueprints)', 'from app import create_app; create_app("testing", blueprints=[])'),
+    ('manage.py shell', 'import sys; sys.argv = ["manage.py", "shell"]; import manage'),
+    ('manage.py db', 'import sys; sys.argv = ["manage.py", "db"]; import manage'),
+]
+
+
+def run(code, importtime=False):
+    args = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', code]
+    env = dict(os.environ, FLASK_CONFIG='testing')
+    start = time.time()
+    result = subprocess.run(args, cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, universal_newlines=True)
+    elapsed = time.time() - start
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr)
+    return elapsed, result.stderr
+
+
+# 解析importtime输出 返回[(模块, 自身耗时us, 累计耗时us, 层级)]
+def parse_importtime(output):
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), int(own), int(cumulative), depth))
+    return imports
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    top = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    importtime = sys.version_info >= (3, 7)
+    if not importtime:
+        # 旧版本会忽略-X importtime 不能输出为0的导入耗时
+        print('python %d.%d does not support -X importtime, measuring wall time only'
+              % sys.version_info[:2], file=sys.stderr)
+    # 先运行一次 生成字节码缓存 之后的测量不包含编译时间
+    run('import manage')
+    for label, code in SCENARIOS:
+        wall = min(run(code)[0] for _ in range(repeat))
+        if not importtime:
+            print('%-28s wall %7.1f ms' % (label, wall * 1000))
+            continue
+        imports = parse_importtime(run(code, importtime=True)[1])
+        total = sum(cumulative for _, _, cumulative, depth in imports if depth == 0)
+        print('%-28s wall %7.1f ms  imports %7.1f ms  modules %d' % (
+            label, wall * 1000, total / 1000.0, len(imports)))
+        # 最慢的顶层导入(包含其依赖)
+        slowest = sorted((i for i in imports if i[3] <= 1), key=lambda i: -i[2])[:top]
+        for name, own, cumulative, depth in slowest:
+            print('    %-40s %7.1f ms' % (name, cumulative / 1000.0))
+
+
+if __name__ == '__main__':
+    main()
@@ -11,6 +11,52 @@ class Config:
     FLASKY_POSTS_PER_PAGE = 20 # 分页 每页显示的文章数
     FLASKY_FOLLOWERS_PER_PAGE = 50
     FLASKY_COMMENTS_PER_PAGE = 30
+    # 是否在进程内维护关注关系索引 开启后关注判断和计数不再查询数据库
+    FLASKY_FOLLOW_INDEX = os.environ.get('FLASKY_FOLLOW_INDEX') is not None
+    FLASKY_IMPORT_BATCH_SIZE = 1000 # 批量导入时每个事务插入的记录数
+    FLASKY_IMPORT_WORKERS = int(os.environ.get('FLASKY_IMPORT_WORKERS') or 0) # 渲染markdown的进程数 0或1表示不使用进程池
+    FLASKY_BATCH_MAX_REQUESTS = 20 # 一次批量请求最多包含的子请求数
+    FLASKY_BATCH_WORKERS = 4 # 并发执行GET子请求的线程数
+    FLASKY_COMPRESS_MIN_SIZE = 500 # 小于此长度(字节)的响应不压缩
+    FLASKY_COMPRESS_LEVEL = 6
+    FLASKY_PROFILE_CACHE_SIZE = 10000 # 缓存资料页统计数字的用户数
+    FLASKY_PROFILE_CACHE_TTL = int(os.environ.get('FLASKY_PROFILE_CACHE_TTL') or 60) # 其它机器上的写操作最多在这么多秒后反映到本进程的缓存
+    FLASKY_FEED_SIZE = 20 # 订阅中的文章数
+    FLASKY_FEED_CACHE_TTL = 300 # 其它机器上发表的文章最多在这么多秒后出现在本进程缓存的订阅中
+    # 本机其它进程的写操作通过本机共享存储通知缓存失效 每个进程最多每隔这么多秒检查一次(秒)
+    FLASKY_INVALIDATION_POLL_INTERVAL = 0.5
+    FLASKY_INVALIDATION_RETENTION = 600 # 失效记录保留的时间(秒)
+    FLASKY_RENDER_CACHE_SIZE = 10000 # 缓存的markdown渲染结果数
+    # 站点地图的输出目录和每个分块的url数 命令行生成时使用FLASKY_SITE_URL作为url前缀
+    FLASKY_SITEMAP_DIR = os.environ.get('FLASKY_SITEMAP_DIR') or os.path.join(basedir, 'tmp', 'sitemap')
+    FLASKY_SITEMAP_CHUNK_SIZE = 50000
+    FLASKY_SITEMAP_MAX_AGE = 60 * 60
+    FLASKY_SITE_URL = os.environ.get('FLASKY_SITE_URL') or 'http://localhost:5000'
+    # 本机各工作进程共享的SQLite文件 用于浏览计数的写缓冲等
+    FLASKY_LOCAL_STORE = os.environ.get('FLASKY_LOCAL_STORE') or \
+            os.path.join(basedir, 'tmp', 'local.sqlite')
+    FLASKY_VIEW_FLUSH_INTERVAL = 10 # 浏览计数从进程内合并到本机共享存储的间隔(秒)
+    FLASKY_VIEW_DRAIN_INTERVAL = 60 # 浏览计数从本机共享存储写入数据库的间隔(秒)
+    FLASKY_TRENDING_SIZE = 100 # 热门文章排行保留的文章数
+    FLASKY_TRENDING_HALF_LIFE = 6 * 60 * 60 # 热度的半衰期(秒)
+    FLASKY_TRENDING_WEIGHTS = {'view': 1, 'comment': 5} # 每次浏览和评论增加的热度
+    FLASKY_TRENDING_PERSIST_INTERVAL = 30 # 热度增量合并到本机共享存储的间隔(秒)
+    # 设置FLASKY_USE_JOBS=1时 发送邮件和渲染markdown交给后台任务 需要运行manage.py worker
+    FLASKY_USE_JOBS = os.environ.get('FLASKY_USE_JOBS') == '1'
+    # 归档: 禁用超过这么多天的评论移到归档数据库(SQLALCHEMY_BINDS中的archive)
+    # 文章默认不归档 设置天数后超过这么多天的文章连同评论一起归档 归档后文章链接仍然可以访问(只读)
+    FLASKY_ARCHIVE_COMMENT_DAYS = 30
+    FLASKY_ARCHIVE_POST_DAYS = None
+    FLASKY_ARCHIVE_BATCH_SIZE = 500
+    FLASKY_JOB_QUEUES = {'default': 4, 'mail': 2} # 每个队列同时执行的最大任务数
+    FLASKY_JOB_RETRY_DELAY = 10 # 任务失败后第一次重试的延迟(秒) 之后每次加倍
+    FLASKY_JOB_POLL_INTERVAL = 0.5 # 工作进程没有任务时的等待时间(秒)
+    # 模板字节码缓存目录 所有工作进程共享 设置为空字符串时不使用缓存
+    FLASKY_TEMPLATE_CACHE_DIR = os.environ.get('FLASKY_TEMPLATE_CACHE_DIR',
+            os.path.join(basedir, 'tmp', 'jinja'))
+    # 要注册的蓝本 逗号分隔 例如只提供API的进程设置为api 不设置时注册全部蓝本
+    FLASKY_BLUEPRINTS = [name.strip() for name in os.environ['FLASKY_BLUEPRINTS'].split(',')] \
+            if os.environ.get('FLASKY_BLUEPRINTS') else None
 
     @staticmethod
     def init_app(app):
@@ -26,17 +72,25 @@ class DevelopmentConfig(Config):
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     SQLALCHEMY_DATABASE_URI = os.environ.get('DEV_DATABASE_URL') or \
             'sqlite:///' + os.path.join(basedir, 'data-dev.sqlite')
+    SQLALCHEMY_BINDS = {'archive': os.environ.get('DEV_ARCHIVE_DATABASE_URL') or
+            'sqlite:///' + os.path.join(basedir, 'data-dev-archive.sqlite')}
 
 
 class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or \
             'sqlite:///' + os.path.join(basedir, 'data-test.sqlite')
+    SQLALCHEMY_BINDS = {'archive': 'sqlite://'}
+    FLASKY_TEMPLATE_CACHE_DIR = None
+    FLASKY_LOCAL_STORE = ':memory:'
+    FLASKY_USE_JOBS = False
 
 
 class PeoductionConfig(Config):
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
             'sqlite:///' + os.path.join(basedir, 'data.sqlite')
+    SQLALCHEMY_BINDS = {'archive': os.environ.get('ARCHIVE_DATABASE_URL') or
+            'sqlite:///' + os.path.join(basedir, 'data-archive.sqlite')}
 
 
 config = {
@@ -1,17 +1,27 @@
 import os
+import sys
+from functools import partial
 from app import create_app, db
-from app.models import User, Role, Permission, Post, Follow, Comment
+from app.models import User, Role, Permission, Post, Follow, Comment, Suggestion, \
+        ArchivedPost, ArchivedComment
 from flask_script import Manager, Shell
 from flask_migrate import Migrate, MigrateCommand
 
-app = create_app(os.getenv('FLASK_CONFIG') or 'default')
+# 这些命令不处理请求 不需要注册蓝本 省去导入视图 表单和API模块的时间
+LIGHT_COMMANDS = ('db', 'suggest', 'export', 'import_data', 'build_assets',
+                  'compress_static', 'compile_templates', 'flush_views', 'worker', 'jobs',
+                  'rerender', 'archive', 'serve', 'deploy')
+
+app = create_app(os.getenv('FLASK_CONFIG') or 'default',
+                 blueprints=[] if sys.argv[1:2] and sys.argv[1] in LIGHT_COMMANDS else None)
 manager = Manager(app)
 migrate = Migrate(app, db)
 
 
 def make_shell_context():
     return dict(app=app, db=db, User=User, Role=Role, Permission=Permission, 
-            Post=Post, Follow=Follow, Comment=Comment)
+            Post=Post, Follow=Follow, Comment=Comment, Suggestion=Suggestion,
+            ArchivedPost=ArchivedPost, ArchivedComment=ArchivedComment)
 manager.add_command("shell", Shell(make_context=make_shell_context))
 manager.add_command('db', MigrateCommand)
 
@@ -23,6 +33,187 @@ def test():
     tests = unittest.TestLoader().discover('tests')
     unittest.TextTestRunner(verbosity=2).run(tests)
 
+@manager.option('-n', '--top', dest='top', type=int, default=10, help='每个用户保存的推荐数')
+@manager.option('-w', '--cofollow-weight', dest='cofollow_weight', type=float, default=0.5,
+        help='共同关注得分的权重 0表示只使用朋友的朋友')
+def suggest(top, cofollow_weight):
+    """重新计算推荐关注 可由cron定期执行"""
+    from app.recommend import compute_suggestions
+    count = compute_suggestions(top_n=top, cofollow_weight=cofollow_weight)
+    print('已写入 %d 条推荐' % count)
+
+@manager.option('resource', help='posts, comments 或 users')
+@manager.option('-o', '--output', dest='output', default=None, help='输出文件 默认输出到标准输出')
+@manager.option('-s', '--since', dest='since', default=None, help='只导出该时间之后的记录')
+@manager.option('-z', '--gzip', dest='gzip', action='store_true', default=False, help='gzip压缩')
+def export(resource, output, since, gzip):
+    """以NDJSON格式流式导出数据"""
+    import sys
+    from app.export import export_ndjson, parse_time
+    out = open(output, 'wb') if output else sys.stdout.buffer
+    try:
+        for chunk in export_ndjson(resource, since=parse_time(since), gzip=gzip):
+            out.write(chunk)
+    finally:
+        if output:
+            out.close()
+
+@manager.option('resource', help='posts 或 comments')
+@manager.option('input', help='NDJSON文件 以.gz结尾时自动解压')
+@manager.option('-a', '--author', dest='author', default=None,
+        help='作者邮箱 不指定时使用每条记录中的author_id')
+@manager.option('-b', '--batch-size', dest='batch_size', type=int, default=None)
+@manager.option('-w', '--workers', dest='workers', type=int, default=os.cpu_count(),
+        help='渲染markdown的进程数')
+def import_data(resource, input, author, batch_size, workers):
+    """从NDJSON文件批量导入文章或评论"""
+    import gzip
+    from app.importer import import_ndjson, summarize
+    author_id = None
+    if author is not None:
+        user = User.query.filter_by(email=author).first()
+        if user is None:
+            print('系统中无此用户')
+            return
+        author_id = user.id
+    opener = gzip.open if input.endswith('.gz') else open
+    with opener(input, 'rb') as f:
+        results = import_ndjson(resource, f, author_id=author_id,
+                batch_size=batch_size, workers=workers)
+    for result in results:
+        if result['status'] != 'ok':
+            print('第 %d 行: %s' % (result['index'] + 1, result['message']))
+    print('成功导入 %(imported)d 条 失败 %(failed)d 条' % summarize(results))
+    print_render_stats()
+
+# 输出本进程中渲染缓存的命中率
+def print_render_stats():
+    from app import render_cache
+    stats = render_cache.stats()
+    print('渲染缓存: 命中 %d 次 未命中 %d 次 命中率 %.1f%%'
+          % (stats['hits'], stats['misses'], stats['hit_rate'] * 100))
+
+@manager.option('resource', help='posts 或 comments')
+@manager.option('-w', '--workers', dest='workers', type=int, default=os.cpu_count(),
+        help='渲染markdown的进程数')
+def rerender(resource, workers):
+    """重新渲染所有文章或评论的HTML 修改标签白名单或升级markdown/bleach后使用"""
+    from app.models import POST_ALLOWED_TAGS, COMMENT_ALLOWED_TAGS
+    from app.rendering import rerender_all
+    model, allowed_tags = {'posts': (Post, POST_ALLOWED_TAGS),
+                           'comments': (Comment, COMMENT_ALLOWED_TAGS)}[resource]
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            count = rerender_all(model, allowed_tags, map=partial(pool.map, chunksize=32))
+    else:
+        count = rerender_all(model, allowed_tags)
+    print('更新了 %d 条记录' % count)
+    print_render_stats()
+
+@manager.command
+def build_assets():
+    """计算静态文件指纹 生成清单文件"""
+    from app import assets
+    manifest = assets.write_manifest()
+    print('已为 %d 个静态文件生成指纹' % len(manifest))
+
+@manager.command
+def compress_static():
+    """预压缩静态文件 生成.gz和.br(安装了brotli时)文件"""
+    from app.compress import precompress_directory
+    folders = [app.static_folder] + [bp.static_folder for bp in app.blueprints.values()
+                                     if bp.static_folder]
+    count = 0
+    for folder in folders:
+        count += precompress_directory(folder, app.config['FLASKY_COMPRESS_MIMETYPES'])
+    print('生成了 %d 个预压缩文件' % count)
+
+@manager.command
+def compile_templates():
+    """预先编译所有模板 写入模板字节码缓存"""
+    from app.templating import compile_templates
+    if app.jinja_env.bytecode_cache is None:
+        print('没有配置模板缓存目录(FLASKY_TEMPLATE_CACHE_DIR)')
+        return
+    compiled, failed = compile_templates()
+    for name in failed:
+        print('编译失败: %s' % name)
+    print('已编译 %d 个模板' % compiled)
+
+@manager.command
+def flush_views():
+    """立即把本机共享存储中缓冲的浏览计数写入数据库"""
+    from app import view_counter
+    view_counter.flush(drain=False)
+    print('写入了 %d 次浏览' % view_counter.drain(force=True))
+
+@manager.option('-f', '--full', dest='full', action='store_true', default=False,
+        help='完整重新生成 删除文章或用户改名后使用')
+def sitemap(full):
+    """生成站点地图 默认只重写最后一个未满的分块和新增的分块"""
+    from app.sitemap import generate_sitemap
+    with app.test_request_context(base_url=app.config['FLASKY_SITE_URL']):
+        count = generate_sitemap(full=full)
+    print('写入了 %d 个站点地图分块' % count)
+
+@manager.option('output', help='输出目录')
+@manager.option('-f', '--full', dest='full', action='store_true', default=False,
+        help='完整重新生成 修改或删除文章后使用')
+@manager.option('-w', '--workers', dest='workers', type=int, default=os.cpu_count(),
+        help='渲染页面的进程数')
+def snapshot(output, full, workers):
+    """把首页 资料页和文章页渲染成静态HTML 作为只读镜像"""
+    from app.snapshot import snapshot
+    rendered, failed = snapshot(output, os.getenv('FLASK_CONFIG') or 'default',
+            full=full, workers=workers)
+    for url, status in failed:
+        print('%s: %d' % (url, status))
+    print('渲染了 %d 个页面' % rendered)
+
+@manager.option('-p', '--processes', dest='processes', type=int, default=os.cpu_count(),
+        help='工作进程数')
+@manager.option('-q', '--queues', dest='queues', default=None,
+        help='只处理这些队列 逗号分隔 默认处理所有队列')
+def worker(processes, queues):
+    """启动后台任务的工作进程 Ctrl-C后等待正在执行的任务完成再退出"""
+    from app.jobs import run_workers
+    if queues:
+        queues = [queue.strip() for queue in queues.split(',')]
+    print('启动 %d 个工作进程' % processes)
+    run_workers(os.getenv('FLASK_CONFIG') or 'default', processes, queues)
+
+@manager.option('-H', '--host', dest='host', default='127.0.0.1')
+@manager.option('-p', '--port', dest='port', type=int, default=8000)
+@manager.option('-w', '--workers', dest='workers', type=int, default=os.cpu_count(),
+        help='工作进程数')
+@manager.option('--no-access-log', dest='access_log', action='store_false', default=True,
+        help='不输出访问日志')
+def serve(host, port, workers, access_log):
+    """启动生产环境的多进程服务器 SIGHUP平滑重启 SIGTERM或Ctrl-C停止"""
+    from app.server import serve
+    print('在 http://%s:%d/ 启动 %d 个工作进程 主进程pid %d' % (host, port, workers, os.getpid()))
+    serve(os.getenv('FLASK_CONFIG') or 'default', host, port, workers, access_log=access_log)
+
+@manager.command
+def jobs():
+    """显示各队列中的任务数"""
+    from app import jobs
+    for row in jobs.stats():
+        print('%(queue)s\t%(status)s\t%(count)d' % row)
+
+@manager.option('-c', '--comment-days', dest='comment_days', type=int, default=None,
+        help='归档禁用超过这么多天的评论 默认使用FLASKY_ARCHIVE_COMMENT_DAYS')
+@manager.option('-p', '--post-days', dest='post_days', type=int, default=None,
+        help='归档超过这么多天的文章和它们的评论 默认使用FLASKY_ARCHIVE_POST_DAYS(不归档)')
+@manager.option('-b', '--batch-size', dest='batch_size', type=int, default=None)
+def archive(comment_days, post_days, batch_size):
+    """把旧的禁用评论(和旧文章)分批移到归档数据库 可由cron定期执行"""
+    from app.archive import archive_comments, archive_posts
+    posts, comments = archive_posts(post_days, batch_size=batch_size)
+    comments += archive_comments(comment_days, batch_size=batch_size)
+    print('归档了 %d 篇文章 %d 条评论' % (posts, comments))
+
 @manager.command
 def deploy():
     """执行部署任务"""
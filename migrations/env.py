@@ -65,6 +65,13 @@ def run_migrations_online():
                 directives[:] = []
                 logger.info('No changes in schema detected.')
 
+    # 回填检查点表由app.backfill维护 不在模型中 自动生成迁移时忽略它
+    # 归档数据库中的表(__bind_key__为archive)也不属于主数据库 由manage.py archive创建
+    def include_object(object, name, type_, reflected, compare_to):
+        if type_ == 'table' and (name == 'data_migrations' or object.info.get('bind_key')):
+            return False
+        return True
+
     engine = engine_from_config(config.get_section(config.config_ini_section),
                                 prefix='sqlalchemy.',
                                 poolclass=pool.NullPool)
@@ -73,6 +80,7 @@ def run_migrations_online():
     context.configure(connection=connection,
                       target_metadata=target_metadata,
                       process_revision_directives=process_revision_directives,
+                      include_object=include_object,
                       **current_app.extensions['migrate'].configure_args)
 
     try:
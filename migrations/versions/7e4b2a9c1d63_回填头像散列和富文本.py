@@ -0,0 +1,43 @@
+"""回填头像散列和富文本
+
+Revision ID: 7e4b2a9c1d63
+Revises: 5c2e8f1a9d47
+Create Date: 2026-10-19 16:21:08.304517
+
+"""
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.backfill import backfill_in_migration
+
+
+# revision identifiers, used by Alembic.
+revision = '7e4b2a9c1d63'
+down_revision = '5c2e8f1a9d47'
+branch_labels = None
+depends_on = None
+
+
+# 98ca98ff4741和4b9c573bb193只添加了列 已有的行中avatar_hash和body_html为空
+# 这里分批回填 中断后再次执行会从上次的位置继续
+def upgrade():
+    from app.models import render_post_html, render_comment_html
+
+    users = sa.table('users', sa.column('id'), sa.column('email'), sa.column('avatar_hash'))
+    backfill_in_migration(op, 'users.avatar_hash', users, ['email'],
+            lambda row: {'avatar_hash': hashlib.md5(row.email.encode('utf-8')).hexdigest()},
+            where=sa.and_(users.c.avatar_hash == None, users.c.email != None))
+
+    for name, render in (('posts', render_post_html), ('comments', render_comment_html)):
+        table = sa.table(name, sa.column('id'), sa.column('body'), sa.column('body_html'))
+        backfill_in_migration(op, '%s.body_html' % name, table, ['body'],
+                lambda row, render=render: {'body_html': render(row.body)},
+                where=sa.and_(table.c.body_html == None, table.c.body != None),
+                batch_size=200)
+
+
+def downgrade():
+    # 只回填了数据 没有需要撤销的结构变化
+    pass
@@ -0,0 +1,128 @@
+import unittest
+import json
+from base64 import b64encode
+
+from flask import g
+
+from app import create_app, db
+from app.api_1_0 import batch
+from app.models import User, Role, Post, Comment
+
+
+class APITestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get_api_headers(self, username, password):
+        return {
+            'Authorization': 'Basic ' + b64encode(
+                (username + ':' + password).encode('utf-8')).decode('utf-8'),
+            'Accept': 'application/json',
+            'Content-Type': 'application/json'
+        }
+
+    def add_user(self):
+        u = User(email='123@abc.com', username='john', password='cat', confirmed=True)
+        db.session.add(u)
+        db.session.commit()
+        return u
+
+    # 测试批量请求
+    def test_batch(self):
+        u = self.add_user()
+        post = Post(body='hello', author=u)
+        db.session.add(post)
+        db.session.commit()
+        for parallel in (False, True):
+            response = self.client.post('/api/v1.0/batch',
+                    headers=self.get_api_headers('123@abc.com', 'cat'),
+                    data=json.dumps({'parallel': parallel, 'requests': [
+                        {'path': '/api/v1.0/posts/%d' % post.id},
+                        {'path': '/api/v1.0/users/%d' % u.id},
+                        {'method': 'POST', 'path': '/api/v1.0/posts/', 'body': {'body': 'new'}},
+                        {'path': '/api/v1.0/posts/12345'},
+                        {'path': '/user/john'}]}))
+            self.assertEqual(response.status_code, 200)
+            responses = json.loads(response.get_data(as_text=True))['responses']
+            self.assertEqual([r['status'] for r in responses], [200, 200, 201, 404, 400])
+            self.assertEqual(responses[0]['body']['body'], 'hello')
+            self.assertEqual(responses[1]['body']['username'], 'john')
+            self.assertIn('Location', responses[2]['headers'])
+
+    # 批量审核评论的参数类型不对时返回400
+    def test_moderate_comments_validation(self):
+        u = self.add_user()
+        u.role = Role.query.filter_by(name='Moderator').first()
+        post = Post(body='hello', author=u)
+        db.session.add_all([u, post, Comment(body='spam', post=post, author=u)])
+        db.session.commit()
+        headers = self.get_api_headers('123@abc.com', 'cat')
+        for body in ({'ids': [True]}, {'author': [u.id]}, {'author': True},
+                     {'body_contains': ['spam']}, {'body_contains': {'a': 1}},
+                     {'body_contains': ''}):
+            body['disabled'] = True
+            response = self.client.patch('/api/v1.0/comments/', headers=headers,
+                                         data=json.dumps(body))
+            self.assertEqual(response.status_code, 400, body)
+        response = self.client.patch('/api/v1.0/comments/', headers=headers, data=json.dumps(
+            {'disabled': True, 'author': u.id, 'body_contains': 'spam'}))
+        self.assertEqual(json.loads(response.get_data(as_text=True))['count'], 1)
+
+    # 并发执行的子请求在各自线程的会话中重新加载用户
+    def test_parallel_batch_reloads_user(self):
+        u = self.add_user()
+        seen = []
+        dispatch = batch._dispatch
+
+        def record(app, environ):
+            user = g.current_user
+            seen.append((user.id, db.object_session(user) is db.session(), user.role.name))
+            return dispatch(app, environ)
+        batch._dispatch = record
+        try:
+            response = self.client.post('/api/v1.0/batch',
+                    headers=self.get_api_headers('123@abc.com', 'cat'),
+                    data=json.dumps({'parallel': True, 'requests': [
+                        {'path': '/api/v1.0/users/%d' % u.id}] * 3}))
+        finally:
+            batch._dispatch = dispatch
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(seen, [(u.id, True, 'User')] * 3)
+
+    def test_batch_requires_authentication(self):
+        response = self.client.post('/api/v1.0/batch',
+                headers=self.get_api_headers('123@abc.com', 'dog'),
+                data=json.dumps({'requests': [{'path': '/api/v1.0/posts/'}]}))
+        self.assertEqual(response.status_code, 401)
+
+    # 测试按需返回字段和嵌入作者
+    def test_fields_and_embed(self):
+        u = self.add_user()
+        posts = [Post(body='post %d' % i, author=u) for i in range(3)]
+        db.session.add_all(posts)
+        db.session.commit()
+        headers = self.get_api_headers('123@abc.com', 'cat')
+        response = self.client.get('/api/v1.0/posts/?fields=body,comment_count', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        json_posts = json.loads(response.get_data(as_text=True))['posts']
+        self.assertEqual(len(json_posts), 3)
+        self.assertEqual(sorted(json_posts[0].keys()), ['body', 'comment_count'])
+        response = self.client.get('/api/v1.0/posts/%d?embed=author' % posts[0].id, headers=headers)
+        json_post = json.loads(response.get_data(as_text=True))
+        self.assertEqual(json_post['author']['username'], 'john')
+        self.assertEqual(json_post['author']['post_count'], 3)
+        self.assertEqual(json_post['comment_count'], 0)
+        response = self.client.get('/api/v1.0/posts/?embed=comments', headers=headers)
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/v1.0/users/%d?fields=username' % u.id, headers=headers)
+        self.assertEqual(json.loads(response.get_data(as_text=True)), {'username': 'john'})
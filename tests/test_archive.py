@@ -0,0 +1,118 @@
+import json
+import unittest
+from base64 import b64encode
+from datetime import datetime, timedelta
+from app import create_app, db
+from app import archive
+from app.archive import archive_comments, archive_posts
+from app.models import User, Role, Post, Comment, ArchivedPost, ArchivedComment
+
+
+class ArchiveTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        old = datetime.utcnow() - timedelta(days=100)
+        self.u = User(email='john@example.com', username='john', password='cat', confirmed=True)
+        self.old_post = Post(body='old post', author=self.u, timestamp=old)
+        self.new_post = Post(body='new post', author=self.u)
+        self.comments = [
+            Comment(body='old disabled', post=self.new_post, author=self.u, timestamp=old, disabled=True),
+            Comment(body='old enabled', post=self.new_post, author=self.u, timestamp=old, disabled=False),
+            Comment(body='new disabled', post=self.new_post, author=self.u, disabled=True),
+            Comment(body='on old post', post=self.old_post, author=self.u, timestamp=old),
+        ]
+        db.session.add_all([self.u, self.old_post, self.new_post] + self.comments)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def api_headers(self, username, password):
+        return {
+            'Authorization': 'Basic ' + b64encode(
+                (username + ':' + password).encode('utf-8')).decode('utf-8'),
+            'Accept': 'application/json',
+            'Content-Type': 'application/json'
+        }
+
+    def test_archive_disabled_comments(self):
+        id = self.comments[0].id
+        self.assertEqual(archive_comments(30, batch_size=1, pause=0), 1)
+        self.assertEqual(Comment.query.count(), 3)
+        self.assertIsNone(Comment.query.get(id))
+        self.assertEqual(ArchivedComment.query.get(id).body, 'old disabled')
+        # 重复执行不会重复归档
+        self.assertEqual(archive_comments(30, pause=0), 0)
+        self.assertEqual(ArchivedComment.query.count(), 1)
+        # 评论的链接仍然可以访问
+        response = self.client.get('/api/v1.0/comments/%d' % id,
+                                   headers=self.api_headers('john@example.com', 'cat'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'old disabled', response.data)
+
+    def test_archive_posts(self):
+        post_id = self.old_post.id
+        self.assertEqual(archive_posts(None), (0, 0))
+        self.assertEqual(archive_posts(30, pause=0), (1, 1))
+        self.assertIsNone(Post.query.get(post_id))
+        self.assertEqual(Comment.query.filter_by(post_id=post_id).count(), 0)
+        self.assertEqual(ArchivedPost.query.get(post_id).comments.count(), 1)
+        # 文章链接从归档数据库读取 只读
+        response = self.client.get('/post/%d' % post_id)
+        self.assertEqual(response.status_code, 200)
+        data = response.get_data(as_text=True)
+        self.assertIn('old post', data)
+        self.assertIn('on old post', data)
+        self.assertIn('已归档', data)
+        response = self.client.get('/api/v1.0/posts/%d' % post_id,
+                                   headers=self.api_headers('john@example.com', 'cat'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'old post', response.data)
+        # 文章JSON中的评论链接也从归档数据库读取
+        comments_url = json.loads(response.get_data(as_text=True))['comments']
+        response = self.client.get(comments_url,
+                                   headers=self.api_headers('john@example.com', 'cat'))
+        self.assertEqual(response.status_code, 200)
+        comments = json.loads(response.get_data(as_text=True))['comments']
+        self.assertEqual([c['body'] for c in comments], ['on old post'])
+        self.assertEqual(self.client.get('/post/12345').status_code, 404)
+
+    # 在写入归档和删除之间发生的修改 模拟其它请求在两步之间执行
+    def test_concurrent_changes_are_kept(self):
+        copy = archive._copy
+        changes = []
+
+        def copy_then_change(conn, model, rows):
+            copy(conn, model, rows)
+            if changes:
+                changes.pop()()
+        archive._copy = copy_then_change
+        try:
+            # 写入归档之后评论被重新启用
+            comment_id = self.comments[0].id
+
+            def enable():
+                db.session.query(Comment).filter_by(id=comment_id).update({'disabled': False})
+            changes.append(enable)
+            self.assertEqual(archive_comments(30, pause=0), 0)
+            self.assertIsNotNone(Comment.query.get(comment_id))
+            self.assertIsNone(ArchivedComment.query.get(comment_id))
+            # 写入归档之后旧文章有了新评论 这一批不删除 下一批连同新评论一起归档
+            post_id = self.old_post.id
+
+            def comment():
+                db.session.add(Comment(body='late', post_id=post_id, author_id=self.u.id))
+            changes.append(comment)
+            self.assertEqual(archive_posts(30, pause=0), (1, 2))
+            self.assertIsNone(Post.query.get(post_id))
+            self.assertEqual(sorted(c.body for c in ArchivedPost.query.get(post_id).comments),
+                             ['late', 'on old post'])
+        finally:
+            archive._copy = copy
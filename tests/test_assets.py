@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from app import create_app, db, assets
+
+
+class AssetsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.static = tempfile.mkdtemp()
+        with open(os.path.join(self.static, 'style.css'), 'w') as f:
+            f.write("body { background-image: url('bg.jpg'); }\n")
+        with open(os.path.join(self.static, 'bg.jpg'), 'wb') as f:
+            f.write(b'\xff\xd8\xff')
+        self.app = create_app('testing')
+        self.app.static_folder = self.static
+        self.app.config['FLASKY_ASSETS_MANIFEST'] = os.path.join(self.static, 'manifest.json')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.static)
+
+    def test_fingerprinted_url(self):
+        manifest = assets.write_manifest()
+        self.assertEqual(sorted(manifest.keys()), ['bg.jpg', 'style.css'])
+        with self.app.test_request_context('/'):
+            url = assets.url('style.css')
+            self.assertEqual(assets.url('missing.css'), '/static/missing.css')
+        self.assertRegex(url, r'^/assets/style\.[0-9a-f]{10}\.css$')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        # 样式表引用的图片改为带指纹的文件名
+        self.assertIn(b"url('%s')" % manifest['bg.jpg'].encode(), response.data)
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertIn('max-age=31536000', response.headers['Cache-Control'])
+        response.close()
+        # 原文件名也能访问
+        response = self.client.get('/assets/bg.jpg')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('immutable', response.headers.get('Cache-Control', ''))
+        response.close()
+        self.assertEqual(self.client.get('/assets/style.0000000000.css').status_code, 404)
+
+    def test_content_change_changes_url(self):
+        assets.write_manifest()
+        with self.app.test_request_context('/'):
+            before = assets.url('style.css')
+        with open(os.path.join(self.static, 'style.css'), 'a') as f:
+            f.write('p { color: red; }\n')
+        assets.write_manifest()
+        with self.app.test_request_context('/'):
+            after = assets.url('style.css')
+        self.assertNotEqual(before, after)
+        # 只改动样式表引用的图片 样式表的url也变
+        with open(os.path.join(self.static, 'bg.jpg'), 'ab') as f:
+            f.write(b'\x00')
+        assets.write_manifest()
+        with self.app.test_request_context('/'):
+            self.assertNotEqual(assets.url('style.css'), after)
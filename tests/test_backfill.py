@@ -0,0 +1,75 @@
+import unittest
+import sqlalchemy as sa
+from app import create_app, db
+from app.backfill import backfill, load_checkpoint, data_migrations
+from app.models import User
+
+
+class BackfillTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        db.session.add_all([User(email='%d@example.com' % i, username='user%d' % i)
+                            for i in range(10)])
+        db.session.commit()
+        db.session.execute(User.__table__.update().values(avatar_hash=None))
+        db.session.commit()
+        self.users = sa.table('users', sa.column('id'), sa.column('email'),
+                              sa.column('avatar_hash'))
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        data_migrations.drop(db.engine, checkfirst=True)
+        self.app_context.pop()
+
+    def run_backfill(self, compute):
+        return backfill(db.engine, 'users.avatar_hash', self.users, ['email'], compute,
+                        where=self.users.c.avatar_hash == None, batch_size=3, pause=0)
+
+    def test_backfill_in_batches(self):
+        seen = []
+
+        def compute(row):
+            seen.append(row.id)
+            return {'avatar_hash': row.email[:2]}
+
+        self.assertEqual(self.run_backfill(compute), 10)
+        self.assertEqual(seen, sorted(seen))
+        self.assertEqual(len(seen), 10)
+        self.assertEqual(User.query.filter(User.avatar_hash == None).count(), 0)
+        checkpoint = load_checkpoint(db.engine, 'users.avatar_hash')
+        self.assertTrue(checkpoint.done)
+        self.assertEqual(checkpoint.rows, 10)
+        # 已完成的回填不再执行
+        self.assertEqual(self.run_backfill(compute), 0)
+        self.assertEqual(len(seen), 10)
+
+    def test_resume_after_failure(self):
+        seen = []
+
+        def failing(row):
+            if len(seen) == 7:
+                raise RuntimeError('interrupted')
+            seen.append(row.id)
+            return {'avatar_hash': 'x'}
+
+        with self.assertRaises(RuntimeError):
+            self.run_backfill(failing)
+        # 前两批已经提交 第三批整体回滚
+        checkpoint = load_checkpoint(db.engine, 'users.avatar_hash')
+        self.assertFalse(checkpoint.done)
+        self.assertEqual(checkpoint.rows, 6)
+        self.assertEqual(User.query.filter(User.avatar_hash == None).count(), 4)
+        resumed = []
+
+        def compute(row):
+            resumed.append(row.id)
+            return {'avatar_hash': 'x'}
+
+        self.assertEqual(self.run_backfill(compute), 4)
+        # 从检查点之后的第一行继续
+        self.assertEqual(resumed, [7, 8, 9, 10])
+        self.assertTrue(load_checkpoint(db.engine, 'users.avatar_hash').done)
@@ -22,3 +22,11 @@ class BasicsTestCase(unittest.TestCase):
 
     def test_app_is_testing(self):
         self.assertTrue(current_app.config['TESTING'])
+
+    def test_selected_blueprints(self):
+        app = create_app('testing', blueprints=['api'])
+        self.assertTrue('api' in app.blueprints)
+        self.assertFalse('main' in app.blueprints)
+        self.assertFalse('auth' in app.blueprints)
+        app = create_app('testing', blueprints=[])
+        self.assertFalse('api' in app.blueprints)
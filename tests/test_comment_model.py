@@ -0,0 +1,64 @@
+import unittest
+
+from app import create_app, db
+from app.exceptions import ValidationError
+from app.main.forms import ModerateForm
+from app.models import User, Post, Comment
+
+
+class CommentModelTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    # 测试批量审核评论
+    def test_moderate(self):
+        u1 = User(email='123@abc.com', password='cat')
+        u2 = User(email='234@abc.com', password='dog')
+        post = Post(body='post', author=u1)
+        db.session.add_all([u1, u2, post])
+        db.session.commit()
+        comments = [Comment(body='spam %d' % i, post=post, author=u2) for i in range(3)]
+        comments.append(Comment(body='hello', post=post, author=u1))
+        db.session.add_all(comments)
+        db.session.commit()
+        self.assertEqual(Comment.moderate(True, body_contains='spam'), 3)
+        # 已经禁用的评论不计入受影响的行数
+        self.assertEqual(Comment.moderate(True, author_id=u2.id), 0)
+        self.assertEqual(Comment.moderate(False, ids=[comments[0].id, comments[3].id]), 1)
+        db.session.commit()
+        self.assertEqual(Comment.query.filter_by(disabled=True).count(), 2)
+        with self.assertRaises(ValidationError):
+            Comment.moderate(True)
+
+    # 关键字中的LIKE通配符按原样匹配
+    def test_moderate_wildcard_keyword(self):
+        u = User(email='123@abc.com', password='cat')
+        post = Post(body='post', author=u)
+        bodies = ['free_money', 'free-money', '100% free', 'a\\b', 'ab']
+        db.session.add_all([u, post] + [Comment(body=body, post=post, author=u) for body in bodies])
+        db.session.commit()
+        self.assertEqual(Comment.moderate(True, body_contains='free_money'), 1)
+        self.assertEqual(Comment.moderate(True, body_contains='%'), 1)
+        self.assertEqual(Comment.moderate(True, body_contains='\\'), 1)
+        db.session.commit()
+        self.assertEqual(sorted(c.body for c in Comment.query.filter_by(disabled=True)),
+                         ['100% free', 'a\\b', 'free_money'])
+
+    # 按关键字审核时关键字不能为空
+    def test_moderate_form_requires_keyword(self):
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        for keyword, valid in (('', False), ('  ', False), ('spam', True)):
+            with self.app.test_request_context('/moderate', method='POST', data={
+                    'action': 'disable', 'scope': 'keyword', 'keyword': keyword}):
+                self.assertEqual(ModerateForm().validate(), valid)
+        with self.app.test_request_context('/moderate', method='POST', data={
+                'action': 'disable', 'scope': 'selected', 'keyword': ''}):
+            self.assertTrue(ModerateForm().validate())
@@ -0,0 +1,76 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+from app import create_app, db
+from app.compress import precompress_directory
+from app.models import User, Post
+
+
+class CompressTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_compress_html(self):
+        response = self.client.get('/auth/login', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers.get('Content-Encoding'), 'gzip')
+        self.assertIn('Accept-Encoding', response.headers.get('Vary'))
+        self.assertIn(b'<html', gzip.decompress(response.data))
+        response = self.client.get('/auth/login')
+        self.assertIsNone(response.headers.get('Content-Encoding'))
+
+    def test_min_size(self):
+        self.app.config['FLASKY_COMPRESS_MIN_SIZE'] = 10 ** 9
+        response = self.client.get('/auth/login', headers={'Accept-Encoding': 'gzip'})
+        self.assertIsNone(response.headers.get('Content-Encoding'))
+
+    # 压缩后的订阅带弱ETag 用它发出的条件请求仍然返回304
+    def test_compressed_etag_is_weak(self):
+        u = User(email='john@example.com', username='john', password='cat')
+        db.session.add_all([u] + [Post(body='post %d' % i, author=u) for i in range(20)])
+        db.session.commit()
+        response = self.client.get('/feed', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers.get('Content-Encoding'), 'gzip')
+        etag = response.headers['ETag']
+        self.assertTrue(etag.startswith('W/'))
+        response = self.client.get('/feed', headers={'Accept-Encoding': 'gzip',
+                                                     'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['ETag'], etag)
+        # 不压缩的响应保留强ETag
+        response = self.client.get('/feed')
+        self.assertIsNone(response.headers.get('Content-Encoding'))
+        self.assertFalse(response.headers['ETag'].startswith('W/'))
+
+    def test_precompressed_static(self):
+        static = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(static, 'site.css'), 'w') as f:
+                f.write('body { color: red; }\n' * 100)
+            with open(os.path.join(static, 'photo.jpg'), 'wb') as f:
+                f.write(b'\xff\xd8' * 1000)
+            self.app.static_folder = static
+            self.assertTrue(precompress_directory(static) >= 1)
+            self.assertTrue(os.path.exists(os.path.join(static, 'site.css.gz')))
+            self.assertFalse(os.path.exists(os.path.join(static, 'photo.jpg.gz')))
+            response = self.client.get('/static/site.css', headers={'Accept-Encoding': 'gzip'})
+            self.assertEqual(response.headers.get('Content-Encoding'), 'gzip')
+            self.assertEqual(response.mimetype, 'text/css')
+            self.assertEqual(gzip.decompress(response.data), b'body { color: red; }\n' * 100)
+            response.close()
+            response = self.client.get('/static/site.css')
+            self.assertIsNone(response.headers.get('Content-Encoding'))
+            response.close()
+        finally:
+            shutil.rmtree(static)
@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from app import create_app, db, view_counter
+from app.counters import ViewCounter
+from app.local_store import LocalStore
+from app.models import User, Post
+
+
+class ViewCounterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.app = create_app('testing')
+        self.app.config['FLASKY_LOCAL_STORE'] = os.path.join(self.directory, 'local.sqlite')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        view_counter.store.init_app(self.app)
+        db.create_all()
+        u = User(email='123@abc.com', password='cat')
+        self.p1 = Post(body='one', author=u)
+        self.p2 = Post(body='two', author=u)
+        db.session.add_all([u, self.p1, self.p2])
+        db.session.commit()
+
+    def tearDown(self):
+        view_counter.flush(drain=False)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    def test_pending_counts(self):
+        view_counter.incr(self.p1.id)
+        view_counter.incr(self.p1.id)
+        self.assertEqual(self.p1.view_count(), 2)
+        self.assertEqual(self.p2.view_count(), 0)
+        self.assertEqual(self.p1.views, 0)
+
+    def test_flush_and_drain(self):
+        view_counter.incr(self.p1.id)
+        view_counter.incr(self.p1.id)
+        view_counter.incr(self.p2.id)
+        view_counter.flush(drain=False)
+        self.assertEqual(view_counter.pending, {})
+        self.assertEqual(view_counter.drain(force=True), 3)
+        db.session.expire_all()
+        self.assertEqual(self.p1.views, 2)
+        self.assertEqual(self.p2.views, 1)
+        # 距上次写入不到间隔时间时不写数据库
+        view_counter.incr(self.p1.id)
+        self.assertEqual(view_counter.flush(), 0)
+        self.assertEqual(view_counter.drain(force=True), 1)
+        db.session.expire_all()
+        self.assertEqual(self.p1.view_count(), 3)
+
+    # 没有请求时由定时线程合并
+    def test_timer_flush(self):
+        self.app.config['FLASKY_VIEW_FLUSH_INTERVAL'] = 0.1
+        view_counter.incr(self.p1.id)
+        deadline = time.time() + 5
+        while view_counter.pending and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(view_counter.pending, {})
+        self.assertEqual(view_counter.drain(force=True), 1)
+
+    def test_processes_share_local_store(self):
+        # 另一个工作进程: 使用同一个共享存储文件的独立计数器
+        other = ViewCounter(LocalStore())
+        other.store.init_app(self.app)
+        other.init_app(self.app)
+        view_counter.incr(self.p1.id)
+        other.incr(self.p1.id)
+        other.incr(self.p2.id)
+        view_counter.flush(drain=False)
+        other.flush(drain=False)
+        self.assertEqual(view_counter.drain(force=True), 3)
+        self.assertEqual(other.drain(force=True), 0)
+        db.session.expire_all()
+        self.assertEqual((self.p1.views, self.p2.views), (2, 1))
+
+    def test_views_in_json(self):
+        view_counter.incr(self.p1.id)
+        with self.app.test_request_context('/'):
+            self.assertEqual(self.p1.to_json(fields=['views']), {'views': 1})
@@ -0,0 +1,51 @@
+import gzip
+import json
+import unittest
+from datetime import datetime
+
+from app import create_app, db
+from app.exceptions import ValidationError
+from app.export import export_ndjson, parse_time
+from app.models import User, Post
+
+
+class ExportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_export_posts(self):
+        u = User(email='123@abc.com', password='cat')
+        db.session.add(u)
+        db.session.add(Post(body='old', author=u, timestamp=datetime(2018, 1, 1)))
+        db.session.add(Post(body='new', author=u, timestamp=datetime(2018, 3, 1)))
+        db.session.commit()
+        lines = b''.join(export_ndjson('posts')).decode('utf-8').splitlines()
+        self.assertEqual([json.loads(line)['body'] for line in lines], ['old', 'new'])
+        self.assertEqual(json.loads(lines[0])['timestamp'], '2018-01-01T00:00:00')
+        # 增量导出
+        data = b''.join(export_ndjson('posts', since=parse_time('2018-02-01')))
+        self.assertEqual([json.loads(line)['body'] for line in data.splitlines()], ['new'])
+        # gzip压缩后内容不变
+        data = gzip.decompress(b''.join(export_ndjson('posts', gzip=True)))
+        self.assertEqual(len(data.splitlines()), 2)
+
+    def test_export_users_without_password(self):
+        db.session.add(User(email='123@abc.com', password='cat'))
+        db.session.commit()
+        row = json.loads(b''.join(export_ndjson('users')).decode('utf-8'))
+        self.assertEqual(row['email'], '123@abc.com')
+        self.assertNotIn('password_hash', row)
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValidationError):
+            export_ndjson('roles')
+        with self.assertRaises(ValidationError):
+            parse_time('yesterday')
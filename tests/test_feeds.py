@@ -0,0 +1,87 @@
+import time
+import unittest
+from xml.etree import ElementTree
+from app import create_app, db, feed_cache
+from app.models import User, Role, Post
+
+ATOM = '{http://www.w3.org/2005/Atom}'
+
+
+class FeedsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.alice = User(email='a@abc.com', username='alice', password='cat')
+        self.bob = User(email='b@abc.com', username='bob', password='cat')
+        db.session.add_all([self.alice, self.bob,
+                            Post(body='hello *alice*', author=self.alice),
+                            Post(body='hello <bob>', author=self.bob)])
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_site_feed(self):
+        response = self.client.get('/feed')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/atom+xml')
+        feed = ElementTree.fromstring(response.data)
+        entries = feed.findall(ATOM + 'entry')
+        self.assertEqual(len(entries), 2)
+        self.assertTrue('<em>alice</em>' in ''.join(e.find(ATOM + 'content').text for e in entries))
+
+    def test_user_feed_rss(self):
+        response = self.client.get('/user/bob/feed?format=rss')
+        self.assertEqual(response.mimetype, 'application/rss+xml')
+        items = ElementTree.fromstring(response.data).findall('channel/item')
+        self.assertEqual([item.find('author').text for item in items], ['bob'])
+        self.assertEqual(self.client.get('/user/carol/feed').status_code, 404)
+        self.assertEqual(self.client.get('/feed?format=json').status_code, 404)
+
+    def test_conditional_get(self):
+        response = self.client.get('/user/alice/feed')
+        etag = response.headers['ETag']
+        last_modified = response.headers['Last-Modified']
+        response = self.client.get('/user/alice/feed', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        response = self.client.get('/user/alice/feed', headers={
+            'If-Modified-Since': last_modified})
+        self.assertEqual(response.status_code, 304)
+
+    # 修改较早的文章后 只带If-Modified-Since的请求也能得到新内容
+    def test_last_modified_after_edit(self):
+        old = self.alice.posts.first()
+        db.session.add(Post(body='newer', author=self.alice))
+        db.session.commit()
+        last_modified = self.client.get('/user/alice/feed').headers['Last-Modified']
+        # HTTP日期只精确到秒
+        time.sleep(1)
+        old.body = 'edited'
+        db.session.commit()
+        response = self.client.get('/user/alice/feed', headers={
+            'If-Modified-Since': last_modified})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b'edited' in response.data)
+
+    def test_invalidation(self):
+        etag = self.client.get('/user/alice/feed').headers['ETag']
+        bob_etag = self.client.get('/user/bob/feed').headers['ETag']
+        self.assertEqual(feed_cache.misses, 2)
+        self.client.get('/user/alice/feed')
+        self.assertEqual(feed_cache.hits, 1)
+        post = self.alice.posts.first()
+        post.body = 'edited'
+        db.session.commit()
+        response = self.client.get('/user/alice/feed', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b'edited' in response.data)
+        # 其它作者的订阅不受影响
+        response = self.client.get('/user/bob/feed', headers={'If-None-Match': bob_etag})
+        self.assertEqual(response.status_code, 304)
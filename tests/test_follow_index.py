@@ -0,0 +1,77 @@
+import unittest
+
+from app import create_app, db, follow_index
+from app.follow_index import FollowIndex
+from app.models import User, Follow
+
+
+class FollowIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['FLASKY_FOLLOW_INDEX'] = True
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    # 测试直接构建索引
+    def test_build(self):
+        index = FollowIndex()
+        index.build([(1, 2), (1, 3), (3, 1), (1, 2)])
+        self.assertTrue(index.is_following(1, 2))
+        self.assertTrue(index.is_following(3, 1))
+        self.assertFalse(index.is_following(2, 1))
+        self.assertEqual(index.followed_count(1), 2)
+        self.assertEqual(index.follower_count(1), 1)
+        index.add(2, 1)
+        index.remove(1, 3)
+        self.assertTrue(index.is_following(2, 1))
+        self.assertFalse(index.is_following(1, 3))
+        self.assertEqual(list(index.follower_ids(1)), [2, 3])
+
+    # 测试关注/取关时索引增量更新
+    def test_follow_updates_index(self):
+        u1 = User(email='123@abc.com', password='cat')
+        u2 = User(email='234@abc.com', password='dog')
+        db.session.add_all([u1, u2])
+        db.session.commit()
+        self.assertFalse(u1.is_following(u2))
+        self.assertTrue(follow_index.loaded)
+        u1.follow(u2)
+        self.assertTrue(u1.is_following(u2))
+        self.assertTrue(u2.is_followed_by(u1))
+        db.session.commit()
+        self.assertEqual(u2.follower_count(), 1)
+        self.assertEqual(u1.followed_count(), 1)
+        following, followed_by = u2.follow_states([u1])
+        self.assertEqual(followed_by, {u1.id})
+        u1.unfollow(u2)
+        db.session.commit()
+        self.assertFalse(u1.is_following(u2))
+        self.assertEqual(u2.follower_count(), 0)
+        # 删除用户时级联删除的关注关系也要从索引中移除
+        u2.follow(u1)
+        db.session.commit()
+        db.session.delete(u2)
+        db.session.commit()
+        self.assertEqual(u1.follower_count(), 0)
+        self.assertEqual(Follow.query.count(), 0)
+
+    # 回滚的关注关系不进入索引
+    def test_rollback_leaves_index_unchanged(self):
+        u1 = User(email='123@abc.com', password='cat')
+        u2 = User(email='234@abc.com', password='dog')
+        db.session.add_all([u1, u2])
+        db.session.commit()
+        follow_index.load()
+        u1.follow(u2)
+        db.session.flush()
+        self.assertTrue(u1.is_following(u2))
+        db.session.rollback()
+        self.assertFalse(u1.is_following(u2))
+        self.assertEqual(u1.follow_states([u2]), (set(), set()))
+        self.assertEqual(Follow.query.count(), 0)
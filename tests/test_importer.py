@@ -0,0 +1,74 @@
+import json
+import unittest
+
+from app import create_app, db
+from app.importer import import_ndjson, summarize
+from app.models import User, Post, Comment
+
+
+class ImporterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.user = User(email='123@abc.com', password='cat')
+        db.session.add(self.user)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_import_posts(self):
+        lines = [json.dumps({'body': '*post %d*' % i}) for i in range(5)]
+        lines.insert(2, '{"body": ""}')
+        lines.insert(3, 'not json')
+        lines.append(json.dumps({'body': 'dated', 'timestamp': '2018-03-01T12:00:00'}))
+        results = import_ndjson('posts', lines, author_id=self.user.id, batch_size=3)
+        self.assertEqual(summarize(results), {'imported': 6, 'failed': 2})
+        self.assertEqual([r['status'] for r in results][2:4], ['error', 'error'])
+        self.assertEqual(results[2]['message'], 'post does not have a body')
+        post = Post.query.filter_by(body='*post 0*').first()
+        self.assertEqual(post.body_html, '<p><em>post 0</em></p>')
+        self.assertEqual(post.author, self.user)
+        self.assertEqual(Post.query.filter_by(body='dated').first().timestamp.year, 2018)
+
+    def test_import_with_process_pool(self):
+        lines = [json.dumps({'body': '**%d**' % i}) for i in range(50)]
+        results = import_ndjson('posts', lines, author_id=self.user.id, workers=2)
+        self.assertEqual(summarize(results)['imported'], 50)
+        self.assertEqual(Post.query.filter_by(body='**7**').first().body_html,
+                         '<p><strong>7</strong></p>')
+
+    def test_import_comments(self):
+        post = Post(body='post', author=self.user)
+        db.session.add(post)
+        db.session.commit()
+        lines = [json.dumps({'body': 'hi', 'post_id': post.id}),
+                 json.dumps({'body': 'lost', 'post_id': post.id + 100}),
+                 json.dumps({'body': 'no post'})]
+        results = import_ndjson('comments', lines, author_id=self.user.id)
+        self.assertEqual([r['status'] for r in results], ['ok', 'error', 'error'])
+        self.assertEqual(results[1]['message'], 'post not found')
+        self.assertEqual(post.comments.count(), 1)
+        self.assertEqual(Comment.query.first().body_html, 'hi')
+
+    # 类型不对的字段按校验失败处理 不抛出其它异常
+    def test_invalid_field_types(self):
+        lines = [json.dumps({'body': 'a', 'author_id': self.user.id, 'timestamp': 20180301}),
+                 json.dumps({'body': 'b', 'author_id': str(self.user.id)}),
+                 json.dumps({'body': 'c', 'author_id': [self.user.id]}),
+                 json.dumps({'body': 123, 'author_id': self.user.id}),
+                 json.dumps({'body': 'd', 'author_id': self.user.id})]
+        results = import_ndjson('posts', lines)
+        self.assertEqual([r['status'] for r in results], ['error'] * 4 + ['ok'])
+        self.assertEqual(results[0]['message'], 'invalid timestamp: 20180301')
+        self.assertEqual(results[1]['message'], 'invalid author_id')
+        self.assertEqual(results[3]['message'], 'post body must be a string')
+        # True不是文章id 1
+        self.assertIsNotNone(Post.query.get(1))
+        results = import_ndjson('comments', [json.dumps({'body': 'hi', 'post_id': True})],
+                                author_id=self.user.id)
+        self.assertEqual(results[0]['message'], 'comment does not have a post_id')
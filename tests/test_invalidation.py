@@ -0,0 +1,108 @@
+import json
+import time
+import unittest
+from app import create_app, db, invalidation, profile_cache, feed_cache, follow_index
+from app.feeds import feed_key
+from app.models import User, Post, Follow
+
+
+class InvalidationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.alice = User(email='a@abc.com', username='alice', password='cat')
+        self.bob = User(email='b@abc.com', username='bob', password='cat')
+        db.session.add_all([self.alice, self.bob])
+        db.session.commit()
+        # 第一次读取只记下当前位置
+        invalidation.poll()
+
+    def tearDown(self):
+        invalidation.store.connect().execute('DELETE FROM invalidations')
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def rows(self):
+        return invalidation.store.connect().execute(
+            'SELECT cache, key FROM invalidations WHERE id > ? ORDER BY id',
+            (invalidation.last_id,)).fetchall()
+
+    # 模拟其它进程写入的失效记录
+    def send_from_other_process(self, name, key):
+        invalidation.store.connect().execute(
+            'INSERT INTO invalidations (cache, key, pid, created_at) VALUES (?, ?, 0, ?)',
+            (name, json.dumps(key), time.time()))
+
+    def test_published_after_commit(self):
+        db.session.add(Post(body='hello', author=self.alice))
+        db.session.flush()
+        # 提交之前不通知
+        self.assertEqual(self.rows(), [])
+        db.session.commit()
+        rows = self.rows()
+        self.assertIn(('profile', str(self.alice.id)), rows)
+        self.assertIn(('feed', json.dumps(feed_key('atom', self.alice.id))), rows)
+        # 回滚时丢弃
+        invalidation.poll()
+        db.session.add(Post(body='discarded', author=self.bob))
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(self.rows(), [])
+
+    def test_poll_evicts_keys_from_other_processes(self):
+        profile_cache.set(self.alice.id, {'post_count': 0})
+        profile_cache.set(self.bob.id, {'post_count': 0})
+        feed_cache.set(feed_key('atom', self.alice.id), {})
+        self.send_from_other_process('profile', self.alice.id)
+        self.send_from_other_process('feed', feed_key('atom', self.alice.id))
+        self.assertEqual(invalidation.poll(), 2)
+        self.assertIsNone(profile_cache.get(self.alice.id))
+        self.assertIsNone(feed_cache.get(feed_key('atom', self.alice.id)))
+        self.assertIsNotNone(profile_cache.get(self.bob.id))
+        # 本进程写入的记录不再重复失效
+        db.session.add(Post(body='hello', author=self.bob))
+        db.session.commit()
+        profile_cache.set(self.bob.id, {'post_count': 1})
+        self.assertTrue(invalidation.poll() > 0)
+        self.assertIsNotNone(profile_cache.get(self.bob.id))
+
+    def test_follow_index_refresh(self):
+        self.app.config['FLASKY_FOLLOW_INDEX'] = True
+        follow_index.load()
+        self.assertFalse(follow_index.is_following(self.alice.id, self.bob.id))
+        # 其它进程直接写入数据库 本进程的索引没有变化
+        db.session.execute(Follow.__table__.insert(),
+                           {'follower_id': self.alice.id, 'followed_id': self.bob.id})
+        db.session.commit()
+        self.assertFalse(follow_index.is_following(self.alice.id, self.bob.id))
+        self.send_from_other_process('follow', [self.alice.id, self.bob.id])
+        invalidation.poll()
+        self.assertTrue(follow_index.is_following(self.alice.id, self.bob.id))
+
+    # 回滚时不通知其它进程 本进程的关注索引按数据库重新读取
+    def test_rollback_refreshes_follow_index(self):
+        self.app.config['FLASKY_FOLLOW_INDEX'] = True
+        follow_index.load()
+        db.session.add(Follow(follower=self.alice, followed=self.bob))
+        db.session.flush()
+        # 模拟按未提交的数据修改了索引
+        follow_index.add(self.alice.id, self.bob.id)
+        db.session.rollback()
+        self.assertEqual(self.rows(), [])
+        self.assertFalse(follow_index.is_following(self.alice.id, self.bob.id))
+
+    def test_clear_after_long_pause(self):
+        profile_cache.set(self.alice.id, {'post_count': 0})
+        invalidation.last_poll = time.time() - self.app.config['FLASKY_INVALIDATION_RETENTION'] - 1
+        invalidation.poll()
+        self.assertIsNone(profile_cache.get(self.alice.id))
+
+    def test_poll_before_request(self):
+        self.app.config['FLASKY_INVALIDATION_POLL_INTERVAL'] = 0
+        profile_cache.set(self.alice.id, {'post_count': 0})
+        self.send_from_other_process('profile', self.alice.id)
+        self.app.test_client().get('/auth/login')
+        self.assertIsNone(profile_cache.get(self.alice.id))
@@ -0,0 +1,137 @@
+import unittest
+from app import create_app, db, jobs, mail
+from app.email import send_email
+from app.models import User, Post
+
+calls = []
+
+
+@jobs.task(priority=0)
+def record(value):
+    calls.append(value)
+
+
+@jobs.task(priority=5)
+def urgent(value):
+    calls.append(value)
+
+
+@jobs.task(queue='other')
+def other(value):
+    calls.append(value)
+
+
+@jobs.task(max_attempts=2)
+def broken():
+    raise RuntimeError('broken')
+
+
+class JobQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        del calls[:]
+
+    def tearDown(self):
+        jobs.store.connect().execute('DELETE FROM jobs')
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def execute(self, sql, *params):
+        return jobs.store.connect().execute(sql, params).fetchall()
+
+    def test_run_in_priority_order(self):
+        record.delay(1)
+        record.delay(2)
+        urgent.delay(3)
+        self.assertEqual(jobs.work(max_jobs=10), 3)
+        self.assertEqual(calls, [3, 1, 2])
+        # 执行成功的任务从表中删除
+        self.assertEqual(jobs.stats(), [])
+        self.assertFalse(jobs.run_one())
+
+    def test_retry_and_fail(self):
+        id = broken.delay()
+        self.assertTrue(jobs.run_one())
+        status, attempts, error = self.execute(
+            'SELECT status, attempts, error FROM jobs WHERE id = ?', id)[0]
+        self.assertEqual((status, attempts), ('queued', 1))
+        self.assertIn('RuntimeError', error)
+        # 重试之前要等待一段时间
+        self.assertFalse(jobs.run_one())
+        self.execute('UPDATE jobs SET run_at = 0')
+        self.assertTrue(jobs.run_one())
+        self.assertEqual(self.execute('SELECT status, attempts FROM jobs')[0], ('failed', 2))
+        self.assertFalse(jobs.run_one())
+
+    def test_visibility_timeout(self):
+        id = record.delay(1)
+        job = jobs.claim()
+        self.assertEqual(job['id'], id)
+        self.assertIsNone(jobs.claim())
+        # 领取任务的进程没有在超时时间内完成 和失败一样延迟后重试
+        self.execute('UPDATE jobs SET locked_until = 0')
+        self.assertIsNone(jobs.claim())
+        status, error = self.execute('SELECT status, error FROM jobs WHERE id = ?', id)[0]
+        self.assertEqual(status, 'queued')
+        self.assertIn('visibility timeout', error)
+        self.execute('UPDATE jobs SET run_at = 0')
+        job = jobs.claim()
+        self.assertEqual((job['id'], job['attempts']), (id, 2))
+        self.execute('UPDATE jobs SET locked_until = 0')
+        self.assertIsNone(jobs.claim())
+        self.execute('UPDATE jobs SET run_at = 0')
+        self.assertEqual(jobs.claim()['attempts'], 3)
+        # 次数用完后标记为failed 不再执行
+        self.execute('UPDATE jobs SET locked_until = 0')
+        self.assertIsNone(jobs.claim())
+        self.assertEqual(self.execute('SELECT status, attempts FROM jobs')[0], ('failed', 3))
+
+    def test_queue_concurrency_limit(self):
+        self.app.config['FLASKY_JOB_QUEUES'] = {'default': 1}
+        record.delay(1)
+        record.delay(2)
+        other.delay(3)
+        self.assertEqual(jobs.claim()['args'], [1])
+        # default队列已经有一个任务在执行 只能领取其它队列的任务
+        self.assertEqual(jobs.claim()['task'], other.name)
+        self.assertIsNone(jobs.claim())
+        self.assertIsNone(jobs.claim(queues=['default']))
+
+    def test_deferred_render(self):
+        self.app.config['FLASKY_USE_JOBS'] = True
+        u = User(email='john@example.com', password='cat')
+        p = Post(body='*hello*', author=u)
+        db.session.add_all([u, p])
+        db.session.commit()
+        self.assertIsNone(p.body_html)
+        id = p.id
+        client = self.app.test_client()
+        self.assertNotIn(b'<em>', client.get('/feed').data)
+        # 任务执行完后会清理数据库会话
+        self.assertTrue(jobs.run_one())
+        self.assertEqual(Post.query.get(id).body_html, '<p><em>hello</em></p>')
+        # 缓存的订阅随之失效
+        self.assertIn(b'&lt;em&gt;', client.get('/feed').data)
+        # 回滚时不入队
+        p = Post.query.get(id)
+        p.body = 'changed'
+        db.session.flush()
+        db.session.rollback()
+        self.assertFalse(jobs.run_one())
+
+    def test_send_email(self):
+        self.app.config['FLASKY_USE_JOBS'] = True
+        u = User(email='john@example.com', password='cat')
+        db.session.add(u)
+        db.session.commit()
+        with self.app.test_request_context():
+            send_email(u.email, 'Confirm', 'auth/email/confirm', user=u, token='abc')
+        with mail.record_messages() as outbox:
+            self.assertTrue(jobs.run_one())
+        self.assertEqual(len(outbox), 1)
+        self.assertEqual(outbox[0].recipients, ['john@example.com'])
+        self.assertIn('Confirm', outbox[0].subject)
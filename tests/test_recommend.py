@@ -0,0 +1,58 @@
+import unittest
+
+from app import create_app, db
+from app.models import User, Suggestion
+from app.recommend import compute_suggestions
+
+
+class RecommendTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_friends_of_friends(self):
+        users = [User(email='%d@abc.com' % i, username='user%d' % i, password='cat')
+                 for i in range(5)]
+        db.session.add_all(users)
+        db.session.commit()
+        u0, u1, u2, u3, u4 = users
+        # u0 -> u1 -> u2, u0 -> u3 -> u2, u3 -> u4
+        u0.follow(u1)
+        u0.follow(u3)
+        u1.follow(u2)
+        u3.follow(u2)
+        u3.follow(u4)
+        u0.follow(u0)
+        db.session.commit()
+        compute_suggestions(top_n=5, cofollow_weight=0)
+        suggested = u0.suggested_users()
+        # u2通过两条路径可达 排在u4前面 已关注的用户和自己不会出现
+        self.assertEqual(suggested, [u2, u4])
+        self.assertEqual(u4.suggested_users(), [])
+        # 重新计算会整体替换旧的结果
+        u0.follow(u2)
+        db.session.commit()
+        compute_suggestions(top_n=5, cofollow_weight=0)
+        self.assertEqual(u0.suggested_users(), [u4])
+        self.assertEqual(Suggestion.query.filter_by(user_id=u0.id).count(), 1)
+
+    def test_cofollow(self):
+        users = [User(email='%d@abc.com' % i, username='user%d' % i, password='cat')
+                 for i in range(4)]
+        db.session.add_all(users)
+        db.session.commit()
+        u0, u1, u2, u3 = users
+        # u0和u1都关注了u2 u1还关注了u3 所以给u0推荐u3
+        u0.follow(u2)
+        u1.follow(u2)
+        u1.follow(u3)
+        db.session.commit()
+        compute_suggestions(top_n=5, cofollow_weight=0.5)
+        self.assertEqual(u0.suggested_users(), [u3])
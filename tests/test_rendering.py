@@ -0,0 +1,110 @@
+import random
+import unittest
+from app import create_app, db, render_cache, feed_cache
+from app.feeds import feed_key
+from app.models import User, Post, Comment, POST_ALLOWED_TAGS, COMMENT_ALLOWED_TAGS
+from app.rendering import content_key, render_many, rerender_all, render_markdown, \
+        render_blocks, split_blocks
+
+# 对照测试的语料: 各种顶层块 随机拼接成文档
+FRAGMENTS = [
+    'para one *em* **strong**', 'line a\nline b  \nline c', '# Header', 'Setext\n======',
+    'Sub\n---', '- a\n- b', '* x\n\n    continued', '1. one\n2. two', '1. one\n\n1. two',
+    '+ p\n    + nested\n    + n2', '- a\n    - b\n        - c', '- a\n\n  para in item',
+    '  - two space list', '> quote\n> more', '> q\n\n> q2', '> - list in quote', '>> nested',
+    '   > indented quote', '    code\n    code2', '    c1\n\n\n    c2', '\tcode tab',
+    '        deep code', '---', '* * *', '___', '===', 'http://example.com and www.foo.com',
+    'a `code` b', 'escape \\* not list', 'under_score_word', 'text\n    not code (lazy)',
+    'para\n1. not list', '## h2 ##', '2018\\. year', '[link](http://x.com "t")',
+    '![img](http://x.com/a.png)', 'a&b &amp; &copy;', '*start', 'end*', '[a][ref]',
+    '[ref]: http://r.com', '<b>open', 'x<y', '>', '-', '1.', '#', 'mixed\ttab', 'trailing   ',
+]
+SEPARATORS = ['\n\n', '\n\n\n', '\n \n', '\n\t\n', '\r\n\r\n', '\n']
+
+
+def corpus(count, seed=0):
+    rnd = random.Random(seed)
+    for i in range(count):
+        doc = rnd.choice(FRAGMENTS)
+        for j in range(rnd.randint(0, 6)):
+            doc += rnd.choice(SEPARATORS) + rnd.choice(FRAGMENTS)
+        yield '  \n' + doc if rnd.random() < 0.05 else doc
+
+
+class RenderCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_identical_bodies_render_once(self):
+        u = User(email='john@example.com', password='cat')
+        p1 = Post(body='*spam*', author=u)
+        p2 = Post(body='*spam*', author=u)
+        self.assertEqual(p1.body_html, p2.body_html)
+        stats = render_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+        # 允许的标签不同 缓存键也不同
+        c = Comment(body='*spam*')
+        self.assertEqual(render_cache.stats()['misses'], 2)
+        self.assertNotEqual(content_key('*spam*', POST_ALLOWED_TAGS),
+                            content_key('*spam*', COMMENT_ALLOWED_TAGS))
+        self.assertEqual(c.body_html, render_markdown('*spam*', COMMENT_ALLOWED_TAGS))
+
+    def test_render_many(self):
+        rendered = []
+
+        def counting_map(func, values):
+            rendered.extend(values)
+            return map(func, values)
+
+        render_many(['a'], POST_ALLOWED_TAGS)
+        results = render_many(['a', 'b', 'b', 'c', 'a'], POST_ALLOWED_TAGS, map=counting_map)
+        # 缓存中已有的和重复的正文不再渲染
+        self.assertEqual(rendered, ['b', 'c'])
+        self.assertEqual(results, ['<p>%s</p>' % v for v in 'abbca'])
+
+    def test_rerender_all(self):
+        u = User(email='john@example.com', password='cat')
+        posts = [Post(body='**%d**' % i, author=u) for i in range(5)]
+        db.session.add_all([u] + posts)
+        db.session.commit()
+        db.session.execute(Post.__table__.update().where(Post.id <= 3).values(body_html='old'))
+        db.session.commit()
+        feed_cache.set(feed_key('atom', u.id), {})
+        self.assertEqual(rerender_all(Post, POST_ALLOWED_TAGS, batch_size=2), 3)
+        # 批量更新后订阅失效
+        self.assertIsNone(feed_cache.get(feed_key('atom', u.id)))
+        db.session.expire_all()
+        self.assertEqual([p.body_html for p in Post.query.order_by(Post.id)],
+                         ['<p><strong>%d</strong></p>' % i for i in range(5)])
+        self.assertEqual(rerender_all(Post, POST_ALLOWED_TAGS), 0)
+
+    def test_blocks_match_full_render(self):
+        for doc in corpus(500):
+            for tags in (POST_ALLOWED_TAGS, COMMENT_ALLOWED_TAGS):
+                self.assertEqual(render_blocks(doc, tags), render_markdown(doc, tags), repr(doc))
+
+    def test_split_blocks(self):
+        self.assertEqual(split_blocks('a\n\n# b\n\n- c\n\n- d\n\n    e\n\nf'),
+                         ['a', '# b', '- c\n\n- d\n\n    e', 'f'])
+        # 链接定义和HTML标签可能影响其它块 不分块
+        self.assertIsNone(split_blocks('[a][r]\n\n[r]: http://example.com'))
+        self.assertIsNone(split_blocks('<b>a\n\nb</b>'))
+
+    def test_edit_renders_changed_block_only(self):
+        paragraphs = ['paragraph %d *em*' % i for i in range(10)]
+        u = User(email='john@example.com', password='cat')
+        p = Post(body='\n\n'.join(paragraphs), author=u)
+        misses = render_cache.stats()['misses']
+        paragraphs[5] = 'changed **paragraph**'
+        p.body = '\n\n'.join(paragraphs)
+        # 整篇正文和修改的一段未命中 其余各段命中
+        self.assertEqual(render_cache.stats()['misses'] - misses, 2)
+        self.assertEqual(p.body_html, render_markdown(p.body, POST_ALLOWED_TAGS))
@@ -0,0 +1,93 @@
+import gc
+import os
+import shutil
+import signal
+import sqlite3
+import tempfile
+import time
+import unittest
+import urllib.request
+from app import create_app, db
+from app.models import User, Post
+from app.server import bind, preload, serve
+from config import config
+
+
+class ServerTestCase(unittest.TestCase):
+    def test_preload(self):
+        app = preload('testing')
+        # 模板已经编译并保存在jinja环境的缓存中
+        self.assertIn('auth/login.html', [key[1] for key in app.jinja_env.cache.keys()])
+        self.assertIn('auth', app.blueprints)
+        if hasattr(gc, 'unfreeze'):
+            gc.unfreeze()
+
+    def test_serve_reload_and_stop(self):
+        sock = bind('127.0.0.1', 0)
+        url = 'http://127.0.0.1:%d/auth/login' % sock.getsockname()[1]
+        pid = os.fork()
+        if pid == 0:
+            try:
+                serve('testing', workers=2, access_log=False, sock=sock)
+            finally:
+                os._exit(0)
+        sock.close()
+        try:
+            self.assertEqual(self.get(url), 200)
+            # 平滑重启期间监听端口不关闭
+            os.kill(pid, signal.SIGHUP)
+            for _ in range(10):
+                self.assertEqual(self.get(url), 200)
+                time.sleep(0.1)
+        finally:
+            os.kill(pid, signal.SIGTERM)
+            self.assertEqual(os.waitpid(pid, 0), (pid, 0))
+
+    # 停止时工作进程把缓冲的浏览计数合并到本机共享存储
+    def test_stop_flushes_view_counts(self):
+        directory = tempfile.mkdtemp()
+        store = os.path.join(directory, 'local.sqlite')
+        app = create_app('testing')
+        with app.app_context():
+            db.create_all()
+            u = User(email='john@example.com', username='john', password='cat')
+            p = Post(body='hello', author=u)
+            db.session.add_all([u, p])
+            db.session.commit()
+            post_id = p.id
+            db.session.remove()
+        sock = bind('127.0.0.1', 0)
+        url = 'http://127.0.0.1:%d/post/%d' % (sock.getsockname()[1], post_id)
+        pid = os.fork()
+        if pid == 0:
+            try:
+                config['testing'].FLASKY_LOCAL_STORE = store
+                serve('testing', workers=1, access_log=False, sock=sock)
+            finally:
+                os._exit(0)
+        sock.close()
+        try:
+            self.assertEqual(self.get(url), 200)
+            self.assertEqual(self.get(url), 200)
+        finally:
+            os.kill(pid, signal.SIGTERM)
+            self.assertEqual(os.waitpid(pid, 0), (pid, 0))
+        try:
+            conn = sqlite3.connect(store)
+            self.assertEqual(conn.execute('SELECT count FROM view_counts WHERE post_id = ?',
+                                          (post_id,)).fetchall(), [(2,)])
+            conn.close()
+        finally:
+            shutil.rmtree(directory)
+            with app.app_context():
+                db.drop_all()
+
+    def get(self, url, timeout=30):
+        deadline = time.time() + timeout
+        while True:
+            try:
+                return urllib.request.urlopen(url).status
+            except OSError:
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.1)
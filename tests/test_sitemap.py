@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+import unittest
+from xml.etree import ElementTree
+from app import create_app, db
+from app.models import User, Post
+from app.sitemap import generate_sitemap
+
+NS = '{http://www.sitemaps.org/schemas/sitemap/0.9}'
+
+
+class SitemapTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.app = create_app('testing')
+        self.app.config['FLASKY_SITEMAP_DIR'] = self.directory
+        self.app.config['FLASKY_SITEMAP_CHUNK_SIZE'] = 2
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.user = User(email='a@abc.com', username='alice', password='cat')
+        db.session.add(self.user)
+        self.add_posts(5)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    def add_posts(self, count):
+        db.session.add_all([Post(body='post', author=self.user) for _ in range(count)])
+        db.session.commit()
+
+    def generate(self, full=False):
+        with self.app.test_request_context(base_url='http://example.com'):
+            return generate_sitemap(full=full)
+
+    def urls(self, filename):
+        tree = ElementTree.parse(os.path.join(self.directory, filename))
+        return [loc.text for loc in tree.iter(NS + 'loc')]
+
+    def test_chunks(self):
+        self.assertEqual(self.generate(), 4)
+        self.assertEqual(self.urls('sitemap.xml'), [
+            'http://example.com/sitemap-posts-%d.xml' % i for i in (1, 2, 3)] +
+            ['http://example.com/sitemap-users-1.xml'])
+        posts = sum([self.urls('sitemap-posts-%d.xml' % i) for i in (1, 2, 3)], [])
+        self.assertEqual(posts, ['http://example.com/post/%d' % i for i in range(1, 6)])
+        self.assertEqual(self.urls('sitemap-users-1.xml'), ['http://example.com/user/alice'])
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'sitemap-posts-1.xml.gz')))
+
+    def test_incremental(self):
+        self.generate()
+        full_chunk = os.path.join(self.directory, 'sitemap-posts-1.xml')
+        os.utime(full_chunk, (0, 0))
+        self.add_posts(2)
+        # 重写未满的第3块 新增第4块 用户的分块未满也重写
+        self.assertEqual(self.generate(), 3)
+        self.assertEqual(os.path.getmtime(full_chunk), 0)
+        self.assertEqual(self.urls('sitemap-posts-4.xml'), ['http://example.com/post/7'])
+
+    def test_full_after_delete(self):
+        self.generate()
+        for post in Post.query.filter(Post.id > 2):
+            db.session.delete(post)
+        db.session.commit()
+        self.assertEqual(self.generate(full=True), 2)
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'sitemap-posts-2.xml')))
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'sitemap-posts-2.xml.gz')))
+
+    def test_serve(self):
+        client = self.app.test_client()
+        self.assertEqual(client.get('/sitemap.xml').status_code, 404)
+        self.generate()
+        response = client.get('/sitemap.xml')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b'sitemap-posts-1.xml' in response.data)
+        response = client.get('/sitemap-posts-1.xml', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(client.get('/sitemap-posts-9.xml').status_code, 404)
@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from app import create_app, db, view_counter, assets
+from app.models import User, Role, Post, Comment
+from app.snapshot import snapshot, affected_urls, load_state
+
+
+class SnapshotTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.old = datetime.utcnow() - timedelta(days=1)
+        self.alice = User(email='a@abc.com', username='alice', password='cat', member_since=self.old)
+        self.bob = User(email='b@abc.com', username='bob', password='cat', member_since=self.old)
+        self.post = Post(body='hello', author=self.alice, timestamp=self.old)
+        db.session.add_all([self.alice, self.bob, self.post])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    def test_affected_urls(self):
+        self.assertEqual(affected_urls(), set(['/', '/post/1', '/user/alice', '/user/bob']))
+        since = datetime.utcnow() - timedelta(hours=1)
+        self.assertEqual(affected_urls(since), set(['/']))
+        post = Post(body='new', author=self.bob)
+        db.session.add(post)
+        db.session.add(Comment(body='nice', post=self.post, author=self.bob))
+        db.session.commit()
+        self.assertEqual(affected_urls(since), set(
+            ['/', '/post/1', '/post/%d' % post.id, '/user/alice', '/user/bob']))
+        # 新注册还没有发表文章的用户
+        db.session.add(User(email='c@abc.com', username='carol', password='cat'))
+        db.session.commit()
+        self.assertIn('/user/carol', affected_urls(since))
+
+    def test_snapshot(self):
+        rendered, failed = snapshot(self.directory, 'testing', workers=1)
+        self.assertEqual((rendered, failed), (4, []))
+        with open(os.path.join(self.directory, 'post', '1', 'index.html'), 'rb') as f:
+            self.assertTrue(b'hello' in f.read())
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'user', 'bob', 'index.html')))
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'static', 'style.css')))
+        # 带指纹的样式表引用的背景图片
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'assets', 'blogbg.jpg')))
+        with open(os.path.join(self.directory, 'assets', assets.manifest['style.css']), 'rb') as f:
+            self.assertTrue(assets.manifest['blogbg.jpg'].encode() in f.read())
+        self.assertTrue(load_state(self.directory)['last_snapshot'])
+        # 渲染快照不算浏览
+        self.assertEqual(view_counter.pending, {})
+
+        # 没有新文章和评论时只重新渲染首页
+        rendered, failed = snapshot(self.directory, 'testing', workers=1)
+        self.assertEqual(rendered, 1)
@@ -0,0 +1,45 @@
+import os
+import shutil
+import tempfile
+import unittest
+from app import create_app
+from app.templating import compile_templates, init_bytecode_cache
+
+
+class TemplatingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.app = self.create_app()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    def create_app(self):
+        app = create_app('testing')
+        app.config['FLASKY_TEMPLATE_CACHE_DIR'] = self.directory
+        init_bytecode_cache(app)
+        return app
+
+    def test_compile_templates(self):
+        compiled, failed = compile_templates()
+        self.assertEqual(failed, [])
+        self.assertTrue(compiled > 0)
+        files = os.listdir(self.directory)
+        self.assertEqual(len(files), compiled)
+        self.assertFalse([name for name in files if name.endswith('.tmp')])
+
+    def test_load_from_cache(self):
+        compile_templates()
+        # 新的程序实例直接从缓存加载 不再调用编译器
+        app = self.create_app()
+        with app.app_context():
+            compile = app.jinja_env.compile
+            app.jinja_env.compile = lambda *args, **kwargs: self.fail('template compiled')
+            try:
+                template = app.jinja_env.get_template('404.html')
+            finally:
+                app.jinja_env.compile = compile
+            self.assertTrue(template is not None)
@@ -0,0 +1,95 @@
+import json
+import math
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from base64 import b64encode
+from app import create_app, db, trending
+from app.local_store import LocalStore
+from app.models import User, Role, Post, Comment
+from app.trending import TrendingTracker, log_add
+
+
+class TrendingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.app = create_app('testing')
+        self.app.config['FLASKY_LOCAL_STORE'] = os.path.join(self.directory, 'local.sqlite')
+        self.app.config['FLASKY_TRENDING_SIZE'] = 3
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        trending.store.init_app(self.app)
+        db.create_all()
+        Role.insert_roles()
+        self.user = User(email='123@abc.com', password='cat', confirmed=True)
+        self.posts = [Post(body='post %d' % i, author=self.user) for i in range(5)]
+        db.session.add(self.user)
+        db.session.add_all(self.posts)
+        db.session.commit()
+
+    def tearDown(self):
+        trending.persist(reload=False)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    def test_log_add(self):
+        self.assertAlmostEqual(log_add(3, 3), 4)
+        self.assertAlmostEqual(log_add(None, 2), 2)
+        # 数值很大时也不会溢出
+        self.assertAlmostEqual(log_add(5000, 4000), 5000)
+
+    def test_decay(self):
+        half_life = self.app.config['FLASKY_TRENDING_HALF_LIFE']
+        now = time.time()
+        p0, p1 = self.posts[0].id, self.posts[1].id
+        # 两个半衰期之前的5次浏览 少于现在的2次浏览
+        for _ in range(5):
+            trending.record(p0, 'view', now - 2 * half_life)
+        trending.record(p1, 'view', now)
+        trending.record(p1, 'view', now)
+        self.assertEqual(trending.top(), [p1, p0])
+
+    def test_comments_and_bounded_size(self):
+        for i, post in enumerate(self.posts):
+            for _ in range(i):
+                db.session.add(Comment(body='c', post=post, author=self.user))
+        db.session.commit()
+        ids = [post.id for post in self.posts]
+        self.assertEqual(trending.top(), [ids[4], ids[3], ids[2]])
+        self.assertEqual([post.id for post in trending.top_posts(2)], [ids[4], ids[3]])
+        # 回滚的评论不增加热度
+        db.session.add_all([Comment(body='c', post=self.posts[0], author=self.user)
+                            for _ in range(5)])
+        db.session.flush()
+        db.session.rollback()
+        self.assertNotIn(ids[0], trending.pending)
+
+    def test_processes_share_ranking(self):
+        other = TrendingTracker(LocalStore())
+        other.store.init_app(self.app)
+        other.init_app(self.app)
+        p0, p1 = self.posts[0].id, self.posts[1].id
+        trending.record(p0, 'comment')
+        other.record(p1, 'view')
+        other.record(p0, 'view')
+        other.persist()
+        trending.persist()
+        self.assertEqual(trending.top(), [p0, p1])
+        # 评论权重5加浏览权重1 是另一篇的6倍
+        self.assertAlmostEqual(trending.scores[p0] - trending.scores[p1], math.log2(6), places=3)
+
+    def test_api(self):
+        p = self.posts[2]
+        trending.record(p.id, 'comment')
+        client = self.app.test_client()
+        headers = {'Authorization': 'Basic ' + b64encode(b'123@abc.com:cat').decode('utf-8'),
+                   'Accept': 'application/json'}
+        response = client.get('/api/v1.0/posts/trending', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        json_posts = json.loads(response.get_data(as_text=True))['posts']
+        self.assertEqual(len(json_posts), 1)
+        self.assertTrue(json_posts[0]['url'].endswith('/posts/%d' % p.id))
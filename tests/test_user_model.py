@@ -2,8 +2,8 @@ import unittest
 import time
 from datetime import datetime
 
-from app.models import User, AnonymousUser, Role, Permission, Follow
-from app import create_app, db
+from app.models import User, AnonymousUser, Role, Permission, Follow, Post, Comment
+from app import create_app, db, profile_cache
 
 
 class UserModelTestCase(unittest.TestCase):
@@ -208,12 +208,64 @@ class UserModelTestCase(unittest.TestCase):
         db.session.commit()
         self.assertTrue(Follow.query.count() == 0)
 
+    # 测试批量查询关注状态
+    def test_follow_states(self):
+        u1 = User(email='123@abc.com', password='cat')
+        u2 = User(email='234@abc.com', password='dog')
+        u3 = User(email='345@abc.com', password='horse')
+        db.session.add_all([u1, u2, u3])
+        db.session.commit()
+        u1.follow(u2)
+        u3.follow(u1)
+        db.session.commit()
+        following, followed_by = u1.follow_states([u2, u3])
+        self.assertEqual(following, {u2.id})
+        self.assertEqual(followed_by, {u3.id})
+        following, followed_by = u1.follow_states([])
+        self.assertEqual((following, followed_by), (set(), set()))
+        following, followed_by = AnonymousUser().follow_states([u1, u2])
+        self.assertEqual((following, followed_by), (set(), set()))
+
+    def test_profile_stats(self):
+        u1 = User(email='123@abc.com', password='cat')
+        u2 = User(email='234@abc.com', password='dog')
+        db.session.add_all([u1, u2])
+        db.session.commit()
+        u1.follow(u2)
+        db.session.add(Post(body='post', author=u1))
+        db.session.commit()
+        self.assertEqual(u1.profile_stats(), {'post_count': 1, 'comment_count': 0,
+                                              'follower_count': 0, 'followed_count': 1})
+        self.assertEqual(u1.profile_stats()['post_count'], 1)
+        self.assertEqual(profile_cache.hits, 1)
+
+        # 写入文章 评论和关注关系后缓存失效
+        post = Post(body='post', author=u1)
+        db.session.add(post)
+        db.session.add(Comment(body='comment', author=u1, post=post))
+        u2.follow(u1)
+        db.session.commit()
+        self.assertEqual(u1.profile_stats(), {'post_count': 2, 'comment_count': 1,
+                                              'follower_count': 1, 'followed_count': 1})
+        u2.unfollow(u1)
+        db.session.commit()
+        self.assertEqual(u1.profile_stats()['follower_count'], 0)
+        self.assertEqual(u2.profile_stats()['followed_count'], 0)
+
+        # 关注自己的用户计数中不包括自己
+        u1.add_self_follows()
+        self.assertEqual(u1.profile_stats()['follower_count'], 0)
+        self.assertEqual(u1.profile_stats()['followed_count'], 1)
+
     def test_to_json(self):
         u = User(email='123@abc.com', password='cat')
         db.session.add(u)
         db.session.commit()
-        json_user = u.to_json()
+        with self.app.test_request_context('/'):
+            json_user = u.to_json()
+            json_fields = u.to_json(fields=['username', 'post_count'])
         expected_keys = ['url', 'username', 'member_since', 'last_seen',
                          'posts', 'followed_posts', 'post_count']
         self.assertEqual(sorted(json_user.keys()), sorted(expected_keys))
-        #self.assertTrue('api/v1.0/users' in json_user['url'])
+        self.assertTrue('api/v1.0/users' in json_user['url'])
+        self.assertEqual(sorted(json_fields.keys()), ['post_count', 'username'])